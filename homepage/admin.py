@@ -1,6 +1,49 @@
-from django.contrib import admin
-from .models import Product
+from django.contrib import admin, messages
+
+from .ledger import adjust
+from .models import Product, StockMovement
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'price', 'stock', 'available', 'category']
+    readonly_fields = ['reserved']
+
+    def save_model(self, request, obj, form, change):
+        """
+        A stock edit is recorded in the ledger as the difference from the
+        value the form was opened with, so sales made in the meantime are
+        kept instead of being overwritten.
+        """
+        if not change:
+            super().save_model(request, obj, form, change)
+            if obj.stock:
+                StockMovement.objects.create(
+                    product=obj, kind=StockMovement.RESTOCK, quantity=obj.stock, settled=True,
+                    note=f"Opening stock, by {request.user}",
+                )
+            return
+        delta = obj.stock - form.initial['stock'] if 'stock' in form.changed_data else 0
+        if not adjust(obj.pk, delta, note=f"Admin edit by {request.user}"):
+            self.message_user(request, f"Not enough unheld stock to remove {-delta} units.", messages.ERROR)
+        fields = [name for name in form.changed_data if name != 'stock']
+        if fields:
+            obj.save(update_fields=fields)
+        obj.refresh_from_db(fields=['stock', 'reserved', 'available'])
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    """The ledger is append-only: browse it, never edit it."""
+    list_display = ['created_at', 'product', 'kind', 'quantity', 'settled', 'order', 'note']
+    list_filter = ['kind', 'settled']
+    list_select_related = ['product']
+    raw_id_fields = ['product', 'order']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
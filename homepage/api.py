@@ -0,0 +1,94 @@
+# homepage/api.py
+"""
+Read-only JSON catalog API (v1), for the mobile app.
+
+Rows come straight from .values() projections; no model instances are
+built. Every response carries an ETag made from the catalog version,
+which is bumped on any product change or checkout, and the holds
+version, which is bumped on every stock hold or release (see catalog.py).
+A matching If-None-Match is therefore answered with 304 from two cache
+reads, before any query runs. Bodies are gzipped when the client accepts
+it; the gzipped response's ETag becomes weak, as HTTP requires.
+
+`stock` is the free stock, net of the units held in shoppers' carts (see
+reservations.py), and `available` says whether any of it can be bought,
+the same as the catalog pages show.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Greatest
+from django.http import JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_safe
+
+from .catalog import catalog_version, holds_version
+from .models import Product
+from .replicas import replica_reads
+from .views import _catalog_params, _product_page
+
+API_VERSION = 'v1'
+PRODUCT_API_FIELDS = ('id', 'name', 'price', 'category', 'image')
+IN_STOCK = Q(available=True, stock__gt=F('reserved'))
+# Annotation names may not shadow model fields; _row() renames them.
+PRODUCT_API_STOCK = {
+    'free_stock': Greatest(F('stock') - F('reserved'), Value(0)),
+    'in_stock': ExpressionWrapper(IN_STOCK, output_field=BooleanField()),
+}
+
+
+def _catalog_etag(request, *args, **kwargs):
+    return f'{API_VERSION}-{catalog_version()}-{holds_version()}'
+
+
+def _json(data, status=200):
+    response = JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')},
+    )
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+def _row(row):
+    row['stock'] = row.pop('free_stock')
+    row['available'] = row.pop('in_stock')
+    return row
+
+
+def catalog_endpoint(view):
+    """GET/HEAD only, conditional on the catalog ETag, gzipped, read from a replica."""
+    return gzip_page(require_safe(condition(etag_func=_catalog_etag)(replica_reads(view))))
+
+
+@catalog_endpoint
+def products(request):
+    """
+    One page of the catalog: ?q= searches (best match first), otherwise
+    ?category= and ?sort=category|price browse; follow `next`/`previous`
+    with ?cursor=.
+    """
+    query, category, sort = _catalog_params(request)
+    page = _product_page(request, query, category, sort, fields=PRODUCT_API_FIELDS, expressions=PRODUCT_API_STOCK)
+    return _json({
+        'query': query,
+        'results': [_row(row) for row in page.items],
+        'next': page.next_cursor,
+        'previous': page.prev_cursor,
+    })
+
+
+@catalog_endpoint
+def product_detail(request, product_id):
+    row = Product.objects.filter(pk=product_id).values(*PRODUCT_API_FIELDS, **PRODUCT_API_STOCK).first()
+    if row is None:
+        return _json({'detail': 'Not found.'}, status=404)
+    return _json(_row(row))
+
+
+@catalog_endpoint
+def categories(request):
+    """Product counts per category, all and currently available."""
+    rows = (
+        Product.objects.order_by('category').values('category')
+        .annotate(count=Count('id'), available=Count('id', filter=IN_STOCK))
+    )
+    return _json({'results': list(rows)})
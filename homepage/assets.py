@@ -0,0 +1,189 @@
+# homepage/assets.py
+"""
+Static asset pipeline for production (DEBUG off).
+
+The page CSS and JS live in homepage/static/, not inline in the
+templates, so the browser can cache them across pages and visits.
+collectstatic with CompressedManifestStaticFilesStorage:
+
+- minifies .css and .js as they are copied into STATIC_ROOT;
+- writes content-hashed copies (home.3f2a91c0b4de.css) and the
+  staticfiles.json manifest that {% static %} reads;
+- precompresses every hashed text file to .gz, and also to .br when
+  the brotli package is installed.
+
+StaticFilesMiddleware then serves STATIC_ROOT from the app process, in
+the style of WhiteNoise. It picks the best precompressed variant the
+client accepts. Hashed names get a one-year immutable Cache-Control, so
+repeat visits do not ask again; anything else is revalidated with
+Last-Modified. It is enabled by SERVE_STATIC, which defaults to
+production only (runserver serves the sources while DEBUG is on).
+"""
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional: .gz only
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+# (Accept-Encoding token, file suffix), best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MUTABLE_MAX_AGE = 60
+
+
+# -----------------------
+# Minification
+# -----------------------
+def minify_css(text):
+    """Drop comments and the whitespace CSS does not need."""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = text.replace(';}', '}')
+    return text.strip()
+
+
+def minify_js(text):
+    """
+    Conservative: trim indentation, blank lines and whole-line // comments.
+    Nothing inside a line is touched, so strings and regexes are safe.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _minifier(name):
+    root, ext = os.path.splitext(name)
+    if root.endswith('.min'):
+        return None
+    return MINIFIERS.get(ext)
+
+
+# -----------------------
+# collectstatic storage
+# -----------------------
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def _save(self, name, content):
+        minify = _minifier(name)
+        if minify:
+            content.seek(0)
+            content = ContentFile(minify(content.read().decode('utf-8')).encode('utf-8'))
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli:
+            variants['.br'] = brotli.compress(data)
+        for suffix, compressed in variants.items():
+            if len(compressed) < len(data) * 0.95:  # not worth it otherwise
+                with open(path + suffix, 'wb') as fh:
+                    fh.write(compressed)
+
+
+# -----------------------
+# In-process static server
+# -----------------------
+def _immutable_names(root):
+    try:
+        with open(os.path.join(root, ManifestStaticFilesStorage.manifest_name)) as fh:
+            return set(json.load(fh).get('paths', {}).values())
+    except (OSError, ValueError):
+        return set()
+
+
+def _accepted(request):
+    header = request.headers.get('Accept-Encoding', '')
+    return {token.split(';')[0].strip() for token in header.split(',')}
+
+
+class StaticFilesMiddleware:
+    """Serve STATIC_ROOT before the rest of the stack sees the request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVE_STATIC', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.root = str(settings.STATIC_ROOT)
+        self.prefix = '/' + settings.STATIC_URL.strip('/') + '/'
+        self.immutable = _immutable_names(self.root)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except ValueError:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        encoding = None
+        accepted = _accepted(request)
+        for token, suffix in ENCODINGS:
+            if token in accepted and os.path.isfile(path + suffix):
+                encoding, served = token, path + suffix
+                break
+        else:
+            served = path
+
+        stat = os.stat(served)
+        response = FileResponse(open(served, 'rb'))
+        response['Content-Type'] = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response['Content-Length'] = stat.st_size
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if name in self.immutable:
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=MUTABLE_MAX_AGE)
+        conditional = get_conditional_response(request, last_modified=int(stat.st_mtime), response=response)
+        if conditional is not response:
+            response.close()  # 304: the file is not sent
+        return conditional
@@ -0,0 +1,19 @@
+# homepage/async_urls.py
+"""homepage.urls with the catalog and cart routes served by async_views."""
+from django.urls import path
+
+from . import async_views, urls
+
+ASYNC_VIEWS = {
+    'homepage': async_views.homepage,
+    'product_list': async_views.product_list,
+    'view_cart': async_views.view_cart,
+    'add_to_cart': async_views.add_to_cart,
+    'remove_from_cart': async_views.remove_from_cart,
+    'decrease_quantity': async_views.decrease_quantity,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,129 @@
+# homepage/async_views.py
+"""
+Async versions of the catalog and cart views, served by the ASGI profile
+(myproject1.settings_asgi). They use the async ORM, cache and session
+APIs, so a slow query never parks a worker thread.
+
+Templates and context processors are synchronous, so every view resolves
+what the page needs (user, cart count, rows) before calling render().
+Nothing lazy may reach the template. The catalog pages are the exception
+that proves it: they show no per-visitor state at all (see page_cache.py).
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import redirect, render
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.http import require_POST
+
+from .cart import acart_lines, acart_summary, change_line
+from .catalog import acatalog_version, afeatured_products, catalog_cache_timeout
+from .idempotency import idempotent
+from .models import Product
+from .page_cache import cacheable_page
+from .replicas import replica_reads
+from .pagination import InvalidCursor, KeysetPaginator, RankedPaginator, page_size_from
+from .search import get_search_backend
+from .views import _browse, _catalog_params, _page_query
+
+
+async def _prepare(request):
+    """Load the user and cart count without blocking, for the sync template layer."""
+    user = await request.auser()
+    request._cached_user = user  # what request.user resolves to in templates
+    if user.is_authenticated:
+        request.cart_count = (await acart_summary(user))['count']
+    else:
+        await request.guest_cart.aload()
+        request.cart_count = request.guest_cart.count()
+    return user
+
+
+# -----------------------
+# Catalog
+# -----------------------
+@cacheable_page
+@replica_reads
+async def homepage(request):
+    return render(request, 'homepage/home.html', {
+        'categories': ['All', 'Meat', 'Fish', 'Veggies', 'Grocery', 'Fruit'],
+        'featured_products': await afeatured_products(),
+        'catalog_version': await acatalog_version(),
+        'catalog_cache_timeout': catalog_cache_timeout(),
+    })
+
+
+async def _product_page(request, query, category, sort):
+    page_size = page_size_from(request)
+    cursor = request.GET.get('cursor')
+    products, ordering = _browse(Product.objects.all(), category, sort)
+
+    for attempt in (cursor, None):
+        try:
+            if query:
+                ids = await sync_to_async(get_search_backend().search)(query, category=category)
+                page = RankedPaginator(ids, page_size).get_page(attempt)
+                found = await Product.objects.ain_bulk(page.items)
+                page.items = [found[pk] for pk in page.items if pk in found]
+                return page
+            return await KeysetPaginator(products, ordering, page_size).aget_page(attempt)
+        except InvalidCursor:
+            continue
+
+
+@cacheable_page
+@replica_reads
+async def product_list(request):
+    query, category, sort = _catalog_params(request)
+    page = await _product_page(request, query, category, sort)
+
+    return render(request, 'homepage/products.html', {
+        'products': page.items,
+        'page': page,
+        'next_query': _page_query(request, page.next_cursor) if page.has_next else '',
+        'prev_query': _page_query(request, page.prev_cursor) if page.has_previous else '',
+        'query': query,
+        'selected_category': category,
+        'sort': sort,
+        'categories': ['All', 'Meat', 'Fish', 'Veggies', 'Grocery', 'Fruit'],
+    })
+
+
+# -----------------------
+# Cart
+# -----------------------
+@ensure_csrf_cookie  # for the JSON cart endpoints, see cart_api.py
+async def view_cart(request):
+    await _prepare(request)
+    items, total = await acart_lines(request)
+    return render(request, 'homepage/cart.html', {
+        'items': items, 'total': total, 'checkout_key': uuid.uuid4().hex,
+    })
+
+
+@csrf_exempt  # posted tokenless from the cached pages; see views.add_to_cart
+@require_POST
+@idempotent
+async def add_to_cart(request, product_id):
+    product = await Product.objects.filter(pk=product_id).afirst()
+    if product and product.available and await sync_to_async(change_line)(
+        request, product.id, lambda current: current + 1,
+    ) is None:
+        messages.error(request, f"Sorry, {product.name} is out of stock.")
+        return redirect('view_cart')  # the cached catalog pages show no messages
+    return redirect('product_list')
+
+
+@require_POST
+@idempotent
+async def remove_from_cart(request, product_id):
+    await sync_to_async(change_line)(request, product_id, lambda current: 0)
+    return redirect('view_cart')
+
+
+@require_POST
+@idempotent
+async def decrease_quantity(request, product_id):
+    await sync_to_async(change_line)(request, product_id, lambda current: current - 1)
+    return redirect('view_cart')
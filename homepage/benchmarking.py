@@ -0,0 +1,161 @@
+# homepage/benchmarking.py
+"""
+Load-testing helpers shared by the benchmark management commands.
+
+run_http_load() is a small multi-process HTTP/1.1 load driver built on
+the standard library: each process runs an asyncio loop with a share of
+the keep-alive connections and records per-request latency.
+
+compare() diffs two result files (as written by run_benchmarks) so
+regressions show up against a stored baseline.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one run."""
+    latencies = sorted(latencies)
+    ms = [value * 1000 for value in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p95_ms': round(percentile(ms, 95), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'max_ms': round(ms[-1], 2) if ms else 0.0,
+    }
+
+
+async def _read_response(reader):
+    """Read one response; returns (status, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    if lines[0].startswith('HTTP/1.0'):
+        return status, headers.get('connection') == 'keep-alive'
+    return status, headers.get('connection') != 'close'
+
+
+async def _connection(host, port, paths, deadline, offset, latencies, counters):
+    reader = writer = None
+    i = offset
+    while time.perf_counter() < deadline:
+        if writer is None:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                counters['errors'] += 1
+                await asyncio.sleep(0.05)
+                continue
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode())
+            status, keep_alive = await _read_response(reader)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            counters['errors'] += 1
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 500:
+            counters['errors'] += 1
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def _drive(base_url, paths, connections, duration, process_index):
+    url = urlsplit(base_url)
+    deadline = time.perf_counter() + duration
+    latencies = []
+    counters = {'errors': 0}
+    await asyncio.gather(*[
+        _connection(url.hostname, url.port or 80, paths, deadline, process_index + n, latencies, counters)
+        for n in range(connections)
+    ])
+    return latencies, counters['errors']
+
+
+def _drive_process(args):
+    return asyncio.run(_drive(*args))
+
+
+def run_http_load(base_url, paths, concurrency=32, duration=10.0, processes=2):
+    """
+    GET `paths` round-robin against `base_url` over `concurrency` keep-alive
+    connections spread across `processes` load processes for `duration`
+    seconds. Returns summarize() output.
+    """
+    processes = max(1, min(processes, concurrency))
+    shares = [concurrency // processes + (1 if n < concurrency % processes else 0) for n in range(processes)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(_drive_process, [
+            (base_url, list(paths), share, duration, n) for n, share in enumerate(shares)
+        ]))
+    latencies = [value for values, _ in results for value in values]
+    return summarize(latencies, sum(errors for _, errors in results), duration)
+
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def compare(baseline, current, threshold=10.0):
+    """
+    Per-scenario changes between two runs, as rows of
+    (section, scenario, metric, before, after, percent change, regressed).
+    A metric has regressed when it grew by more than `threshold` percent
+    (any growth at all, for query counts).
+    """
+    rows = []
+    for section in ('client', 'http'):
+        for scenario, after in current.get(section, {}).items():
+            before = baseline.get(section, {}).get(scenario)
+            if before is None:
+                continue
+            for metric in COMPARED_METRICS + (('rps',) if section == 'http' else ()):
+                if metric not in before or metric not in after:
+                    continue
+                old, new = before[metric], after[metric]
+                change = (new - old) / old * 100 if old else 0.0
+                if metric == 'rps':
+                    regressed = change < -threshold
+                elif metric == 'queries_per_request':
+                    regressed = new > old
+                else:
+                    regressed = change > threshold
+                rows.append((section, scenario, metric, old, new, round(change, 1), regressed))
+    return rows
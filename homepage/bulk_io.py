@@ -0,0 +1,102 @@
+# homepage/bulk_io.py
+"""
+Streaming catalog import/export helpers for the import_products and
+export_products commands. Rows are read and written one at a time so
+memory stays flat regardless of file size.
+"""
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from .models import Product
+
+PRODUCT_FIELDS = ['sku', 'name', 'price', 'stock', 'category', 'image', 'available']
+CATEGORIES = {value for value, label in Product.CATEGORY_CHOICES}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(fh, fmt):
+    """Yield dicts from a CSV (with header) or JSON-lines stream."""
+    if fmt == 'csv':
+        yield from csv.DictReader(fh)
+    else:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def product_from_row(row):
+    """Build an unsaved Product from an import row; `available` follows stock."""
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise RowError("missing sku")
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise RowError("missing name")
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+        stock = int(row.get('stock') or 0)
+    except (InvalidOperation, TypeError, ValueError):
+        raise RowError("bad price or stock")
+    if price < 0 or stock < 0:
+        raise RowError("negative price or stock")
+    category = str(row.get('category') or 'Grocery').strip().capitalize()
+    if category not in CATEGORIES:
+        raise RowError(f"unknown category {category!r}")
+    return Product(
+        sku=sku[:64], name=name[:100], price=price, stock=stock,
+        available=stock > 0, category=category, image=str(row.get('image') or ''),
+    )
+
+
+class RowWriter:
+    def __init__(self, fh, fmt):
+        self.fh = fh
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.csv = csv.writer(fh)
+            self.csv.writerow(PRODUCT_FIELDS)
+
+    def write(self, values):
+        if self.fmt == 'csv':
+            self.csv.writerow(values)
+        else:
+            row = dict(zip(PRODUCT_FIELDS, values))
+            row['price'] = str(row['price'])
+            self.fh.write(json.dumps(row, separators=(',', ':')) + '\n')
+
+
+class Progress:
+    """Throttled rows/s progress lines on stderr, plus a final summary."""
+
+    def __init__(self, label, stream=None, every=2.0):
+        self.label = label
+        self.stream = stream or sys.stderr
+        self.every = every
+        self.count = 0
+        self.started = self.last = time.perf_counter()
+
+    def add(self, n):
+        self.count += n
+        now = time.perf_counter()
+        if now - self.last >= self.every:
+            self.last = now
+            self.stream.write(f"{self.label}: {self.count} rows ({self.rate():.0f} rows/s)\n")
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.count / elapsed if elapsed else 0.0
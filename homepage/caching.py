@@ -0,0 +1,60 @@
+# homepage/caching.py
+"""
+Version counters for cache invalidation.
+
+Cached values are stored under keys that embed a version number. Bumping
+the version makes every older key unreachable at once, so nothing has to
+be deleted. A version that falls out of the cache is re-seeded from the
+clock, never reset, so stale keys can't be revived.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+        return cache.get(key)
+
+
+def versioned_key(name, *parts):
+    return ':'.join([name, str(get_version(name)), *map(str, parts)])
+
+
+async def aget_version(name):
+    key = _version_key(name)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+async def abump_version(name):
+    key = _version_key(name)
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        await cache.aset(key, time.time_ns(), timeout=None)
+        return await cache.aget(key)
+
+
+async def aversioned_key(name, *parts):
+    return ':'.join([name, str(await aget_version(name)), *map(str, parts)])
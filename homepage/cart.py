@@ -0,0 +1,194 @@
+# homepage/cart.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .caching import abump_version, aversioned_key, bump_version, versioned_key
+from .models import Cart, CartItem, Product
+from .reservations import owner_of, release, reserve
+
+
+LINE_MAX_QUANTITY = 99
+
+
+def _cart_name(user_id):
+    return f'cart:{user_id}'
+
+
+def bump_cart_version(user_id):
+    """Call after any change to a user's DB cart."""
+    bump_version(_cart_name(user_id))
+
+
+SUMMARY_AGGREGATES = {
+    'count': Sum('quantity'),
+    'total': Sum(F('quantity') * F('product__price')),
+}
+
+
+def _summary(totals):
+    return {'count': totals['count'] or 0, 'total': totals['total'] or Decimal('0')}
+
+
+def _summary_timeout():
+    return getattr(settings, 'CART_SUMMARY_TIMEOUT', 300)
+
+
+def cart_summary(user):
+    """
+    {'count': items, 'total': Decimal} for a logged-in user's cart, from one
+    aggregate query, cached until the cart version is bumped. Never creates
+    a cart.
+    """
+    key = versioned_key(_cart_name(user.pk), 'summary')
+    summary = cache.get(key)
+    if summary is None:
+        summary = _summary(CartItem.objects.filter(cart__user_id=user.pk).aggregate(**SUMMARY_AGGREGATES))
+        cache.set(key, summary, _summary_timeout())
+    return summary
+
+
+async def abump_cart_version(user_id):
+    await abump_version(_cart_name(user_id))
+
+
+async def acart_summary(user):
+    key = await aversioned_key(_cart_name(user.pk), 'summary')
+    summary = await cache.aget(key)
+    if summary is None:
+        summary = _summary(await CartItem.objects.filter(cart__user_id=user.pk).aaggregate(**SUMMARY_AGGREGATES))
+        await cache.aset(key, summary, _summary_timeout())
+    return summary
+
+
+# -----------------------
+# Cart lines (guest carts live in request.guest_cart, see cart_store.py)
+# -----------------------
+def cart_lines(request):
+    """
+    ([{'product', 'quantity', 'subtotal'}, ...], total) for the current
+    visitor: one joined query for logged-in users, one in_bulk for guests.
+    Products that no longer exist are skipped.
+    """
+    if request.user.is_authenticated:
+        rows = [
+            (item.product, item.quantity)
+            for item in CartItem.objects.filter(cart__user=request.user).select_related('product')
+        ]
+    else:
+        quantities = request.guest_cart.items()
+        products = Product.objects.in_bulk(quantities)
+        rows = [(products[pk], qty) for pk, qty in quantities.items() if pk in products]
+    return _lines(rows)
+
+
+async def acart_lines(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        rows = [
+            (item.product, item.quantity)
+            async for item in CartItem.objects.filter(cart__user=user).select_related('product')
+        ]
+    else:
+        await request.guest_cart.aload()
+        quantities = request.guest_cart.items()
+        products = await Product.objects.ain_bulk(quantities)
+        rows = [(products[pk], qty) for pk, qty in quantities.items() if pk in products]
+    return _lines(rows)
+
+
+def _lines(rows):
+    items = []
+    total = 0
+    for product, quantity in rows:
+        subtotal = product.price * quantity
+        items.append({'product': product, 'quantity': quantity, 'subtotal': subtotal})
+        total += subtotal
+    return items, total
+
+
+def merge_guest_cart(user, quantities):
+    """
+    Add a guest cart ({product_id: quantity}) into the user's DB cart with
+    one upsert on (cart, product). Stale product ids are dropped. Constant
+    query count regardless of cart size.
+    """
+    if not quantities:
+        return
+    with transaction.atomic():
+        product_ids = list(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+        if not product_ids:
+            return
+        cart, created = Cart.objects.get_or_create(user=user)
+        existing = {} if created else dict(
+            CartItem.objects.filter(cart=cart, product_id__in=product_ids).values_list('product_id', 'quantity')
+        )
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_id=pk, quantity=existing.get(pk, 0) + quantities[pk])
+                for pk in product_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        transaction.on_commit(lambda: bump_cart_version(user.pk))
+
+
+# -----------------------
+# Cart changes (shared by the cart views and the JSON cart API)
+# -----------------------
+def change_line(request, product_id, new_quantity):
+    """
+    Set one line of the visitor's cart to new_quantity(current), holding or
+    releasing the difference in stock. Returns the new quantity, or None if
+    the extra units are not in stock; the cart is then left as it was.
+    """
+    user = request.user
+    with transaction.atomic():
+        if user.is_authenticated:
+            current = CartItem.objects.select_for_update().filter(
+                cart__user=user, product_id=product_id,
+            ).values_list('quantity', flat=True).first() or 0
+        else:
+            current = request.guest_cart.lines.get(product_id, 0)
+        quantity = max(0, min(new_quantity(current), LINE_MAX_QUANTITY))
+        delta = quantity - current
+        if delta > 0 and not reserve(product_id, owner_of(request), quantity=delta):
+            return None
+
+        if not user.is_authenticated:
+            request.guest_cart.set(product_id, quantity)
+        elif quantity == 0:
+            CartItem.objects.filter(cart__user=user, product_id=product_id).delete()
+        elif current:
+            CartItem.objects.filter(cart__user=user, product_id=product_id).update(quantity=quantity)
+        else:
+            cart, created = Cart.objects.get_or_create(user=user)
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity)],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+
+        if delta < 0:
+            release(product_id, owner_of(request, create=False), quantity=None if quantity == 0 else -delta)
+    if delta and user.is_authenticated:
+        bump_cart_version(user.pk)
+    return quantity
+
+
+def visitor_cart_summary(request):
+    """cart_summary() for users; for guests, one price lookup over the cookie cart."""
+    if request.user.is_authenticated:
+        return cart_summary(request.user)
+    quantities = request.guest_cart.items()
+    prices = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'price'))
+    return {
+        'count': sum(quantities.values()),
+        'total': sum((prices[pk] * qty for pk, qty in quantities.items() if pk in prices), Decimal('0')),
+    }
@@ -0,0 +1,96 @@
+# homepage/cart_api.py
+"""
+JSON cart endpoints, used by static/homepage/js/cart.js.
+
+The "Add to Cart", +, − and Remove buttons on the catalog and cart pages
+are small POST forms for the redirecting views in views.py. With
+JavaScript on, cart.js POSTs to these endpoints instead and patches the
+page from the reply. A click then costs one small response (the
+changed line and the cart summary) instead of a redirect and a full
+catalog or cart render.
+
+All endpoints are POST only and CSRF protected: cart.js sends the
+csrftoken cookie back as X-CSRFToken, plus an Idempotency-Key so a retry
+replays the first result (see idempotency.py). Errors are JSON too:
+404 unknown product, 409 out of stock or unavailable, 400 bad quantity.
+"""
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+
+from .cart import LINE_MAX_QUANTITY, change_line, visitor_cart_summary
+from .idempotency import idempotent
+from .models import Product
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')},
+    )
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def _error(status, code, message):
+    return _json({'error': code, 'message': message}, status=status)
+
+
+def _change(request, product_id, new_quantity, adds=False):
+    product = Product.objects.filter(pk=product_id).values('name', 'price', 'available').first()
+    if product is None:
+        return _error(404, 'not_found', "No such product.")
+    if adds and not product['available']:
+        return _error(409, 'unavailable', f"{product['name']} is not available.")
+    quantity = change_line(request, product_id, new_quantity)
+    if quantity is None:
+        return _error(409, 'out_of_stock', f"Sorry, {product['name']} is out of stock.")
+    summary = visitor_cart_summary(request)
+    return _json({
+        'product_id': product_id,
+        'quantity': quantity,
+        'subtotal': _money(product['price'] * quantity),
+        'cart': {'count': summary['count'], 'total': _money(summary['total'])},
+    })
+
+
+@require_POST
+@idempotent
+def add(request, product_id):
+    return _change(request, product_id, lambda current: current + 1, adds=True)
+
+
+@require_POST
+@idempotent
+def decrease(request, product_id):
+    return _change(request, product_id, lambda current: current - 1)
+
+
+@require_POST
+@idempotent
+def remove(request, product_id):
+    return _change(request, product_id, lambda current: 0)
+
+
+@require_POST
+@idempotent
+def set_quantity(request, product_id):
+    """Body: {"quantity": n} as JSON, or a quantity form field. 0 removes the line."""
+    if request.content_type == 'application/json':
+        try:
+            quantity = json.loads(request.body or b'{}').get('quantity')
+        except (ValueError, AttributeError):
+            quantity = None
+    else:
+        quantity = request.POST.get('quantity')
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        quantity = -1
+    if not 0 <= quantity <= LINE_MAX_QUANTITY:
+        return _error(400, 'bad_quantity', f"Quantity must be between 0 and {LINE_MAX_QUANTITY}.")
+    return _change(request, product_id, lambda current: quantity)
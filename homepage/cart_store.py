@@ -0,0 +1,256 @@
+# homepage/cart_store.py
+"""
+Guest cart storage, kept out of the session.
+
+Storing the cart in the session rewrote the django_session row on every
+click. It also made every page load the session just to show the cart
+badge. GuestCartMiddleware now gives each request a `request.guest_cart`
+store instead. The store is read lazily, mutated in memory, and written
+at most once per response, only when something changed.
+
+Two backends (settings.CART_STORE):
+
+- SignedCookieCartStore, the default: the whole cart lives in one signed
+  cookie. It needs no server state and no reads.
+- CacheCartStore: the cookie only carries the cart key, and the lines
+  live in the cache. Use it for large carts.
+
+Either way, a guest shopping session costs no database writes for cart
+state. Stock holds are still written per click; see reservations.py.
+
+A cart is encoded as "<key>.<id>-<qty>.<id>-<qty>...". The key is random
+and stable for the life of the cart. It is the guest's identity for stock
+holds (StockReservation.session_key) and is handed to the user's holds
+at login.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+KEY_LENGTH = 20
+SALT = 'homepage.cart_store'
+
+
+def encode_lines(lines):
+    return '.'.join(f'{pid}-{qty}' for pid, qty in lines.items())
+
+
+def decode_lines(text):
+    """Parse encoded lines; malformed or non-positive entries are dropped."""
+    lines = {}
+    for part in text.split('.') if text else ():
+        pid, _, qty = part.partition('-')
+        if pid.isdigit() and qty.isdigit() and int(qty) > 0:
+            lines[int(pid)] = int(qty)
+    return lines
+
+
+class GuestCartStore:
+    """A guest's cart as {product_id: quantity}."""
+
+    def __init__(self, request):
+        self.request = request
+        self.key = None
+        self._lines = None
+        self.modified = False
+        self.key_created = False
+
+    def _cookie(self):
+        raw = self.request.COOKIES.get(cookie_name())
+        if not raw:
+            return None
+        try:
+            return signing.Signer(salt=SALT).unsign(raw)
+        except signing.BadSignature:
+            return None
+
+    def load(self):
+        raise NotImplementedError
+
+    async def aload(self):
+        if self._lines is None:
+            self.load()
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self.load()
+        return self._lines
+
+    def items(self):
+        return dict(self.lines)
+
+    def count(self):
+        return sum(self.lines.values())
+
+    def get_key(self, create=True):
+        """The cart key; a new cart gets one on first use unless `create` is False."""
+        if self._lines is None:
+            self.load()  # a stored cart brings its key along
+        if self.key is None and create:
+            self.key = get_random_string(KEY_LENGTH, 'abcdefghijklmnopqrstuvwxyz0123456789')
+            self.key_created = True
+        return self.key
+
+    def add(self, product_id, quantity=1):
+        self.get_key()
+        self.lines[product_id] = self.lines.get(product_id, 0) + quantity
+        self.modified = True
+
+    def decrease(self, product_id):
+        quantity = self.lines.get(product_id)
+        if quantity is None:
+            return False
+        if quantity > 1:
+            self.lines[product_id] = quantity - 1
+        else:
+            del self.lines[product_id]
+        self.modified = True
+        return True
+
+    def set(self, product_id, quantity):
+        """Set a line to `quantity`; 0 removes it."""
+        if quantity > 0:
+            self.get_key()
+            self.lines[product_id] = quantity
+        else:
+            self.lines.pop(product_id, None)
+        self.modified = True
+
+    def remove(self, product_id):
+        if self.lines.pop(product_id, None) is None:
+            return False
+        self.modified = True
+        return True
+
+    def clear(self):
+        """Forget the cart and its key, e.g. once it was merged at login."""
+        self._lines = {}
+        self.key = None
+        self.modified = True
+
+    def save(self, response):
+        raise NotImplementedError
+
+    async def asave(self, response):
+        self.save(response)
+
+    def flush(self, response):
+        """Save now, before the middleware would; its save is then a no-op."""
+        self.save(response)
+        self.modified = self.key_created = False
+
+    async def aflush(self, response):
+        await self.asave(response)
+        self.modified = self.key_created = False
+
+    def _set_cookie(self, response, value):
+        response.set_cookie(
+            cookie_name(), signing.Signer(salt=SALT).sign(value),
+            max_age=cookie_age(),
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite='Lax',
+        )
+
+
+class SignedCookieCartStore(GuestCartStore):
+    def load(self):
+        value = self._cookie()
+        if value:
+            self.key, _, encoded = value.partition('.')
+            self._lines = decode_lines(encoded)
+        else:
+            self._lines = {}
+
+    def save(self, response):
+        if not (self.modified or self.key_created):
+            return
+        if self.key is None:
+            response.delete_cookie(cookie_name(), samesite='Lax')
+        else:
+            self._set_cookie(response, f'{self.key}.{encode_lines(self._lines)}')
+
+
+class CacheCartStore(GuestCartStore):
+    def _cache_key(self):
+        return f'guest-cart:{self.key}'
+
+    def load(self):
+        self.key = self._cookie()
+        self._lines = decode_lines(cache.get(self._cache_key())) if self.key else {}
+
+    async def aload(self):
+        if self._lines is not None:
+            return
+        self.key = self._cookie()
+        self._lines = decode_lines(await cache.aget(self._cache_key())) if self.key else {}
+
+    def _write(self, response):
+        if self.key is None:
+            response.delete_cookie(cookie_name(), samesite='Lax')
+            return None
+        if self.key_created:
+            self._set_cookie(response, self.key)
+        return self._cache_key(), encode_lines(self._lines)
+
+    def save(self, response):
+        old_key = self._cookie()
+        if self.modified and self.key is None and old_key:
+            cache.delete(f'guest-cart:{old_key}')
+        if self.modified or self.key_created:
+            entry = self._write(response)
+            if entry:
+                cache.set(*entry, cookie_age())
+
+    async def asave(self, response):
+        old_key = self._cookie()
+        if self.modified and self.key is None and old_key:
+            await cache.adelete(f'guest-cart:{old_key}')
+        if self.modified or self.key_created:
+            entry = self._write(response)
+            if entry:
+                await cache.aset(*entry, cookie_age())
+
+
+def cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+
+def cookie_age():
+    return getattr(settings, 'CART_COOKIE_AGE', 14 * 24 * 3600)
+
+
+def get_store_class():
+    return import_string(getattr(settings, 'CART_STORE', 'homepage.cart_store.SignedCookieCartStore'))
+
+
+class GuestCartMiddleware:
+    """Attach request.guest_cart and persist it once, after the view."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.store_class = get_store_class()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request.guest_cart = store = self.store_class(request)
+        response = self.get_response(request)
+        store.save(response)
+        return response
+
+    async def __acall__(self, request):
+        request.guest_cart = store = self.store_class(request)
+        response = await self.get_response(request)
+        await store.asave(response)
+        return response
@@ -0,0 +1,81 @@
+# homepage/catalog.py
+"""
+Cached catalog reads.
+
+Everything here is keyed by the catalog version, which is bumped whenever
+a Product is saved or deleted and after every checkout (stock changes).
+The time of the last bump is kept too: for a short while after a change,
+replicas may not have it yet (see replicas.py).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .caching import aget_version, aversioned_key, bump_version, get_version, versioned_key
+from .models import Product
+
+CATALOG = 'catalog'
+HOLDS = 'holds'
+CHANGED_AT_KEY = 'catalog:changed_at'
+FEATURED_LIMIT = 8
+
+
+def catalog_version():
+    return get_version(CATALOG)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG)
+    cache.set(CHANGED_AT_KEY, time.time(), timeout=None)
+
+
+def holds_version():
+    """Bumped on every stock hold or release, which changes the free stock but not the catalog."""
+    return get_version(HOLDS)
+
+
+def bump_holds_version():
+    bump_version(HOLDS)
+
+
+def catalog_changed_at():
+    """Epoch seconds of the last catalog change this cache saw (0 if unknown)."""
+    return cache.get(CHANGED_AT_KEY, 0)
+
+
+async def acatalog_changed_at():
+    return await cache.aget(CHANGED_AT_KEY, 0)
+
+
+def catalog_cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 900)
+
+
+def _featured():
+    # stock > 0 is implied by stock > reserved, but gives the index a range.
+    return Product.objects.filter(available=True, stock__gt=0).filter(stock__gt=F('reserved'))[:FEATURED_LIMIT]
+
+
+def featured_products():
+    """Available products with unreserved stock, for the homepage (limit 8)."""
+    key = versioned_key(CATALOG, 'featured')
+    products = cache.get(key)
+    if products is None:
+        products = list(_featured())
+        cache.set(key, products, catalog_cache_timeout())
+    return products
+
+
+async def acatalog_version():
+    return await aget_version(CATALOG)
+
+
+async def afeatured_products():
+    key = await aversioned_key(CATALOG, 'featured')
+    products = await cache.aget(key)
+    if products is None:
+        products = [p async for p in _featured()]
+        await cache.aset(key, products, catalog_cache_timeout())
+    return products
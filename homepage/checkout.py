@@ -0,0 +1,98 @@
+# homepage/checkout.py
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+
+from .cart import bump_cart_version
+from .catalog import bump_catalog_version
+from .jobs import enqueue_many
+from .models import CartItem, Order, OrderItem, Product, StockMovement
+from .reservations import release_all
+
+
+class CheckoutError(Exception):
+    """Base class for checkout failures. The transaction is rolled back."""
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__("Your cart is empty.")
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, product_name):
+        self.product_name = product_name
+        super().__init__(f"Not enough stock for {product_name}")
+
+
+def place_order(user):
+    """
+    Turn the user's cart into an Order in a single transaction.
+
+    - Stock is taken with one conditional UPDATE per line
+      (stock >= other carts' holds + qty), which also flips `available`
+      when it hits zero, so concurrent checkouts can never oversell.
+    - All OrderItems, and the matching sale rows of the stock ledger
+      (see ledger.py), are inserted with one bulk_create each.
+    - The order total is computed by the database.
+    - The receipt email, the low-stock check and the sales rollup are
+      queued as background jobs in the same transaction (see tasks.py);
+      none of that work happens in the request.
+
+    Raises a CheckoutError subclass if nothing could be ordered; in that
+    case no order is created and no stock is taken.
+    """
+    with transaction.atomic():
+        # Lock rows in a stable order so concurrent checkouts of the same
+        # products queue up instead of deadlocking.
+        lines = list(
+            CartItem.objects
+            .filter(cart__user=user)
+            .order_by('product_id')
+            .values_list('product_id', 'quantity', 'product__name', 'product__price')
+        )
+        if not lines:
+            raise EmptyCartError()
+
+        # The user's own holds become the sale; everyone else's stay held.
+        release_all({'user': user})
+        for product_id, quantity, name, price in lines:
+            taken = Product.objects.filter(pk=product_id, stock__gte=F('reserved') + quantity).update(
+                stock=F('stock') - quantity,
+                available=Case(
+                    When(stock=quantity, then=Value(False)),
+                    default=F('available'),
+                ),
+            )
+            if not taken:
+                raise InsufficientStockError(name)
+
+        order = Order.objects.create(user=user)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, product_name=name, quantity=quantity, price=price)
+            for product_id, quantity, name, price in lines
+        ])
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=product_id, kind=StockMovement.SALE, quantity=-quantity, settled=True, order=order)
+            for product_id, quantity, name, price in lines
+        ])
+
+        line_totals = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        Order.objects.filter(pk=order.pk).update(total_price=Subquery(line_totals))
+
+        CartItem.objects.filter(cart__user=user).delete()
+        enqueue_many([
+            ('send_order_receipt', {'order_id': order.pk}),
+            ('check_low_stock', {'product_ids': [line[0] for line in lines]}),
+            ('roll_up_sales', {'order_ids': [order.pk]}),
+        ])
+        transaction.on_commit(lambda: bump_cart_version(user.pk))
+        transaction.on_commit(bump_catalog_version)
+
+    order.refresh_from_db(fields=['total_price'])
+    return order
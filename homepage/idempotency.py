@@ -0,0 +1,186 @@
+# homepage/idempotency.py
+"""
+Idempotent POSTs: a retried mutation replays its first result.
+
+Checkout and every cart change are POST only. A client that may retry
+sends an Idempotency-Key header, or an idempotency_key form field: the
+cart page renders a fresh one into the checkout form, and cart.js sends
+one per click. The first request with a key claims an IdempotencyKey row
+before the view runs. The view's response (status, body, Location,
+cookies) is stored on that row for IDEMPOTENCY_KEY_TTL. A guest's cart
+cookie is written before the response is stored rather than after, by
+GuestCartMiddleware, so a replay hands the cart (and with it the stock
+holds) back to a client that never saw the first response. A repeat of the
+key within the TTL gets the stored response back without running the
+view again. A double-clicked checkout therefore places one order, and a
+retry storm costs one insert attempt per retry instead of a full set of
+writes.
+
+- A repeat that arrives while the first request is still running gets
+  409 with Retry-After. The first request holds the key for
+  IDEMPOTENCY_LEASE seconds; a repeat after that takes the key over and
+  runs the view, so a worker that died mid-request does not block the
+  key until it expires. The late first request then stores nothing.
+- A key reused for another endpoint or by another user gets 422.
+- Server errors (5xx) and exceptions release the key, so a retry runs
+  the view again.
+- Requests without a key are not deduplicated.
+
+Expired rows are swept by the purge_idempotency_keys command.
+"""
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 3600))
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE', 30))
+
+
+def request_key(request):
+    return request.headers.get(HEADER) or request.POST.get(FIELD) or None
+
+
+def _user_id(user):
+    return user.pk if user.is_authenticated else None
+
+
+def _claim(key, path, user_id):
+    """
+    Claim `key` for this request. Returns (claimed at, None) when the caller
+    should run the view, or (None, response) for the response to send
+    instead (replay, in progress, misuse).
+    """
+    now = timezone.now()
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=key, path=path, user_id=user_id, started_at=now, expires_at=now + key_ttl(),
+                )
+            return now, None
+        except IntegrityError:
+            row = IdempotencyKey.objects.filter(key=key).first()
+            if row is None:
+                continue  # released in between
+            if row.expires_at <= now:
+                IdempotencyKey.objects.filter(pk=row.pk, expires_at__lte=now).delete()
+                continue
+            if row.path != path or row.user_id != user_id:
+                return None, HttpResponse("Idempotency key reused for a different request.", status=422)
+            if row.status_code is not None:
+                return None, _replay(row)
+            if row.started_at <= now - lease():
+                stale = IdempotencyKey.objects.filter(pk=row.pk, status_code=None, started_at=row.started_at)
+                if stale.update(started_at=now):
+                    return now, None
+                continue  # finished or taken over in between
+            response = HttpResponse("This request is already being processed.", status=409)
+            response['Retry-After'] = '1'
+            return None, response
+    return None, HttpResponse("This request is already being processed.", status=409)
+
+
+def _replay(row):
+    response = HttpResponse(bytes(row.body), status=row.status_code, content_type=row.content_type or None)
+    if row.location:
+        response['Location'] = row.location
+    for line in row.cookies.splitlines():
+        response.cookies.load(line)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _store(key, claimed, response):
+    if response.status_code >= 500 or response.streaming:
+        _release(key, claimed)
+        return
+    IdempotencyKey.objects.filter(key=key, started_at=claimed).update(
+        status_code=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        location=response.get('Location', ''),
+        cookies='\n'.join(morsel.OutputString() for morsel in response.cookies.values()),
+        body=response.content,
+    )
+
+
+def _save_guest_cart(request, response):
+    store = getattr(request, 'guest_cart', None)
+    if store is not None:
+        store.flush(response)
+
+
+async def _asave_guest_cart(request, response):
+    store = getattr(request, 'guest_cart', None)
+    if store is not None:
+        await store.aflush(response)
+
+
+def _release(key, claimed):
+    IdempotencyKey.objects.filter(key=key, started_at=claimed, status_code=None).delete()
+
+
+def idempotent(view):
+    """Make a POST view replay its stored result for a repeated Idempotency-Key."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key = request_key(request)
+            if key is None:
+                return await view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return HttpResponseBadRequest("Idempotency key too long.")
+            user = await request.auser()
+            claimed, early = await sync_to_async(_claim)(key, request.path, _user_id(user))
+            if early is not None:
+                return early
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await sync_to_async(_release)(key, claimed)
+                raise
+            await _asave_guest_cart(request, response)
+            await sync_to_async(_store)(key, claimed, response)
+            return response
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return HttpResponseBadRequest("Idempotency key too long.")
+        claimed, early = _claim(key, request.path, _user_id(request.user))
+        if early is not None:
+            return early
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            _release(key, claimed)
+            raise
+        _save_guest_cart(request, response)
+        _store(key, claimed, response)
+        return response
+    return wrapper
+
+
+def purge_expired(now=None):
+    """Delete expired keys. Returns how many."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
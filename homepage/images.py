@@ -0,0 +1,178 @@
+# homepage/images.py
+"""
+Product images, stored locally with pre-generated thumbnails.
+
+Product.image is the source: an http(s) URL, a file:// URL or a local
+path. ingest_images() copies each pending source into the media store,
+unchanged (products/ab/<hash>.png), and renders every size in
+THUMBNAIL_WIDTHS as WebP and JPEG. The thumbnails are cropped to
+THUMBNAIL_RATIO, so the browser knows the layout before any bytes
+arrive. The work runs in a process pool, because decoding and
+resizing are CPU-bound.
+
+Thumbnail names are derived from the source bytes' hash
+(products/ab/<hash>-480.webp). An image never changes under its URL, so
+the thumbnails are served with a far-future, immutable Cache-Control.
+Identical images are stored once, and re-running ingestion is cheap.
+
+Product.image_source records which source image_hash was made from. A
+product whose image changed is pending again until the next pass.
+
+Pillow is optional. Without it, ingestion refuses to run, and the
+templates keep linking the source URL.
+"""
+import hashlib
+import os
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db.models import F
+
+from .catalog import bump_catalog_version
+from .models import Product
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+THUMBNAIL_WIDTHS = (240, 480, 720)
+THUMBNAIL_RATIO = (4, 3)
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+FETCH_TIMEOUT = 10
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+
+class ImageError(Exception):
+    pass
+
+
+def thumbnail_height(width):
+    return width * THUMBNAIL_RATIO[1] // THUMBNAIL_RATIO[0]
+
+
+def thumbnail_name(digest, width, ext):
+    return f'products/{digest[:2]}/{digest}-{width}.{ext}'
+
+
+def original_name(digest, ext):
+    return f'products/{digest[:2]}/{digest}.{ext}'
+
+
+def thumbnail_url(digest, width, ext):
+    return f'{settings.MEDIA_URL}{thumbnail_name(digest, width, ext)}'
+
+
+def pending_products():
+    """Products with a source image that has not been ingested yet."""
+    return Product.objects.exclude(image='').exclude(image_source=F('image'))
+
+
+# -----------------------
+# Worker side (runs in the pool; plain paths only)
+# -----------------------
+def read_source(source):
+    parsed = urlparse(source)
+    if parsed.scheme in ('http', 'https'):
+        with urllib.request.urlopen(source, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_SOURCE_BYTES + 1)
+    else:
+        path = parsed.path if parsed.scheme == 'file' else source
+        with open(path, 'rb') as fh:
+            data = fh.read(MAX_SOURCE_BYTES + 1)
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ImageError(f"larger than {MAX_SOURCE_BYTES} bytes")
+    return data
+
+
+def _write(path, data):
+    # Write-then-rename, so a reader never sees half a file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def store_original(data, digest, media_root):
+    """Keep the source bytes next to their thumbnails, named by the format Pillow detects."""
+    with Image.open(BytesIO(data)) as image:
+        ext = {'JPEG': 'jpg'}.get(image.format, (image.format or 'bin').lower())
+    path = Path(media_root) / original_name(digest, ext)
+    if not path.exists():
+        _write(path, data)
+    return path
+
+
+def render_thumbnails(data, digest, media_root):
+    """Write every size and format for one source image, skipping existing files."""
+    root = Path(media_root)
+    image = None
+    for width in THUMBNAIL_WIDTHS:
+        for ext, (pil_format, _) in FORMATS.items():
+            path = root / thumbnail_name(digest, width, ext)
+            if path.exists():
+                continue
+            if image is None:
+                image = Image.open(BytesIO(data))
+                image = ImageOps.exif_transpose(image).convert('RGB')
+            thumb = ImageOps.fit(image, (width, thumbnail_height(width)), Image.Resampling.LANCZOS)
+            out = BytesIO()
+            thumb.save(out, pil_format, quality=80, optimize=True)
+            _write(path, out.getvalue())
+
+
+def ingest_one(job):
+    """(product id, source, media root) -> (product id, source, digest or None, error or None)."""
+    product_id, source, media_root = job
+    try:
+        data = read_source(source)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        store_original(data, digest, media_root)
+        render_thumbnails(data, digest, media_root)
+    except Exception as exc:  # one bad image must not stop the pass
+        return product_id, source, None, f"{type(exc).__name__}: {exc}"
+    return product_id, source, digest, None
+
+
+# -----------------------
+# Driver
+# -----------------------
+def ingest_images(products=None, workers=None, on_error=None):
+    """
+    Ingest the images of `products` (default: pending_products()) and
+    record their hashes. Returns the number of products updated. Failed
+    sources are reported to on_error(product_id, source, message) and
+    stay pending.
+    """
+    if Image is None:
+        raise ImageError("Pillow is required to generate thumbnails (pip install Pillow).")
+    if products is None:
+        products = pending_products()
+    media_root = str(settings.MEDIA_ROOT)
+    jobs = [(pk, image, media_root) for pk, image in products.values_list('pk', 'image')]
+    if not jobs:
+        return 0
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(ingest_one, jobs, chunksize=8))
+    else:
+        results = [ingest_one(job) for job in jobs]
+
+    done = []
+    for product_id, source, digest, error in results:
+        if error:
+            if on_error:
+                on_error(product_id, source, error)
+            continue
+        done.append(Product(pk=product_id, image_hash=digest, image_source=source))
+    if done:
+        # bulk_update sends no signals, so the catalog version is bumped here.
+        Product.objects.bulk_update(done, ['image_hash', 'image_source'], batch_size=500)
+        bump_catalog_version()
+    return len(done)
@@ -0,0 +1,200 @@
+# homepage/jobs.py
+"""
+A small background job queue kept in the database.
+
+Work that does not have to happen inside the request (receipts,
+low-stock alerts, later reporting) is enqueued as a Job row and run by
+`manage.py run_workers`. No broker is needed. Enqueueing is one INSERT
+that can join the caller's transaction, so a rolled-back checkout leaves
+no jobs behind.
+
+Tasks are plain functions registered with @task (see tasks.py). They
+are called with the job's payload as keyword arguments, and should be
+idempotent: a job can run twice if its worker dies after the work but
+before the row is marked done.
+
+Claiming: on databases with SELECT ... FOR UPDATE SKIP LOCKED
+(Postgres), a worker locks a batch of due jobs and skips rows that other
+workers hold, so workers never wait on each other. SQLite has no row
+locks. There, a worker picks candidates and claims them with a
+conditional UPDATE (status still 'queued') tagged with a one-off claim
+token. It then reads back only the rows carrying its token, so no job is
+claimed twice.
+
+A claimed job holds a lease until `locked_until`; a job whose worker
+died is requeued once the lease runs out. A failed run is retried
+after an exponential backoff with jitter, until max_attempts, and then
+left as 'failed' with its last error. Finished jobs are kept for
+JOB_KEEP_FINISHED seconds.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}  # name -> (function, max_attempts)
+
+
+def task(name=None, max_attempts=5):
+    """Register a function as a job type: @task() or @task('name', max_attempts=3)."""
+    def register(func):
+        TASKS[name or func.__name__] = (func, max_attempts)
+        return func
+    return register
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def lease_time():
+    return timedelta(seconds=_setting('JOB_LEASE', 300))
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts`: base * 2**(attempts-1), capped, +-25% jitter."""
+    base = _setting('JOB_RETRY_BASE', 10)
+    delay = min(base * 2 ** (attempts - 1), _setting('JOB_RETRY_MAX', 3600))
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+# -----------------------
+# Producers
+# -----------------------
+def _job(name, payload=None, run_at=None, delay=None):
+    if name not in TASKS:
+        raise KeyError(f"Unknown job type {name!r}")
+    now = timezone.now()
+    return Job(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or now + (delay or timedelta()),
+        max_attempts=TASKS[name][1],
+        created_at=now,
+    )
+
+
+def enqueue(name, payload=None, run_at=None, delay=None):
+    """Queue one job; `run_at` or `delay` (a timedelta) schedule it for later."""
+    job = _job(name, payload, run_at, delay)
+    job.save()
+    return job
+
+
+def enqueue_many(jobs):
+    """Queue several (name, payload) jobs with one INSERT."""
+    return Job.objects.bulk_create([_job(name, payload) for name, payload in jobs])
+
+
+# -----------------------
+# Workers
+# -----------------------
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'[:48]
+
+
+def _ready(now):
+    return Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+
+
+def claim(worker, batch=1):
+    """Claim up to `batch` due jobs for `worker`; returns them (status 'running')."""
+    now = timezone.now()
+    claimed = {'status': Job.RUNNING, 'locked_until': now + lease_time(), 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_ready(now).select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch])
+            if not ids:
+                return []
+            Job.objects.filter(pk__in=ids).update(locked_by=worker, **claimed)
+        return list(Job.objects.filter(pk__in=ids).order_by('run_at', 'id'))
+
+    ids = list(_ready(now).values_list('pk', flat=True)[:batch])
+    if not ids:
+        return []
+    token = f'{worker}:{uuid.uuid4().hex[:12]}'
+    Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(locked_by=token, **claimed)
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'id'))
+
+
+def run(job):
+    """Run one claimed job and record the outcome. Returns 'done', 'retry' or 'failed'."""
+    entry = TASKS.get(job.name)
+    started = time.perf_counter()
+    try:
+        if entry is None:
+            raise KeyError(f"Unknown job type {job.name!r}")
+        entry[0](**job.payload)
+    except Exception:
+        error = traceback.format_exc(limit=20)
+        outcome = 'retry' if job.attempts < job.max_attempts else 'failed'
+        logger.warning("Job %s #%s failed (attempt %s/%s)", job.name, job.pk, job.attempts, job.max_attempts)
+        if outcome == 'retry':
+            changes = {'status': Job.QUEUED, 'run_at': timezone.now() + backoff(job.attempts)}
+        else:
+            changes = {'status': Job.FAILED, 'finished_at': timezone.now()}
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            last_error=error, locked_by='', locked_until=None, **changes,
+        )
+    else:
+        outcome = 'done'
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            status=Job.DONE, finished_at=timezone.now(), locked_by='', locked_until=None,
+        )
+    if metrics.metrics_enabled():
+        metrics.registry.record_job(job.name, outcome, time.perf_counter() - started)
+        metrics.flush()
+    return outcome
+
+
+def requeue_stale(now=None):
+    """Put jobs whose worker lease ran out back in the queue. Returns how many."""
+    now = now or timezone.now()
+    return Job.objects.filter(status=Job.RUNNING, locked_until__lt=now).update(
+        status=Job.QUEUED, locked_by='', locked_until=None,
+    )
+
+
+def purge_finished(now=None):
+    """Delete done and failed jobs older than JOB_KEEP_FINISHED. Returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(seconds=_setting('JOB_KEEP_FINISHED', 7 * 24 * 3600))
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def work(worker, stop, batch=10, poll=1.0, drain=False):
+    """
+    Claim and run jobs until `stop` (a threading/multiprocessing Event) is
+    set. With `drain`, return as soon as no job is due. Returns the number
+    of jobs run.
+    """
+    ran = 0
+    last_sweep = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_sweep > poll * 30:
+            requeue_stale()
+            last_sweep = time.monotonic()
+        jobs = claim(worker, batch)
+        if not jobs:
+            if drain:
+                break
+            stop.wait(poll)
+            continue
+        for job in jobs:
+            run(job)
+            ran += 1
+    return ran
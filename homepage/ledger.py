@@ -0,0 +1,132 @@
+# homepage/ledger.py
+"""
+Append-only stock ledger.
+
+Every change to Product.stock is also a StockMovement row: checkout
+sales, restocks, hand edits made in the admin, and imports of existing
+SKUs. The rows are never
+updated, so they are the audit trail.
+
+How a movement reaches Product.stock depends on its direction:
+
+- Decreases (sales, negative adjustments) are applied at once with the
+  same guarded UPDATE checkout has always used (stock >= holds + qty).
+  This row is where concurrent buyers of one product serialize, and it
+  is what keeps them from overselling. Their rows are written settled.
+- Increases (restocks) are only inserted, in bulk, and Product.stock is
+  not touched. compact() later folds all unsettled movements past the
+  watermark into the stock snapshots, with one UPDATE per batch of
+  products. A large restock of a hot product therefore takes no lock on
+  its row, and shoppers' checkouts never wait behind it. Until the fold,
+  stock is understated, which can only turn a sale away, never oversell.
+
+compact() also keeps `available` in step: a restocked product that had
+sold out (checkout clears the flag at zero) is offered again.
+
+Each compaction records its window in StockCompaction. Two compactions
+started from the same watermark collide on a unique key, so a movement
+is never folded twice. Movements newer than STOCK_COMPACTION_SETTLE
+seconds are left for the next run, which gives inserts that committed
+out of id order time to land below the watermark.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, Case, ExpressionWrapper, F, Max, Q, Sum, Value, When
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Product, StockCompaction, StockMovement
+
+FOLD_BATCH = 500
+
+
+def settle_time():
+    return timedelta(seconds=getattr(settings, 'STOCK_COMPACTION_SETTLE', 5))
+
+
+def watermark():
+    """Id of the last movement folded into Product.stock."""
+    return StockCompaction.objects.aggregate(last=Max('last_id'))['last'] or 0
+
+
+def _in_stock(**lookup):
+    return ExpressionWrapper(Q(**lookup), output_field=BooleanField())
+
+
+def append(movements, batch_size=2000):
+    """
+    Insert stock increases (unsettled StockMovements) in bulk; compact()
+    applies them. Returns how many were written.
+    """
+    for movement in movements:
+        if movement.quantity <= 0:
+            raise ValueError("Only increases can wait for compaction; use adjust() to remove stock.")
+        movement.settled = False
+    StockMovement.objects.bulk_create(movements, batch_size=batch_size)
+    return len(movements)
+
+
+def adjust(product_id, quantity, kind=StockMovement.ADJUSTMENT, note=''):
+    """
+    Apply a stock change now and record it. A decrease only goes through
+    if it leaves enough for the units held in carts. Returns False if not.
+    """
+    if not quantity:
+        return True
+    with transaction.atomic():
+        rows = Product.objects.filter(pk=product_id)
+        if quantity < 0:
+            rows = rows.filter(stock__gte=F('reserved') - quantity)
+        # An increase always leaves stock; stock > -quantity would not even compile.
+        available = _in_stock(stock__gt=-quantity) if quantity < 0 else Value(True)
+        if not rows.update(stock=F('stock') + quantity, available=available):
+            return False
+        StockMovement.objects.create(product_id=product_id, kind=kind, quantity=quantity, settled=True, note=note)
+        transaction.on_commit(bump_catalog_version)
+    return True
+
+
+def _fold(deltas):
+    """Add {product_id: delta} to Product.stock, and set `available` from the result."""
+    items = list(deltas.items())
+    for start in range(0, len(items), FOLD_BATCH):
+        batch = dict(items[start:start + FOLD_BATCH])
+        Product.objects.filter(pk__in=batch).update(
+            stock=F('stock') + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in batch.items()],
+                default=Value(0),
+            ),
+        )
+        Product.objects.filter(pk__in=batch).update(available=_in_stock(stock__gt=0))
+
+
+def compact(now=None, settle=None):
+    """
+    Fold unsettled movements past the watermark into Product.stock.
+    Returns the number of movements folded (0 if another compaction won).
+    """
+    cutoff = (now or timezone.now()) - (settle_time() if settle is None else settle)
+    try:
+        with transaction.atomic():
+            after = watermark()
+            window = StockMovement.objects.filter(pk__gt=after)
+            last = window.filter(created_at__lte=cutoff).aggregate(last=Max('pk'))['last']
+            if last is None:
+                return 0
+            window = window.filter(pk__lte=last)
+            deltas = dict(
+                window.filter(settled=False)
+                .values('product_id')
+                .annotate(delta=Sum('quantity'))
+                .values_list('product_id', 'delta')
+            )
+            count = window.count()
+            StockCompaction.objects.create(after_id=after, last_id=last, movements=count, products=len(deltas))
+            _fold(deltas)
+            if deltas:
+                transaction.on_commit(bump_catalog_version)
+    except IntegrityError:
+        return 0
+    return count
@@ -0,0 +1,131 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from homepage.models import Product, StockReservation
+from homepage.reservations import release, reserve
+
+BENCH_SKU = 'BENCH-DB-WRITES'
+
+PROFILES = {
+    # name: (environment overrides, extra arguments) for the child process.
+    # WAL mode sticks to the database file, so the untuned run resets it.
+    'untuned': ({'SQLITE_TUNING': '0'}, ['--journal-mode', 'delete']),
+    'tuned': ({'SQLITE_TUNING': '1'}, []),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent write throughput: worker threads hold and release stock "
+        "on one product (the cart and checkout transactions) as fast as they can. "
+        "--compare runs the untuned and tuned SQLite profiles side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--compare', action='store_true', help="Run each profile in PROFILES in a subprocess.")
+        parser.add_argument('--json', action='store_true', help="Print only the JSON result.")
+        parser.add_argument('--journal-mode', help="Switch the SQLite database to this journal mode first.")
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(options)
+        if options['journal_mode']:
+            if connection.vendor != 'sqlite':
+                raise CommandError("--journal-mode only applies to SQLite.")
+            with connection.cursor() as cursor:
+                cursor.execute(f"PRAGMA journal_mode={options['journal_mode']}")
+        result = self.run(options['workers'], options['duration'])
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.stdout.write(self.format(result))
+
+    def run(self, workers, duration):
+        product, _ = Product.objects.update_or_create(
+            sku=BENCH_SKU, defaults={'name': 'DB write benchmark', 'price': 1, 'stock': 10 ** 9, 'available': True},
+        )
+        counts = {'transactions': 0, 'locked': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(workers)
+        deadline = []
+
+        def worker(n):
+            owner = {'session_key': f'bench-writes-{n}'}
+            done = locked = 0
+            barrier.wait()
+            try:
+                while time.perf_counter() < deadline[0]:
+                    try:
+                        # Read, then write, in one transaction, the shape of
+                        # checkout. Under BEGIN DEFERRED this can fail without waiting.
+                        with transaction.atomic():
+                            Product.objects.filter(pk=product.pk).values_list('stock', flat=True).get()
+                            reserve(product.pk, owner)
+                        release(product.pk, owner)
+                        done += 2
+                    except OperationalError:  # "database is locked"
+                        locked += 1
+            finally:
+                connection.close()
+                with lock:
+                    counts['transactions'] += done
+                    counts['locked'] += locked
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        deadline.append(time.perf_counter() + duration)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        StockReservation.objects.filter(product=product).delete()
+        Product.objects.filter(pk=product.pk).update(reserved=0)
+        db = settings.DATABASES['default']
+        journal_mode = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+        return {
+            'engine': db['ENGINE'].rsplit('.', 1)[-1],
+            'journal_mode': journal_mode,
+            'options': {key: value for key, value in db.get('OPTIONS', {}).items() if key != 'pool'},
+            'workers': workers,
+            'seconds': duration,
+            'transactions': counts['transactions'],
+            'tps': round(counts['transactions'] / duration, 1),
+            'locked_errors': counts['locked'],
+        }
+
+    def format(self, result):
+        return (
+            f"{result['workers']} workers ({result['journal_mode'] or result['engine']}): "
+            f"{result['tps']} write transactions/s, "
+            f"{result['locked_errors']} 'database is locked' errors"
+        )
+
+    def compare(self, options):
+        results = {}
+        for name, (overrides, extra) in PROFILES.items():
+            argv = [
+                sys.executable, 'manage.py', 'bench_db_writes', '--json',
+                '--workers', str(options['workers']), '--duration', str(options['duration']), *extra,
+            ]
+            proc = subprocess.run(
+                argv, cwd=settings.BASE_DIR, env=dict(os.environ, **overrides), capture_output=True, text=True,
+            )
+            if proc.returncode:
+                raise CommandError(f"{name} run failed:\n{proc.stderr}")
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+            self.stdout.write(f"{name:8} {self.format(results[name])}")
+        if options['json']:
+            self.stdout.write(json.dumps(results))
@@ -0,0 +1,111 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from homepage.benchmarking import run_http_load
+
+SERVERS = {
+    # name: (required module, settings module, argv builder)
+    'wsgi': ('gunicorn', 'myproject1.settings', lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', 'myproject1.wsgi:application',
+        '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+    ]),
+    'asgi': ('uvicorn', 'myproject1.settings_asgi', lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'myproject1.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning',
+    ]),
+}
+
+DEFAULT_PATHS = ['/', '/products/', '/products/?category=Fish', '/products/?q=fi', '/cart/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync WSGI stack (gunicorn) with the async ASGI stack (uvicorn) "
+        "under the same worker count and number of concurrent connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Server worker processes for both stacks.")
+        parser.add_argument('--concurrency', type=int, default=64, help="Concurrent keep-alive connections.")
+        parser.add_argument('--duration', type=float, default=15.0, help="Seconds of load per stack.")
+        parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of untimed load first.")
+        parser.add_argument('--load-processes', type=int, default=2, help="Processes driving the load.")
+        parser.add_argument('--port', type=int, default=8100, help="First port to bind servers to.")
+        parser.add_argument('--path', action='append', dest='paths', help="URL path to request (repeatable).")
+        parser.add_argument('--stack', choices=sorted(SERVERS), action='append', dest='stacks')
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        stacks = options['stacks'] or ['wsgi', 'asgi']
+        for name in stacks:
+            module = SERVERS[name][0]
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f"The {name} benchmark needs {module} (pip install {module}).")
+
+        paths = options['paths'] or DEFAULT_PATHS
+        results = {
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'paths': paths,
+            'stacks': {},
+        }
+        for offset, name in enumerate(stacks):
+            port = options['port'] + offset
+            self.stdout.write(f"Starting {name} on port {port} with {options['workers']} workers...")
+            with self.server(name, port, options['workers']):
+                base_url = f'http://127.0.0.1:{port}'
+                if options['warmup']:
+                    run_http_load(base_url, paths, options['concurrency'], options['warmup'], options['load_processes'])
+                stats = run_http_load(
+                    base_url, paths, options['concurrency'], options['duration'], options['load_processes'],
+                )
+            results['stacks'][name] = stats
+            self.stdout.write(
+                f"  {name}: {stats['rps']} req/s, p50 {stats['p50_ms']} ms, "
+                f"p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, errors {stats['errors']}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def server(self, name, port, workers):
+        module, settings_module, argv = SERVERS[name]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        process = subprocess.Popen(argv(port, workers), cwd=settings.BASE_DIR, env=env)
+        return _Server(process, port)
+
+
+class _Server:
+    def __init__(self, process, port):
+        self.process = process
+        self.port = port
+
+    def __enter__(self):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Server exited with code {self.process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError(f"Server did not start listening on port {self.port}")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homepage.ledger import compact, watermark
+
+
+class Command(BaseCommand):
+    help = "Fold pending stock movements (restocks) into Product.stock. Use --every to keep compacting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0, help="Repeat every N seconds instead of once.")
+
+    def handle(self, *args, **options):
+        while True:
+            folded = compact()
+            if folded or not options['every']:
+                self.stdout.write(f"Folded {folded} stock movements (watermark {watermark()})")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
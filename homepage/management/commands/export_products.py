@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from homepage.bulk_io import PRODUCT_FIELDS, Progress, RowWriter, detect_format
+from homepage.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream the catalog to a CSV or JSON-lines file (or stdout) in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for stdout.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        to_stdout = options['path'] == '-'
+        fh = sys.stdout if to_stdout else open(options['path'], 'w', newline='', encoding='utf-8')
+        progress = Progress('export', stream=self.stderr)
+        try:
+            writer = RowWriter(fh, fmt)
+            rows = Product.objects.order_by('pk').values_list(*PRODUCT_FIELDS)
+            for values in rows.iterator(chunk_size=options['chunk_size']):
+                writer.write(values)
+                progress.add(1)
+        finally:
+            if not to_stdout:
+                fh.close()
+
+        self.stderr.write(
+            f"Exported {progress.count} products in {progress.elapsed():.1f}s ({progress.rate():.0f} rows/s)"
+        )
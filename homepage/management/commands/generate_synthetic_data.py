@@ -0,0 +1,155 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from homepage.catalog import bump_catalog_version
+from homepage.models import Customer, Order, OrderItem, Product
+from homepage.search import get_search_backend
+
+SKU_PREFIX = 'SYN-'
+EMAIL_DOMAIN = '@synthetic.test'
+PASSWORD = 'synthetic-password'
+
+WORDS = {
+    'Meat': ['Beef', 'Lamb', 'Chicken', 'Turkey', 'Pork', 'Salami', 'Mince', 'Steak', 'Sausage'],
+    'Fish': ['Salmon', 'Tuna', 'Cod', 'Haddock', 'Prawns', 'Mackerel', 'Sardines', 'Trout'],
+    'Veggies': ['Carrot', 'Potato', 'Spinach', 'Broccoli', 'Onion', 'Pepper', 'Leek', 'Kale'],
+    'Grocery': ['Rice', 'Pasta', 'Flour', 'Sugar', 'Lentils', 'Oats', 'Coffee', 'Tea', 'Honey'],
+    'Fruit': ['Apple', 'Banana', 'Mango', 'Orange', 'Grapes', 'Pear', 'Kiwi', 'Cherry', 'Lemon'],
+}
+ADJECTIVES = ['Organic', 'Fresh', 'Premium', 'Local', 'Smoked', 'Frozen', 'Wild', 'Classic', 'Value']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a reproducible synthetic catalog, customer base and "
+        "order history for benchmarking. The same --seed always yields the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--customers', type=int, default=50_000)
+        parser.add_argument('--order-items', type=int, default=1_000_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--reset', action='store_true',
+            help="Delete previously generated rows (SYN- SKUs, @synthetic.test customers) first.",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        if options['reset']:
+            Customer.objects.filter(email__endswith=EMAIL_DOMAIN).delete()
+            Product.objects.filter(sku__startswith=SKU_PREFIX).delete()
+
+        product_prices = self.create_products(options['products'])
+        customer_ids = self.create_customers(options['customers'])
+        if product_prices and customer_ids:
+            self.create_orders(options['order_items'], product_prices, customer_ids)
+
+        indexed = get_search_backend().rebuild()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.perf_counter() - started:.1f}s; search index holds {indexed} products."
+        ))
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s)")
+
+    def create_products(self, count):
+        """Returns {product_id: (name, price)} for the generated products."""
+        started = time.perf_counter()
+        offset = Product.objects.filter(sku__startswith=SKU_PREFIX).count()
+        categories = list(WORDS)
+
+        def rows():
+            for n in range(offset, offset + count):
+                category = self.rng.choice(categories)
+                stock = 0 if self.rng.random() < 0.1 else self.rng.randint(1, 500)
+                yield Product(
+                    sku=f'{SKU_PREFIX}{n:07d}',
+                    name=f'{self.rng.choice(ADJECTIVES)} {self.rng.choice(WORDS[category])} {n}',
+                    price=Decimal(self.rng.randint(50, 5000)) / 100,
+                    stock=stock,
+                    available=stock > 0,
+                    category=category,
+                )
+
+        for batch in self.batches(rows()):
+            Product.objects.bulk_create(batch)
+        self.report('Products', count, started)
+        return {
+            pk: (name, price)
+            for pk, name, price in Product.objects.filter(sku__startswith=SKU_PREFIX).values_list('pk', 'name', 'price')
+        }
+
+    def create_customers(self, count):
+        started = time.perf_counter()
+        password = make_password(PASSWORD)  # hashing per row would dominate the run
+        offset = Customer.objects.filter(email__endswith=EMAIL_DOMAIN).count()
+
+        def rows():
+            for n in range(offset, offset + count):
+                yield Customer(email=f'customer{n}{EMAIL_DOMAIN}', username=f'customer{n}', password=password)
+
+        for batch in self.batches(rows()):
+            Customer.objects.bulk_create(batch)
+        self.report('Customers', count, started)
+        return list(Customer.objects.filter(email__endswith=EMAIL_DOMAIN).values_list('pk', flat=True))
+
+    def create_orders(self, item_count, product_prices, customer_ids):
+        """Orders of 1-5 lines spread over the past year, until `item_count` lines exist."""
+        started = time.perf_counter()
+        product_ids = list(product_prices)
+        now = timezone.now()
+        remaining = item_count
+        orders = 0
+        while remaining > 0:
+            with transaction.atomic():
+                pending = []
+                while remaining > 0 and len(pending) < self.batch_size:
+                    lines = []
+                    for product_id in self.rng.sample(product_ids, min(self.rng.randint(1, 5), remaining, len(product_ids))):
+                        name, price = product_prices[product_id]
+                        lines.append(OrderItem(
+                            product_id=product_id, product_name=name, price=price,
+                            quantity=self.rng.randint(1, 4),
+                        ))
+                    remaining -= len(lines)
+                    order = Order(
+                        user_id=self.rng.choice(customer_ids),
+                        created_at=now - timedelta(seconds=self.rng.randint(0, 365 * 24 * 3600)),
+                        total_price=sum(line.price * line.quantity for line in lines),
+                    )
+                    pending.append((order, lines))
+
+                Order.objects.bulk_create([order for order, lines in pending])
+                items = []
+                for order, lines in pending:
+                    for line in lines:
+                        line.order_id = order.pk
+                        items.append(line)
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+                orders += len(pending)
+        self.report(f'Order items ({orders} orders)', item_count, started)
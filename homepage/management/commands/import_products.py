@@ -0,0 +1,97 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from homepage import ledger
+from homepage.bulk_io import Progress, RowError, detect_format, product_from_row, read_rows
+from homepage.catalog import bump_catalog_version
+from homepage.models import Product, StockMovement
+from homepage.search import get_search_backend
+
+# Stock (and with it `available`) of existing SKUs changes through the stock
+# ledger, never by overwriting; see write_batch().
+UPDATE_FIELDS = ['name', 'price', 'category', 'image']
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert products by SKU from a CSV or JSON-lines file (use - for stdin). "
+        "Rows are streamed and written in batches; `available` is derived from stock. "
+        "For existing SKUs the change in stock is recorded in the stock ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--strict', action='store_true', help="Abort on the first bad row.")
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        fh = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        progress = Progress('import', stream=self.stderr)
+        bad = 0
+        try:
+            batch = {}
+            for line_no, row in enumerate(read_rows(fh, fmt), start=1):
+                try:
+                    product = product_from_row(row)
+                except RowError as e:
+                    if options['strict']:
+                        raise CommandError(f"Row {line_no}: {e}")
+                    bad += 1
+                    if bad <= 10:
+                        self.stderr.write(f"Skipping row {line_no}: {e}")
+                    continue
+                batch[product.sku] = product  # last row wins within a batch
+                if len(batch) >= options['batch_size']:
+                    self.write_batch(list(batch.values()))
+                    progress.add(len(batch))
+                    batch = {}
+            if batch:
+                self.write_batch(list(batch.values()))
+                progress.add(len(batch))
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress.count} products in {progress.elapsed():.1f}s "
+            f"({progress.rate():.0f} rows/s), skipped {bad} bad rows"
+        ))
+
+    def write_batch(self, products):
+        """
+        Upsert one batch. New SKUs are inserted with the file's stock. For
+        existing ones, the difference between the file's stock and the
+        current one (including restocks not folded in yet) is applied with
+        ledger.adjust(), so it is recorded and never takes units held in carts.
+        """
+        skus = [product.sku for product in products]
+        with transaction.atomic():
+            current = {
+                sku: (pk, stock)
+                for sku, pk, stock in Product.objects.filter(sku__in=skus).values_list('sku', 'pk', 'stock')
+            }
+            pending = dict(
+                StockMovement.objects.filter(pk__gt=ledger.watermark(), settled=False, product__sku__in=current)
+                .values('product__sku').annotate(quantity=Sum('quantity')).values_list('product__sku', 'quantity')
+            )
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=UPDATE_FIELDS,
+            )
+            for product in products:
+                if product.sku not in current:
+                    continue
+                pk, stock = current[product.sku]
+                delta = product.stock - stock - pending.get(product.sku, 0)
+                if not ledger.adjust(pk, delta, note='import'):
+                    self.stderr.write(f"SKU {product.sku}: kept its stock, units are held in carts")
+            # bulk_create skips post_save, so keep the search index in step here.
+            get_search_backend().index(products)
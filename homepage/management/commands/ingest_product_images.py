@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from homepage.images import ImageError, ingest_images, pending_products
+from homepage.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy product images into the media store and pre-generate their WebP/JPEG "
+        "thumbnails in a process pool. By default only products whose image changed "
+        "since the last pass are processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-ingest every product with an image.")
+        parser.add_argument('--workers', type=int, help="Pool size (default: one per CPU; 1 runs inline).")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='') if options['all'] else pending_products()
+        started = time.perf_counter()
+        failed = []
+
+        def on_error(product_id, source, message):
+            failed.append(product_id)
+            self.stderr.write(f"product {product_id}: {source}: {message}")
+
+        try:
+            count = ingest_images(products, workers=options['workers'], on_error=on_error)
+        except ImageError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {count} product images in {elapsed:.2f}s ({len(failed)} failed)"
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homepage.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys. Use --every to keep sweeping."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0, help="Repeat every N seconds instead of once.")
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired()
+            if purged or not options['every']:
+                self.stdout.write(f"Purged {purged} expired idempotency keys")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
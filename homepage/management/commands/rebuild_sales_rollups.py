@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from homepage.bulk_io import Progress
+from homepage.rollups import REBUILD_CHUNK, reset, roll_up_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the sales rollups from Order/OrderItem in chunks, one transaction per chunk. "
+        "With --pending, only count orders that are not rolled up yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK, help="Orders per transaction.")
+        parser.add_argument('--pending', action='store_true', help="Catch up without emptying the rollups.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if not options['pending']:
+            reset()
+        progress = Progress('rollup', stream=self.stderr)
+        while True:
+            counted = roll_up_pending(options['chunk_size'])
+            if not counted:
+                break
+            progress.add(counted)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {progress.count} orders in {progress.elapsed():.1f}s ({progress.rate():.0f} orders/s)"
+        ))
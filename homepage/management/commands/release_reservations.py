@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from homepage.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "Release expired stock holds in bulk. Use --every to keep sweeping."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0, help="Repeat every N seconds instead of once.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired()
+            if released or not options['every']:
+                self.stdout.write(f"Released {released} held units")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,91 @@
+import sys
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from homepage import jobs, ledger
+from homepage.bulk_io import Progress, detect_format, read_rows
+from homepage.models import Product, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        "Restock products by SKU from a CSV or JSON-lines file (columns: sku, quantity, note; "
+        "use - for stdin). Movements are appended to the stock ledger in batches. A compaction "
+        "then folds whatever has settled, and one is queued for when this run's movements have."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--note', default='', help="Note for rows without one.")
+        parser.add_argument('--strict', action='store_true', help="Abort on the first bad row.")
+        parser.add_argument(
+            '--defer', action='store_true', help="Only queue the compaction for run_workers; run none now.",
+        )
+        parser.add_argument(
+            '--fold-now', action='store_true',
+            help="Fold every movement at once, skipping STOCK_COMPACTION_SETTLE. Only safe while nothing "
+                 "else writes stock (no shop traffic or workers), or late commits are never counted.",
+        )
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        fh = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        progress = Progress('restock', stream=self.stderr)
+        self.bad = 0
+        self.strict = options['strict']
+        try:
+            batch = []
+            for line_no, row in enumerate(read_rows(fh, fmt), start=1):
+                batch.append((line_no, row))
+                if len(batch) >= options['batch_size']:
+                    progress.add(self.write_batch(batch, options['note']))
+                    batch = []
+            if batch:
+                progress.add(self.write_batch(batch, options['note']))
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+        if options['fold_now']:
+            folded = f"folded {ledger.compact(settle=timedelta())} movements"
+        else:
+            folded = "" if options['defer'] else f"folded {ledger.compact()} settled movements, "
+            # This run's movements are younger than the settle window; fold them once they are not.
+            jobs.enqueue('compact_stock_ledger', delay=ledger.settle_time())
+            folded += "compaction queued"
+        self.stdout.write(self.style.SUCCESS(
+            f"Appended {progress.count} restocks in {progress.elapsed():.1f}s "
+            f"({progress.rate():.0f} rows/s), {folded}, skipped {self.bad} bad rows"
+        ))
+
+    def skip(self, line_no, message):
+        if self.strict:
+            raise CommandError(f"Row {line_no}: {message}")
+        self.bad += 1
+        if self.bad <= 10:
+            self.stderr.write(f"Skipping row {line_no}: {message}")
+
+    def write_batch(self, rows, default_note):
+        """Resolve the batch's SKUs with one query and append its movements in one INSERT."""
+        skus = {str(row.get('sku') or '').strip() for line_no, row in rows}
+        ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+        movements = []
+        for line_no, row in rows:
+            sku = str(row.get('sku') or '').strip()
+            try:
+                quantity = int(row.get('quantity') or 0)
+            except (TypeError, ValueError):
+                quantity = 0
+            if sku not in ids:
+                self.skip(line_no, f"unknown SKU {sku!r}")
+            elif quantity <= 0:
+                self.skip(line_no, "quantity must be a positive whole number")
+            else:
+                movements.append(StockMovement(
+                    product_id=ids[sku], kind=StockMovement.RESTOCK, quantity=quantity,
+                    note=str(row.get('note') or default_note)[:200],
+                ))
+        return ledger.append(movements)
@@ -0,0 +1,156 @@
+import json
+import platform
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from homepage.benchmarking import compare, run_http_load, summarize
+from homepage.models import CartItem, Customer, Product
+from homepage.reservations import release_all
+
+BENCH_EMAIL = 'bench@synthetic.test'
+POST_SCENARIOS = {'add_to_cart', 'checkout'}  # state changes are POST only
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main pages through the test client (latency, queries per "
+        "request) and optionally a running server over HTTP. Results are JSON, and "
+        "--baseline diffs them against an earlier run. Use a disposable database: "
+        "the cart and checkout scenarios place real orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=20, help="Untimed requests per scenario first.")
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="Only run these (repeatable).")
+        parser.add_argument('--http', metavar='BASE_URL', help="Also load-test GET scenarios on this server.")
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of HTTP load per scenario.")
+        parser.add_argument('--load-processes', type=int, default=2)
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--baseline', help="Earlier results file to compare against.")
+        parser.add_argument('--threshold', type=float, default=10.0, help="Percent slowdown counted as a regression.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        products = list(
+            Product.objects.filter(available=True).order_by('-stock').values_list('pk', flat=True)[:50]
+        )
+        if not products:
+            raise CommandError("No products to benchmark; run generate_synthetic_data first.")
+        self.products = products
+        self.user, _ = Customer.objects.get_or_create(email=BENCH_EMAIL, defaults={'username': 'bench'})
+        search_term = Product.objects.filter(pk=products[0]).values_list('name', flat=True)[0].split()[0][:3]
+
+        # name: (path, needs login, per-iteration setup)
+        scenarios = {
+            'homepage': (reverse('homepage'), False, None),
+            'product_list': (reverse('product_list'), False, None),
+            'product_list_search': (f"{reverse('product_list')}?q={search_term}", False, None),
+            'product_list_category': (f"{reverse('product_list')}?category=Fish", False, None),
+            'add_to_cart': (self.add_path, True, None),
+            'view_cart': (reverse('view_cart'), True, None),
+            'checkout': (reverse('checkout'), True, self.fill_cart),
+            'order_history': (reverse('order_history'), True, None),
+        }
+        selected = options['scenarios'] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        results = {
+            'meta': {
+                'when': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'cache': settings.CACHES['default']['BACKEND'],
+                'products': Product.objects.count(),
+                'iterations': options['iterations'],
+            },
+            'client': {},
+        }
+        anonymous, member = Client(), Client()
+        member.force_login(self.user)
+        self.reset_cart()
+        for name in selected:
+            path, needs_login, setup = scenarios[name]
+            stats = self.run_client(
+                member if needs_login else anonymous, path, setup, options['iterations'], options['warmup'],
+                method='post' if name in POST_SCENARIOS else 'get',
+            )
+            results['client'][name] = stats
+            self.stdout.write(
+                f"{name:24} {stats['p50_ms']:8.2f} ms p50 {stats['p95_ms']:8.2f} ms p95 "
+                f"{stats['p99_ms']:8.2f} ms p99 {stats['queries_per_request']:6.1f} queries"
+            )
+            self.reset_cart()
+
+        if options['http']:
+            results['http'] = {}
+            for name in selected:
+                path, needs_login, setup = scenarios[name]
+                if needs_login:
+                    continue  # the raw load driver has no session
+                stats = run_http_load(
+                    options['http'], [path], options['concurrency'], options['duration'], options['load_processes'],
+                )
+                results['http'][name] = stats
+                self.stdout.write(f"{name:24} {stats['rps']:8.1f} req/s over HTTP, p99 {stats['p99_ms']} ms")
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['baseline']:
+            self.report_changes(results, options)
+
+    def add_path(self, iteration):
+        return reverse('add_to_cart', args=[self.products[iteration % len(self.products)]])
+
+    def fill_cart(self, client, iteration):
+        client.post(self.add_path(iteration))
+
+    def reset_cart(self):
+        release_all({'user': self.user})
+        CartItem.objects.filter(cart__user=self.user).delete()
+
+    def run_client(self, client, path, setup, iterations, warmup, method='get'):
+        latencies = []
+        queries = 0
+        elapsed = 0.0
+        for iteration in range(warmup + iterations):
+            if setup:
+                setup(client, iteration)
+            url = path(iteration) if callable(path) else path
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url)
+                took = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {url} returned {response.status_code}")
+            if iteration >= warmup:
+                latencies.append(took)
+                queries += len(captured)
+                elapsed += took
+        stats = summarize(latencies, 0, elapsed)
+        stats['queries_per_request'] = round(queries / iterations, 2) if iterations else 0.0
+        return stats
+
+    def report_changes(self, results, options):
+        with open(options['baseline']) as fh:
+            baseline = json.load(fh)
+        rows = compare(baseline, results, options['threshold'])
+        regressions = [row for row in rows if row[-1]]
+        for section, scenario, metric, old, new, change, regressed in rows:
+            line = f"{section:6} {scenario:24} {metric:20} {old:>10} -> {new:<10} {change:+6.1f}%"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} metrics regressed by more than {options['threshold']}%")
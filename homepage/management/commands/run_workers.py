@@ -0,0 +1,93 @@
+import multiprocessing
+import signal
+import threading
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from homepage import jobs
+
+
+def _run_threads(label, threads, stop, batch, poll, drain):
+    """Run `threads` workers in this process; returns the number of jobs run."""
+    if threads == 1:
+        return jobs.work(jobs.worker_name(f'{label}-0'), stop, batch, poll, drain)
+    counts = []
+
+    def target(index):
+        try:
+            counts.append(jobs.work(jobs.worker_name(f'{label}-{index}'), stop, batch, poll, drain))
+        finally:
+            connection.close()  # each thread has its own
+
+    pool = [threading.Thread(target=target, args=(index,), daemon=True) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(counts)
+
+
+def _process_main(index, threads, stop, batch, poll, drain, results):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent sets `stop`
+    results.put(_run_threads(f'p{index}', threads, stop, batch, poll, drain))
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (receipts, low-stock alerts) from the job table with a pool "
+        "of worker processes and threads. Stops cleanly on SIGTERM or Ctrl-C."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes.")
+        parser.add_argument('--threads', type=int, default=1, help="Worker threads per process.")
+        parser.add_argument('--batch', type=int, default=10, help="Jobs claimed per poll by each worker.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when no job is due.")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due instead of polling.")
+        parser.add_argument('--purge', action='store_true', help="Delete old finished jobs before starting.")
+
+    def handle(self, *args, **options):
+        processes, threads = options['processes'], options['threads']
+        if processes < 1 or threads < 1 or options['batch'] < 1:
+            raise CommandError("--processes, --threads and --batch must be at least 1.")
+        if options['purge']:
+            self.stdout.write(f"Purged {jobs.purge_finished()} finished jobs")
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} jobs with expired leases")
+
+        run = (options['batch'], options['poll_interval'], options['once'])
+        if processes == 1:
+            stop = threading.Event()
+            with self._stop_on_signal(stop):
+                ran = _run_threads('p0', threads, stop, *run)
+        else:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise CommandError("--processes > 1 needs the fork start method; use --threads instead.")
+            context = multiprocessing.get_context('fork')
+            stop, results = context.Event(), context.SimpleQueue()
+            connections.close_all()  # children must not share the parent's DB connections
+            pool = [
+                context.Process(target=_process_main, args=(index, threads, stop, *run, results))
+                for index in range(processes)
+            ]
+            for process in pool:
+                process.start()
+            with self._stop_on_signal(stop):
+                for process in pool:
+                    process.join()
+            ran = sum(results.get() for process in pool if process.exitcode == 0)
+
+        self.stdout.write(f"Ran {ran} jobs")
+
+    @contextmanager
+    def _stop_on_signal(self, stop):
+        """Set `stop` on SIGTERM/SIGINT so workers finish their current job and exit."""
+        previous = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            yield
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
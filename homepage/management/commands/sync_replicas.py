@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary into each SQLite replica file (DATABASE_REPLICAS) with the "
+        "online backup API, for trying read replicas locally. Use --every to keep them "
+        "following the primary with a lag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0, help="Repeat every N seconds instead of once.")
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("Only SQLite replicas are synced here; use the database's own replication.")
+        aliases = list(settings.DATABASE_REPLICAS)
+        if not aliases:
+            raise CommandError("No replicas configured; set DATABASE_REPLICAS to one or more SQLite files.")
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for alias in aliases:
+                    target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(f"Synced {len(aliases)} replicas in {time.perf_counter() - started:.2f}s")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,308 @@
+# homepage/metrics.py
+"""
+Per-view request metrics, exported in Prometheus text format.
+
+MetricsMiddleware records, for each resolved URL name:
+latency, DB query count and time, template render time and response size.
+Queries are counted by an execute wrapper installed on every new DB
+connection. Template time comes from InstrumentedDjangoTemplates. Both
+report into the current request through a context variable, so they
+also see work that async views push to sync_to_async threads.
+
+Each process keeps its own counters. A request does its bookkeeping
+without locks and merges into the process registry in one short critical
+section at the end. With METRICS_DIR set, each process periodically
+writes a snapshot file there, and the /metrics endpoint sums every
+process's file. Nothing is recorded unless METRICS_ENABLED is true.
+
+Background jobs (jobs.py) report here too: runs by job type and outcome,
+and run time. Worker processes flush into the same METRICS_DIR.
+"""
+import atexit
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# name: (help, buckets, label)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by view.', LATENCY_BUCKETS, 'view'),
+    'db_queries_per_request': ('Database queries issued per request.', QUERY_BUCKETS, 'view'),
+    'db_query_duration_seconds': ('Total database time per request.', LATENCY_BUCKETS, 'view'),
+    'template_render_duration_seconds': ('Total template render time per request.', LATENCY_BUCKETS, 'view'),
+    'http_response_size_bytes': ('Response body size.', SIZE_BUCKETS, 'view'),
+    'job_duration_seconds': ('Background job run time by job type.', JOB_BUCKETS, 'job'),
+}
+PREFIX = 'django_'
+
+_current = contextvars.ContextVar('homepage_metrics_request', default=None)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class _RequestStats:
+    __slots__ = ('queries', 'query_time', 'template_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+
+
+# -----------------------
+# Process registry
+# -----------------------
+class Registry:
+    """
+    Counters for one process. A histogram is stored as its per-bucket counts
+    (not cumulative), with the +Inf bucket last, followed by the sum.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}    # (view, method, status) -> count
+        self.jobs = {}        # (job, outcome) -> count
+        self.histograms = {}  # (name, view or job) -> [bucket counts..., +Inf count, sum]
+        self.last_flush = time.monotonic()
+
+    def _observe(self, name, label, value):
+        buckets = HISTOGRAMS[name][1]
+        series = self.histograms.get((name, label))
+        if series is None:
+            series = self.histograms[(name, label)] = [0] * (len(buckets) + 2)
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def record(self, view, method, status, observations):
+        with self.lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in observations:
+                self._observe(name, view, value)
+
+    def record_job(self, job, outcome, duration):
+        with self.lock:
+            self.jobs[(job, outcome)] = self.jobs.get((job, outcome), 0) + 1
+            self._observe('job_duration_seconds', job, duration)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [[*key, count] for key, count in self.requests.items()],
+                'jobs': [[*key, count] for key, count in self.jobs.items()],
+                'histograms': [[name, view, list(series)] for (name, view), series in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+
+def merge(snapshots):
+    requests, jobs, histograms = {}, {}, {}
+    for snap in snapshots:
+        for view, method, status, count in snap['requests']:
+            requests[(view, method, status)] = requests.get((view, method, status), 0) + count
+        for job, outcome, count in snap.get('jobs', ()):
+            jobs[(job, outcome)] = jobs.get((job, outcome), 0) + count
+        for name, view, series in snap['histograms']:
+            if name not in HISTOGRAMS:
+                continue
+            total = histograms.setdefault((name, view), [0] * len(series))
+            for i, value in enumerate(series):
+                total[i] += value
+    return requests, jobs, histograms
+
+
+# -----------------------
+# Cross-process aggregation
+# -----------------------
+def _metrics_dir():
+    path = getattr(settings, 'METRICS_DIR', None)
+    return Path(path) if path else None
+
+
+def flush(force=False):
+    """Write this process's snapshot to METRICS_DIR (atomically, at most every METRICS_FLUSH_INTERVAL)."""
+    directory = _metrics_dir()
+    if directory is None:
+        return
+    now = time.monotonic()
+    if not force and now - registry.last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        return
+    registry.last_flush = now
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(registry.snapshot(), fh)
+    os.replace(tmp, directory / f'{os.getpid()}.json')
+
+
+def collect():
+    """Snapshots from every process that has flushed, with this process's live counters."""
+    snapshots = [registry.snapshot()]
+    directory = _metrics_dir()
+    if directory is not None and directory.is_dir():
+        own = f'{os.getpid()}.json'
+        for path in directory.glob('*.json'):
+            if path.name == own:
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue  # a writer is mid-replace or the file is corrupt
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshots):
+    requests, jobs, histograms = merge(snapshots)
+    lines = [
+        f'# HELP {PREFIX}http_requests_total Requests by view, method and status.',
+        f'# TYPE {PREFIX}http_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(requests.items()):
+        lines.append(
+            f'{PREFIX}http_requests_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {count}'
+        )
+    lines += [
+        f'# HELP {PREFIX}jobs_total Background job runs by job type and outcome.',
+        f'# TYPE {PREFIX}jobs_total counter',
+    ]
+    for (job, outcome), count in sorted(jobs.items()):
+        lines.append(f'{PREFIX}jobs_total{{job="{_escape(job)}",outcome="{outcome}"}} {count}')
+    for name, (help_text, buckets, label_name) in HISTOGRAMS.items():
+        lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} histogram']
+        for (series_name, view), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            label = f'{label_name}="{_escape(view)}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), series[:-1]):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}{name}_sum{{{label}}} {series[-1]:.6f}')
+            lines.append(f'{PREFIX}{name}_count{{{label}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# -----------------------
+# Instrumentation hooks
+# -----------------------
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class _TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The DjangoTemplates backend, with render time reported to MetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return _TimedTemplate(template.template, self)
+
+
+# -----------------------
+# Middleware
+# -----------------------
+class MetricsMiddleware:
+    """Outermost middleware: times the whole stack below it."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_wrapper, dispatch_uid='homepage.metrics')
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(None, connection)
+        atexit.register(flush, force=True)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        size = 0 if response.streaming else len(response.content)
+        registry.record(view, request.method, response.status_code, (
+            ('http_request_duration_seconds', elapsed),
+            ('db_queries_per_request', stats.queries),
+            ('db_query_duration_seconds', stats.query_time),
+            ('template_render_duration_seconds', stats.template_time),
+            ('http_response_size_bytes', size),
+        ))
+        flush()
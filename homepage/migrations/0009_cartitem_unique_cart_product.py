@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold duplicate (cart, product) rows into one before the constraint is added."""
+    CartItem = apps.get_model('homepage', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart', 'product')
+        .annotate(n=Count('id'), keep=Min('id'), quantity=Sum('quantity'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        lines = CartItem.objects.filter(cart=row['cart'], product=row['product'])
+        lines.exclude(id=row['keep']).delete()
+        lines.filter(id=row['keep']).update(quantity=row['quantity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0008_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
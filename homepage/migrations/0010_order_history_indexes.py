@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:50
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_product_names(apps, schema_editor):
+    OrderItem = apps.get_model('homepage', 'OrderItem')
+    Product = apps.get_model('homepage', 'Product')
+    OrderItem.objects.update(
+        product_name=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('name')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0009_cartitem_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(snapshot_product_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+    ]
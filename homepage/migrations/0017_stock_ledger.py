@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0016_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('after_id', models.BigIntegerField(unique=True)),
+                ('last_id', models.BigIntegerField()),
+                ('movements', models.PositiveIntegerField(default=0)),
+                ('products', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('settled', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='homepage.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='homepage.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-id'], name='movement_product_idx')],
+            },
+        ),
+    ]
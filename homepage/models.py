@@ -1,5 +1,7 @@
 # homepage/models.py
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
 from django.utils import timezone
@@ -17,16 +19,43 @@ class Product(models.Model):
         ('Fruit', 'Fruit')
     ]
 
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # supplier key for bulk sync
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=8, decimal_places=2)
     image = models.URLField(blank=True)
+    image_hash = models.CharField(max_length=32, blank=True)  # thumbnails, see images.py
+    image_source = models.CharField(max_length=200, blank=True)  # the image that image_hash was made from
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)  # units held in carts, see reservations.py
     available = models.BooleanField(default=True)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='Grocery')
 
+    class Meta:
+        # One index per hot catalog query; tests.QueryPlanTests keeps them honest.
+        indexes = [
+            # featured_products(): available, in stock. Partial, because SQLite
+            # compares booleans as bare columns, which a composite can't seek on.
+            models.Index(fields=['stock'], condition=Q(available=True), name='product_available_stock_idx'),
+            # product_list keyset pages, sorted by category or by price
+            models.Index(fields=['category', 'id'], name='product_category_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            # product_list filtered to one category (case-insensitive)
+            models.Index(Lower('category'), F('id'), name='product_category_lower_idx'),
+            models.Index(Lower('category'), F('price'), F('id'), name='product_category_price_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    @property
+    def free_stock(self):
+        """Stock that is not held in someone's cart."""
+        return max(self.stock - self.reserved, 0)
+
+    @property
+    def has_thumbnails(self):
+        return bool(self.image_hash) and self.image_source == self.image
+
 
 # ------------------------------
 # Customer model
@@ -79,7 +108,9 @@ class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
     def total(self):
-        return sum(item.subtotal() for item in self.items.all())
+        return self.items.aggregate(
+            total=models.Sum(models.F('quantity') * models.F('product__price'))
+        )['total'] or 0
 
     def __str__(self):
         return f"Cart of {self.user.username}"
@@ -90,6 +121,11 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def subtotal(self):
         return self.product.price * self.quantity
 
@@ -103,6 +139,14 @@ class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=timezone.now)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    rolled_up = models.BooleanField(default=False)  # counted in the sales rollups, see rollups.py
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            # rollups.roll_up_pending(): the few orders not counted yet
+            models.Index(fields=['id'], condition=Q(rolled_up=False), name='order_pending_rollup_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} by {self.user.username}"
@@ -110,6 +154,7 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    product_name = models.CharField(max_length=100, blank=True)  # name at the time of the order
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=8, decimal_places=2)
 
@@ -117,4 +162,188 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
     def __str__(self):
-        return f"{self.quantity} × {self.product.name} (Order #{self.order.id})"
\ No newline at end of file
+        return f"{self.quantity} × {self.product_name} (Order #{self.order_id})"
+
+
+#----------------------
+# Sales rollups
+#----------------------
+class DailySales(models.Model):
+    """Orders, units and revenue per day (see rollups.py)."""
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.orders} orders"
+
+
+class DailyCategorySales(models.Model):
+    """Units and revenue per day per product category."""
+    day = models.DateField()
+    category = models.CharField(max_length=20)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category}: {self.revenue}"
+
+
+class ProductSales(models.Model):
+    """Units and revenue per product, all time."""
+    product = models.OneToOneField(Product, related_name='sales', on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # reports: best sellers
+            models.Index(fields=['-units', 'product'], name='product_sales_units_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.units} sold"
+
+
+#----------------------
+# Stock held in carts
+#----------------------
+class StockReservation(models.Model):
+    """
+    Units of a product held for one cart (a user's, or a guest's)
+    until `expires_at`. Product.reserved is the sum of these rows.
+    """
+    product = models.ForeignKey(Product, related_name="reservations", on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    session_key = models.CharField(max_length=40, blank=True)  # guest cart key, see cart_store.py
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'user'], condition=models.Q(user__isnull=False),
+                name='unique_reservation_per_user',
+            ),
+            models.UniqueConstraint(
+                fields=['product', 'session_key'], condition=~models.Q(session_key=''),
+                name='unique_reservation_per_session',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+            models.Index(fields=['session_key'], name='reservation_session_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} held until {self.expires_at:%H:%M}"
+
+
+#----------------------
+# Stock ledger
+#----------------------
+class StockMovement(models.Model):
+    """
+    One append-only change to a product's stock (see ledger.py). Rows are
+    never updated. `settled` rows were applied to Product.stock when
+    written; the others are folded in by compaction.
+    """
+    SALE, RESTOCK, ADJUSTMENT = 'sale', 'restock', 'adjustment'
+    KIND_CHOICES = [(SALE, 'Sale'), (RESTOCK, 'Restock'), (ADJUSTMENT, 'Adjustment')]
+
+    product = models.ForeignKey(Product, related_name="movements", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()  # signed: sales are negative
+    settled = models.BooleanField(default=False)
+    order = models.ForeignKey('Order', null=True, blank=True, on_delete=models.SET_NULL)
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # A product's history, newest first (admin, audits).
+            models.Index(fields=['product', '-id'], name='movement_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} × {self.product_id}"
+
+
+class StockCompaction(models.Model):
+    """
+    One fold of the ledger into Product.stock: movements with
+    after_id < id <= last_id. The highest last_id is the watermark.
+    """
+    after_id = models.BigIntegerField(unique=True)  # two compactions can't start from one watermark
+    last_id = models.BigIntegerField()
+    movements = models.PositiveIntegerField(default=0)
+    products = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Compaction ({self.after_id}, {self.last_id}]"
+
+
+#----------------------
+# Idempotent POSTs
+#----------------------
+class IdempotencyKey(models.Model):
+    """
+    A client-chosen key for one mutation and, once it finished, its response,
+    replayed to repeats of the key until `expires_at` (see idempotency.py).
+    """
+    key = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=200)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    status_code = models.PositiveSmallIntegerField(null=True)  # None while the first request runs
+    started_at = models.DateTimeField(default=timezone.now)  # when the running request claimed it
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    cookies = models.TextField(blank=True)  # Set-Cookie values, one per line
+    body = models.BinaryField(blank=True, default=b'')
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for {self.path}"
+
+
+#----------------------
+# Background jobs
+#----------------------
+class Job(models.Model):
+    """One unit of background work, run by `manage.py run_workers` (see jobs.py)."""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)  # a task registered in jobs.TASKS
+    payload = models.JSONField(default=dict, blank=True)  # keyword arguments for the task
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)  # not before; retries push it out
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=64, blank=True)  # the claiming worker
+    locked_until = models.DateTimeField(null=True, blank=True)  # lease; requeued after
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll "queued and due, oldest first".
+            models.Index(fields=['run_at', 'id'], condition=Q(status='queued'), name='job_ready_idx'),
+            models.Index(fields=['locked_until'], condition=Q(status='running'), name='job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
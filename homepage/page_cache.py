@@ -0,0 +1,87 @@
+# homepage/page_cache.py
+"""
+Full-page HTTP caching for the catalog pages.
+
+The homepage and product list render the same HTML for every visitor
+with a given URL. The user links and cart badge are filled in by the
+browser from the cart_badge endpoint, and the pages never touch the
+session or the CSRF token. Views opt in with @cacheable_page.
+PageCacheMiddleware then:
+
+- serves repeat requests from the cache under a key versioned by the
+  catalog version. Any product write or checkout moves every page to a
+  fresh key at once;
+- adds ETag, Last-Modified and public Cache-Control headers, so a
+  reverse proxy or the browser can absorb catalog traffic too;
+- answers If-None-Match / If-Modified-Since with 304.
+
+A response that set a cookie or varies on Cookie is never cached. That
+happens, for example, when a template starts reading the session again.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, has_vary_header, patch_cache_control
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.http import http_date
+
+from .catalog import CATALOG, catalog_version
+from .caching import versioned_key
+
+
+def cacheable_page(view):
+    """Mark a view as a shared, user-independent page for PageCacheMiddleware."""
+    view.cacheable_page = True
+    return view
+
+
+def page_max_age():
+    return getattr(settings, 'PAGE_CACHE_MAX_AGE', 60)
+
+
+def _path_hash(request):
+    return hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()
+
+
+def _set_headers(response, version, path_hash, modified):
+    response['ETag'] = f'"{version}-{path_hash[:16]}"'
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, public=True, max_age=page_max_age())
+
+
+class PageCacheMiddleware(MiddlewareMixin):
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or not getattr(view_func, 'cacheable_page', False):
+            return None
+        version = catalog_version()
+        path_hash = _path_hash(request)
+        request._page_cache = (versioned_key(CATALOG, f'page:{path_hash}'), version, path_hash)
+        entry = cache.get(request._page_cache[0])
+        if entry is None:
+            return None
+        content, content_type, modified = entry
+        response = HttpResponse(content, content_type=content_type)
+        _set_headers(response, version, path_hash, modified)
+        request._page_cache = None  # nothing to store
+        return get_conditional_response(
+            request, etag=response['ETag'], last_modified=modified, response=response,
+        )
+
+    def process_response(self, request, response):
+        page = getattr(request, '_page_cache', None)
+        if page is None or response.status_code != 200 or response.streaming:
+            return response
+        if response.cookies or has_vary_header(response, 'Cookie'):
+            return response  # per-visitor after all
+        key, version, path_hash = page
+        modified = int(time.time())
+        cache.set(key, (response.content, response['Content-Type'], modified), getattr(
+            settings, 'PAGE_CACHE_TIMEOUT', 600,
+        ))
+        _set_headers(response, version, path_hash, modified)
+        return get_conditional_response(
+            request, etag=response['ETag'], last_modified=modified, response=response,
+        )
@@ -0,0 +1,188 @@
+# homepage/pagination.py
+"""
+Cursor (keyset) pagination.
+
+Pages are addressed by the sort key of the row they start after (or end
+before), never by OFFSET, so page 1000 costs the same as page 1. Cursors
+are opaque url-safe strings.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps({direction: [_to_json(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values) where direction is 'a' (after) or 'b' (before)."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        (direction, values), = payload.items()
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('a', 'b') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+def page_size_from(request, default_setting='PRODUCTS_PAGE_SIZE'):
+    """`?per_page=` clamped to PAGE_SIZE_MAX, falling back to the given setting."""
+    default = getattr(settings, default_setting, 24)
+    try:
+        size = int(request.GET.get('per_page', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, getattr(settings, 'PAGE_SIZE_MAX', 96)))
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by a unique ordering, e.g. ('category', 'id') or
+    ('-created_at', '-id'). The last field must be unique.
+    """
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        self.fields = [f.lstrip('-') for f in self.ordering]
+
+    def _key(self, obj):
+        if isinstance(obj, dict):
+            return [obj[f] for f in self.fields]
+        return [getattr(obj, f) for f in self.fields]
+
+    def _parse(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        model = self.queryset.model
+        try:
+            return [model._meta.get_field(f).to_python(v) for f, v in zip(self.fields, values)]
+        except ValidationError:
+            raise InvalidCursor(values)
+
+    def _seek(self, values, forward):
+        """
+        Rows strictly after (forward) or before the given key. The leading
+        `>=`/`<=` term lets the database range-scan an index on the sort key.
+        """
+        condition = Q()
+        for i, ordering in enumerate(self.ordering):
+            descending = ordering.startswith('-')
+            op = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{self.fields[i]}__{op}': values[i]})
+            for field, value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{field: value})
+            condition |= term
+        first = self.fields[0]
+        bound = 'lte' if self.ordering[0].startswith('-') == forward else 'gte'
+        return Q(**{f'{first}__{bound}': values[0]}) & condition
+
+    def _window(self, cursor):
+        """The sliced queryset for a page, plus the decoded cursor."""
+        direction, values = decode_cursor(cursor) if cursor else ('a', None)
+        forward = direction == 'a'
+        qs = self.queryset
+        if values is not None:
+            qs = qs.filter(self._seek(self._parse(values), forward))
+        if forward:
+            qs = qs.order_by(*self.ordering)
+        else:
+            qs = qs.order_by(*[o[1:] if o.startswith('-') else '-' + o for o in self.ordering])
+        return qs[:self.page_size + 1], forward, values
+
+    def _page(self, rows, forward, values):
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return Page(rows)
+
+        has_next = more if forward else True
+        has_prev = (values is not None) if forward else more
+        return Page(
+            rows,
+            next_cursor=encode_cursor('a', self._key(rows[-1])) if has_next else None,
+            prev_cursor=encode_cursor('b', self._key(rows[0])) if has_prev else None,
+        )
+
+    def get_page(self, cursor=None):
+        qs, forward, values = self._window(cursor)
+        return self._page(list(qs), forward, values)
+
+    async def aget_page(self, cursor=None):
+        qs, forward, values = self._window(cursor)
+        return self._page([row async for row in qs], forward, values)
+
+
+class RankedPaginator:
+    """
+    Paginate a relevance-ranked list of ids (the capped search window).
+    The cursor is the id a page starts after or ends before.
+    """
+
+    def __init__(self, ids, page_size):
+        self.ids = list(ids)
+        self.page_size = page_size
+
+    def get_page(self, cursor=None):
+        start, stop = 0, self.page_size
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            try:
+                index = self.ids.index(values[0])
+            except (ValueError, IndexError):
+                raise InvalidCursor(cursor)
+            if direction == 'a':
+                start, stop = index + 1, index + 1 + self.page_size
+            else:
+                start, stop = max(index - self.page_size, 0), index
+        ids = self.ids[start:stop]
+        return Page(
+            ids,
+            next_cursor=encode_cursor('a', [ids[-1]]) if ids and stop < len(self.ids) else None,
+            prev_cursor=encode_cursor('b', [ids[0]]) if ids and start > 0 else None,
+        )
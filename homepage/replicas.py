@@ -0,0 +1,298 @@
+# homepage/replicas.py
+"""
+Read replicas for the catalog and order-history pages.
+
+Databases listed in DATABASE_REPLICAS (built from the DATABASE_REPLICAS
+environment variable, see myproject1/dbconfig.py) are read-only copies of
+`default`. ReplicaRouter sends a read to a replica only when all of the
+following hold:
+
+- it happens inside a view marked @replica_reads (homepage, product_list,
+  order_history, order_detail and the catalog API). These are GET pages
+  that write nothing. Everything else, including checkout, cart changes,
+  sessions and auth, uses the primary;
+- the model is one of REPLICA_MODELS (catalog and order rows);
+- the request has not written anything yet. After any write, the rest of
+  the request reads from the primary.
+
+Read-your-writes across requests: a successful POST (or other unsafe
+method) sets a short-lived cookie. For REPLICA_STICKY_SECONDS afterwards,
+that client reads from the primary, so a shopper sees their order in the
+history right after checkout. Catalog pages also read from the primary for
+REPLICA_MAX_LAG seconds after any catalog change. Those are the renders
+that fill the page and catalog caches under the new version, and a lagging
+replica must not be the one to fill them.
+
+Replica selection is health based. Each process probes a replica at most
+every REPLICA_CHECK_INTERVAL seconds: it runs one cheap query, and on
+Postgres it also checks the replay lag against REPLICA_MAX_LAG. A random
+healthy replica is used, or the primary if there is none. If a replica
+fails in the middle of a page, it is marked down and the view runs again
+on the primary. Only errors raised by the replica's own connection count:
+replica connections carry an execute wrapper that flags the request, and
+the connection is opened before the view runs. Any other database error
+is re-raised as usual, and the view is not run a second time.
+
+Locally, a second SQLite file stands in for a replica. `manage.py
+sync_replicas` copies the primary into it with SQLite's online backup;
+run it with --every N to simulate replication lag.
+"""
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+
+from .catalog import acatalog_changed_at, catalog_changed_at
+from .models import Product
+
+SAFE_METHODS = ('GET', 'HEAD')
+STICKY_COOKIE = 'primary_until'
+REPLICA_MODELS = {'homepage.product', 'homepage.order', 'homepage.orderitem'}
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG', 5)
+
+
+# -----------------------
+# Replica health
+# -----------------------
+def probe(alias):
+    """True if `alias` answers a query and, on Postgres, is not lagging."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite' and not os.path.exists(connection.settings_dict['NAME']):
+        return False  # connecting would create an empty file in its place
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+                )
+                return cursor.fetchone()[0] <= max_lag()
+            # The schema is there, so the copy was synced at least once.
+            cursor.execute(f'SELECT 1 FROM {Product._meta.db_table} LIMIT 1')
+            return True
+    except Exception:
+        return False
+
+
+class ReplicaPool:
+    """Per-process health of the replicas, re-probed every REPLICA_CHECK_INTERVAL seconds."""
+
+    def __init__(self, probe=probe):
+        self.probe = probe
+        self.status = {}  # alias -> (healthy, checked at)
+        self.lock = threading.Lock()
+
+    def healthy(self, alias):
+        interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', 10)
+        with self.lock:
+            status = self.status.get(alias)
+        if status is not None and time.monotonic() - status[1] < interval:
+            return status[0]
+        healthy = self.probe(alias)
+        with self.lock:
+            self.status[alias] = (healthy, time.monotonic())
+        return healthy
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.status[alias] = (False, time.monotonic())
+
+    def pick(self):
+        """A random healthy replica, or None for the primary."""
+        healthy = [alias for alias in replica_aliases() if self.healthy(alias)]
+        return random.choice(healthy) if healthy else None
+
+
+pool = ReplicaPool()
+
+
+# -----------------------
+# Per-request routing state
+# -----------------------
+class _Reads:
+    __slots__ = ('alias', 'wrote', 'failed')
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+        self.failed = False  # a query on the replica raised
+
+
+_reads = ContextVar('replica_reads', default=None)
+
+
+def current_replica():
+    """The replica this request reads from, or None for the primary."""
+    state = _reads.get()
+    return None if state is None or state.wrote else state.alias
+
+
+def _flag_replica_errors(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except DatabaseError:
+        state = _reads.get()
+        if state is not None:
+            state.failed = True
+        raise
+
+
+def install_replica_wrapper(sender, connection, **kwargs):
+    if connection.alias in replica_aliases() and _flag_replica_errors not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_flag_replica_errors)
+
+
+connection_created.connect(install_replica_wrapper, dispatch_uid='homepage.replicas')
+
+
+def _connect(alias):
+    """Open the replica connection up front, so a failure to connect is known to be the replica's."""
+    connections[alias].ensure_connection()
+
+
+def _sticky(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _wants_replica(request, changed_at):
+    return (
+        request.method in SAFE_METHODS
+        and replica_aliases()
+        and not _sticky(request)
+        and time.time() - changed_at >= max_lag()
+    )
+
+
+def replica_reads(view):
+    """
+    Let a read-only view read catalog and order rows from a replica. If the
+    replica fails, it is marked down and the view is run again on the primary.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not _wants_replica(request, await acatalog_changed_at()):
+                return await view(request, *args, **kwargs)
+            alias = await sync_to_async(pool.pick)()
+            if alias is None:
+                return await view(request, *args, **kwargs)
+            try:
+                await sync_to_async(_connect)(alias)  # the thread the async ORM queries from
+            except DatabaseError:
+                pool.mark_down(alias)
+                return await view(request, *args, **kwargs)
+            state = _Reads(alias)
+            token = _reads.set(state)
+            try:
+                return await view(request, *args, **kwargs)
+            except DatabaseError:
+                if not state.failed:
+                    raise
+                pool.mark_down(alias)
+                _reads.set(None)
+                return await view(request, *args, **kwargs)
+            finally:
+                _reads.reset(token)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _wants_replica(request, catalog_changed_at()):
+            return view(request, *args, **kwargs)
+        alias = pool.pick()
+        if alias is None:
+            return view(request, *args, **kwargs)
+        try:
+            _connect(alias)
+        except DatabaseError:
+            pool.mark_down(alias)
+            return view(request, *args, **kwargs)
+        state = _Reads(alias)
+        token = _reads.set(state)
+        try:
+            return view(request, *args, **kwargs)
+        except DatabaseError:
+            if not state.failed:
+                raise
+            pool.mark_down(alias)
+            _reads.set(None)
+            return view(request, *args, **kwargs)
+        finally:
+            _reads.reset(token)
+    return wrapper
+
+
+# -----------------------
+# Router and middleware
+# -----------------------
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in REPLICA_MODELS:
+            return current_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _reads.get()
+        if state is not None:
+            state.wrote = True  # read our own write for the rest of the request
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False  # replicas get their schema from the primary
+        return None
+
+
+class ReplicaStickyMiddleware:
+    """After a successful write, pin the client to the primary for REPLICA_STICKY_SECONDS."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            seconds = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,105 @@
+# homepage/reports.py
+"""
+Sales report API for the dashboard: superusers, and customers granted
+the homepage.view_dailysales permission.
+
+GET api/v1/reports/sales/?from=YYYY-MM-DD&to=YYYY-MM-DD&top=10 (default:
+the last 30 days, at most REPORT_MAX_DAYS) returns revenue per day per
+category, totals with the average basket size, and the best selling
+products. It reads only the rollup tables (see rollups.py), three
+indexed range reads bounded by the number of days and categories, so it
+costs the same at a thousand orders as at ten million. Orders show up
+once their roll_up_sales job has run.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from .models import DailyCategorySales, DailySales, ProductSales
+
+REPORT_DEFAULT_DAYS = 30
+REPORT_MAX_DAYS = 366
+TOP_PRODUCTS_MAX = 100
+
+
+def _json(data, status=200):
+    response = JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder, json_dumps_params={'separators': (',', ':')},
+    )
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+def _range(request):
+    """The requested [from, to] days; raises ValueError for bad input."""
+    today = timezone.localdate()
+    end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+    if request.GET.get('from'):
+        start = date.fromisoformat(request.GET['from'])
+    else:
+        start = end - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    if start > end or (end - start).days >= REPORT_MAX_DAYS:
+        raise ValueError(f"from must be on or before to, at most {REPORT_MAX_DAYS} days apart")
+    return start, end
+
+
+@require_safe
+def sales(request):
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Authentication required.'}, status=401)
+    if not request.user.has_perm('homepage.view_dailysales'):
+        return _json({'detail': 'Not allowed to view sales reports.'}, status=403)
+    try:
+        start, end = _range(request)
+        top = min(max(int(request.GET.get('top', 10)), 0), TOP_PRODUCTS_MAX)
+    except ValueError as e:
+        return _json({'detail': str(e)}, status=400)
+
+    days = {
+        row['day']: {
+            'day': row['day'], 'orders': row['orders'], 'units': row['units'],
+            'revenue': _money(row['revenue']), 'categories': {},
+        }
+        for row in DailySales.objects.filter(day__range=(start, end)).order_by('day')
+        .values('day', 'orders', 'units', 'revenue')
+    }
+    for row in (
+        DailyCategorySales.objects.filter(day__range=(start, end))
+        .values_list('day', 'category', 'units', 'revenue')
+    ):
+        day, category, units, revenue = row
+        if day in days:
+            days[day]['categories'][category] = {'units': units, 'revenue': _money(revenue)}
+
+    orders = sum(day['orders'] for day in days.values())
+    units = sum(day['units'] for day in days.values())
+    revenue = sum((day['revenue'] for day in days.values()), Decimal(0))
+    best = (
+        ProductSales.objects.filter(units__gt=0).order_by('-units', 'product')
+        .values('product_id', 'product__name', 'units', 'revenue')[:top]
+    )
+    return _json({
+        'from': start,
+        'to': end,
+        'days': list(days.values()),
+        'totals': {
+            'orders': orders,
+            'units': units,
+            'revenue': _money(revenue),
+            'average_basket_units': round(units / orders, 2) if orders else 0,
+            'average_basket_revenue': _money(revenue / orders) if orders else _money(0),
+        },
+        'top_products': [
+            {'product_id': row['product_id'], 'name': row['product__name'],
+             'units': row['units'], 'revenue': _money(row['revenue'])}
+            for row in best
+        ],
+    })
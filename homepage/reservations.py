@@ -0,0 +1,174 @@
+# homepage/reservations.py
+"""
+Time-limited stock holds.
+
+Adding a product to a cart holds one unit of it for RESERVATION_TTL
+seconds. Product.reserved counts every held unit, and a hold is only
+granted by a conditional UPDATE (stock >= reserved + qty). Concurrent
+shoppers therefore can never hold more than is in stock. Expired holds
+are released in bulk by release_expired(). The release_reservations
+command runs it on a schedule, and reserve() also runs it for the
+product it touches.
+
+Holds are deleted with DELETE ... RETURNING, so the units given back to
+Product.reserved are exactly the rows that were removed, even when a
+sweep and a cart change race.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .catalog import bump_catalog_version, bump_holds_version
+from .models import Product, StockReservation
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'RESERVATION_TTL', 15 * 60))
+
+
+def owner_of(request, create=True):
+    """The hold owner for a request: the user, or the guest's cart key."""
+    if request.user.is_authenticated:
+        return {'user': request.user}
+    return guest_owner(request.guest_cart, create)
+
+
+def guest_owner(guest_cart, create=True):
+    """
+    Guest holds are keyed by the guest cart key (see cart_store.py). A cart
+    without a key gets one, or None is returned when `create` is False.
+    """
+    key = guest_cart.get_key(create)
+    return {'session_key': key} if key else None
+
+
+def _owner_sql(owner):
+    if 'user' in owner:
+        return 'user_id = %s', owner['user'].pk
+    return 'session_key = %s', owner['session_key']
+
+
+def _delete_returning(where, params):
+    """Delete matching holds; return {product_id: units} for the rows removed."""
+    table = StockReservation._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {where} RETURNING product_id, quantity', params)
+        released = Counter()
+        for product_id, quantity in cursor.fetchall():
+            released[product_id] += quantity
+    return released
+
+
+def _give_back(released):
+    """Subtract released units from Product.reserved in one UPDATE."""
+    if not released:
+        return
+    transaction.on_commit(bump_holds_version)
+    if Product.objects.filter(pk__in=released, reserved__gte=F('stock')).exists():
+        transaction.on_commit(bump_catalog_version)  # back in stock for display
+    Product.objects.filter(pk__in=released).update(
+        reserved=F('reserved') - Case(
+            *[When(pk=pk, then=Value(units)) for pk, units in released.items()],
+            default=Value(0),
+        )
+    )
+
+
+def release_expired(now=None, product_ids=None):
+    """Release every expired hold (or only those on `product_ids`). Returns units released."""
+    now = now or timezone.now()
+    where = 'expires_at <= %s'
+    params = [connection.ops.adapt_datetimefield_value(now)]
+    if product_ids is not None:
+        where += ' AND product_id IN (%s)' % ', '.join(['%s'] * len(product_ids))
+        params += list(product_ids)
+    with transaction.atomic():
+        released = _delete_returning(where, params)
+        _give_back(released)
+    return sum(released.values())
+
+
+def reserve(product_id, owner, quantity=1):
+    """
+    Hold `quantity` more units of a product for `owner` and push the hold's
+    expiry out by the TTL. Returns False if not enough free stock.
+    """
+    expires_at = timezone.now() + reservation_ttl()
+    with transaction.atomic():
+        release_expired(product_ids=[product_id])
+        held = Product.objects.filter(
+            pk=product_id, available=True, stock__gte=F('reserved') + quantity,
+        ).update(reserved=F('reserved') + quantity)
+        if not held:
+            return False
+
+        holds = StockReservation.objects.filter(product_id=product_id, **owner)
+        if not holds.update(quantity=F('quantity') + quantity, expires_at=expires_at):
+            try:
+                with transaction.atomic():
+                    StockReservation.objects.create(
+                        product_id=product_id, quantity=quantity, expires_at=expires_at, **owner
+                    )
+            except IntegrityError:  # the same owner created it concurrently
+                holds.update(quantity=F('quantity') + quantity, expires_at=expires_at)
+
+        transaction.on_commit(bump_holds_version)
+        if Product.objects.filter(pk=product_id, reserved__gte=F('stock')).exists():
+            transaction.on_commit(bump_catalog_version)  # just sold out for display
+    return True
+
+
+def release(product_id, owner, quantity=None):
+    """Give back `quantity` held units (all of them when None). Returns units released."""
+    if owner is None:
+        return 0
+    where, owner_param = _owner_sql(owner)
+    with transaction.atomic():
+        if quantity is not None:
+            shrunk = StockReservation.objects.filter(
+                product_id=product_id, quantity__gt=quantity, **owner
+            ).update(quantity=F('quantity') - quantity)
+            if shrunk:
+                _give_back({product_id: quantity})
+                return quantity
+        released = _delete_returning(f'product_id = %s AND {where}', [product_id, owner_param])
+        _give_back(released)
+    return sum(released.values())
+
+
+def release_all(owner):
+    """Release every hold of one owner, e.g. at checkout. Returns {product_id: units}."""
+    where, owner_param = _owner_sql(owner)
+    with transaction.atomic():
+        released = _delete_returning(where, [owner_param])
+        _give_back(released)
+    return released
+
+
+def transfer_guest_holds(guest_key, user):
+    """Move a guest cart's holds to the user who just logged in, merging per product."""
+    if not guest_key:
+        return
+    with transaction.atomic():
+        guest = dict(
+            StockReservation.objects.filter(session_key=guest_key).values_list('product_id', 'quantity')
+        )
+        if not guest:
+            return
+        clashing = list(
+            StockReservation.objects.filter(user=user, product_id__in=guest).values_list('product_id', flat=True)
+        )
+        if clashing:
+            StockReservation.objects.filter(user=user, product_id__in=clashing).update(
+                quantity=F('quantity') + Case(
+                    *[When(product_id=pk, then=Value(guest[pk])) for pk in clashing],
+                    default=Value(0),
+                ),
+                expires_at=timezone.now() + reservation_ttl(),
+            )
+            StockReservation.objects.filter(session_key=guest_key, product_id__in=clashing).delete()
+        StockReservation.objects.filter(session_key=guest_key).update(user=user, session_key='')
@@ -0,0 +1,124 @@
+# homepage/rollups.py
+"""
+Sales rollups: summary tables the sales report reads instead of
+Order/OrderItem.
+
+- DailySales: orders, units and revenue per day. Average basket size is
+  units / orders and revenue / orders.
+- DailyCategorySales: units and revenue per day per category.
+- ProductSales: units and revenue per product.
+
+A report over any date range therefore reads at most one row per day
+(and per category), however many orders were placed.
+
+Checkout queues a roll_up_sales job for each order (see tasks.py). The
+job adds the order into the tables. Order.rolled_up marks the orders
+already counted: an order is claimed by flipping the flag in the same
+transaction as the increments, so a retried or duplicated job never
+counts an order twice. Each batch costs a fixed number of queries: three
+aggregates, and one batched upsert per table that adds the increments.
+
+`manage.py rebuild_sales_rollups` empties the tables and counts every
+order again in chunks. With --pending it only catches up on orders that
+were not counted. Days are calendar days in TIME_ZONE.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from .models import DailyCategorySales, DailySales, Order, OrderItem, ProductSales
+
+REBUILD_CHUNK = 2000
+
+
+class RollupConflict(Exception):
+    """Another worker claimed some of the same orders; retry later."""
+
+
+def _increment(model, key_fields, totals):
+    """
+    Add {key tuple: {field: amount}} to `model`'s rows, creating the missing
+    ones: INSERT ... ON CONFLICT DO UPDATE SET f = f + excluded.f, which
+    SQLite and Postgres both speak and the ORM cannot express.
+    """
+    if not totals:
+        return
+    value_fields = list(next(iter(totals.values())))
+    fields = [model._meta.get_field(name) for name in key_fields + value_fields]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(field.column) for field in fields]
+    keys, values = columns[:len(key_fields)], columns[len(key_fields):]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+        + ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in values)
+    )
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, key + tuple(amounts.values()))]
+        for key, amounts in totals.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _count(order_ids):
+    """Add these orders' lines to all three rollups."""
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    line_revenue = Sum(F('price') * F('quantity'))
+
+    days = {}
+    for row in (
+        Order.objects.filter(pk__in=order_ids)
+        .annotate(day=TruncDate('created_at')).values('day').annotate(orders=Count('id')).order_by()
+    ):
+        days[(row['day'],)] = {'orders': row['orders'], 'units': 0, 'revenue': 0}
+
+    categories = {}
+    for row in (
+        items.annotate(day=TruncDate('order__created_at'), category=F('product__category'))
+        .values('day', 'category').annotate(units=Sum('quantity'), revenue=line_revenue).order_by()
+    ):
+        categories[(row['day'], row['category'])] = {'units': row['units'], 'revenue': row['revenue']}
+        day = days[(row['day'],)]
+        day['units'] += row['units']
+        day['revenue'] += row['revenue']
+
+    products = {
+        (row['product_id'],): {'units': row['units'], 'revenue': row['revenue']}
+        for row in items.values('product_id').annotate(units=Sum('quantity'), revenue=line_revenue).order_by()
+    }
+
+    _increment(DailySales, ['day'], days)
+    _increment(DailyCategorySales, ['day', 'category'], categories)
+    _increment(ProductSales, ['product'], products)
+
+
+def roll_up(order_ids):
+    """Count these orders into the rollups, each exactly once. Returns how many were counted."""
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=order_ids, rolled_up=False).values_list('pk', flat=True)
+        )
+        if not ids:
+            return 0
+        if Order.objects.filter(pk__in=ids, rolled_up=False).update(rolled_up=True) != len(ids):
+            raise RollupConflict(f"Orders {ids} were claimed concurrently")
+        _count(ids)
+    return len(ids)
+
+
+def roll_up_pending(limit=REBUILD_CHUNK):
+    """Count up to `limit` of the orders not rolled up yet, oldest first. Returns how many."""
+    ids = list(Order.objects.filter(rolled_up=False).order_by('pk').values_list('pk', flat=True)[:limit])
+    return roll_up(ids) if ids else 0
+
+
+def reset():
+    """Empty the rollups and mark every order as not counted, in one transaction."""
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        ProductSales.objects.all().delete()
+        Order.objects.filter(rolled_up=True).update(rolled_up=False)
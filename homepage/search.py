@@ -0,0 +1,115 @@
+# homepage/search.py
+"""
+Product search index.
+
+The backend is picked with the PRODUCT_SEARCH_BACKEND setting:
+
+- SQLiteFTSBackend: an FTS5 table kept in sync with Product saves and
+  deletes (see signals.py). Prefix matching, bm25 ranking.
+- DatabaseSearchBackend: plain `name__icontains`, for databases without
+  an index of their own.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    def search(self, query, category=None, limit=None):
+        """Return matching product ids, best match first."""
+        raise NotImplementedError
+
+    def index(self, products):
+        """Add or refresh the given products in the index."""
+
+    def remove(self, product_ids):
+        """Drop the given product ids from the index."""
+
+    def rebuild(self):
+        """Re-index the whole catalog. Returns the number of indexed products."""
+        return 0
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    def search(self, query, category=None, limit=None):
+        products = Product.objects.filter(name__icontains=query)
+        if category:
+            products = products.filter(category__iexact=category)
+        return list(products.order_by('name', 'id').values_list('id', flat=True)[:limit or search_limit()])
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    table = 'homepage_product_fts'
+
+    @staticmethod
+    def build_match(query, category=None):
+        """
+        Turn free text into an FTS5 expression: every word must match the
+        start of a word in the product name. Words are quoted, so user input
+        can never be parsed as FTS syntax.
+        """
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return None
+        terms = ['name : "%s"*' % token for token in tokens]
+        if category:
+            terms.append('category : "%s"' % category.replace('"', '""'))
+        return ' AND '.join(terms)
+
+    def search(self, query, category=None, limit=None):
+        match = self.build_match(query, category)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s',
+                [match, limit or search_limit()],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, products):
+        rows = [(p.pk, p.name, p.category) for p in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {self.table} (rowid, name, category) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, category) '
+                f'SELECT id, name, category FROM {Product._meta.db_table}'
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+def search_limit():
+    return getattr(settings, 'PRODUCT_SEARCH_LIMIT', 100)
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'homepage.search.DatabaseSearchBackend')
+    return import_string(path)()
+
+
+def search_products(query, category=None, limit=None):
+    """Products matching `query`, ranked by relevance."""
+    ids = get_search_backend().search(query, category=category, limit=limit)
+    found = Product.objects.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
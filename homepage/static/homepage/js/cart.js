@@ -0,0 +1,85 @@
+// homepage/static/homepage/js/cart.js
+// Cart forms carrying data-cart-endpoint are POSTed to the JSON cart API
+// (homepage/cart_api.py) and the page is patched from the reply. Without
+// JavaScript they submit to the redirecting views. Each click gets one
+// Idempotency-Key, reused on the retry, so a lost reply never adds twice.
+// A 403 means no CSRF cookie yet (the shared pages get it from cart_badge,
+// see visitor.js): fetch it and send the click once more.
+(function () {
+  var badgeUrl = document.currentScript.dataset.badgeUrl;
+
+  function csrfToken() {
+    var match = document.cookie.match(/(?:^|; )csrftoken=([^;]*)/);
+    return match ? decodeURIComponent(match[1]) : "";
+  }
+
+  function setText(selector, text, root) {
+    (root || document).querySelectorAll(selector).forEach(function (el) { el.textContent = text; });
+  }
+
+  function newKey() {
+    if (window.crypto && crypto.randomUUID) { return crypto.randomUUID(); }
+    return String(Date.now()) + Math.random().toString(16).slice(2);
+  }
+
+  function failure(status) {
+    var message = status === 403
+      ? "Your session has expired. Please reload the page and try again."
+      : "Something went wrong (" + status + "). Please try again.";
+    return {ok: false, body: {message: message}};
+  }
+
+  function post(url, key, retries, csrfRefreshed) {
+    return fetch(url, {
+      method: "POST",
+      credentials: "same-origin",
+      headers: {"X-CSRFToken": csrfToken(), "Idempotency-Key": key, "Accept": "application/json"}
+    }).then(function (r) {
+      if (r.status === 409 && r.headers.get("Retry-After") && retries) {  // the first try is still running
+        return new Promise(function (done) { setTimeout(done, 1000); }).then(function () { return post(url, key, retries - 1, csrfRefreshed); });
+      }
+      if (r.status === 403 && !csrfRefreshed && badgeUrl) {  // refused before the view ran, so the key is unused
+        return fetch(badgeUrl, {credentials: "same-origin", headers: {"Accept": "application/json"}})
+          .then(function () { return post(url, key, retries, true); });
+      }
+      if ((r.headers.get("Content-Type") || "").indexOf("application/json") !== 0) {
+        return failure(r.status);  // e.g. Django's HTML error pages
+      }
+      return r.json().then(function (body) { return {ok: r.ok, body: body}; });
+    }, function (error) {
+      if (retries) { return post(url, key, retries - 1, csrfRefreshed); }
+      throw error;
+    });
+  }
+
+  function apply(state, button) {
+    setText("[data-cart-count]", state.cart.count ? String(state.cart.count) : "");
+    setText("[data-cart-total]", state.cart.total);
+    var row = document.querySelector('[data-cart-line="' + state.product_id + '"]');
+    if (row && state.quantity === 0) {
+      row.remove();
+      if (!state.cart.count) { window.location.reload(); }  // show the empty cart
+    } else if (row) {
+      setText("[data-line-quantity]", String(state.quantity), row);
+      setText("[data-line-subtotal]", state.subtotal, row);
+    }
+    if (button && button.hasAttribute("data-cart-added")) {
+      var label = button.textContent;
+      button.textContent = "Added ✓";
+      setTimeout(function () { button.textContent = label; }, 1500);
+    }
+  }
+
+  document.addEventListener("submit", function (event) {
+    var form = event.target.closest("form[data-cart-endpoint]");
+    if (!form) { return; }
+    event.preventDefault();
+    if (form.dataset.busy) { return; }
+    form.dataset.busy = "1";
+    post(form.dataset.cartEndpoint, newKey(), 2)
+      .then(function (reply) {
+        if (reply.ok) { apply(reply.body, form.querySelector("button")); } else { window.alert(reply.body.message); }
+      }, function () { window.alert("Could not reach the shop. Please try again."); })
+      .then(function () { delete form.dataset.busy; });
+  });
+})();
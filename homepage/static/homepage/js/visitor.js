@@ -0,0 +1,22 @@
+// homepage/static/homepage/js/visitor.js
+// Per-visitor bits of a shared, cached page (see homepage/page_cache.py):
+// user links, cart badge and the CSRF token of the page's forms.
+(function () {
+  var badgeUrl = document.currentScript.dataset.badgeUrl;
+  fetch(badgeUrl, {credentials: "same-origin", headers: {"Accept": "application/json"}})
+    .then(function (r) { return r.ok ? r.json() : null; })
+    .then(function (state) {
+      if (!state) { return; }
+      document.querySelectorAll("[data-cart-count]").forEach(function (el) {
+        el.textContent = state.cart_count ? String(state.cart_count) : "";
+      });
+      document.querySelectorAll("[data-username]").forEach(function (el) { el.textContent = state.username; });
+      document.querySelectorAll("[data-visitor]").forEach(function (el) {
+        el.hidden = (el.dataset.visitor === "user") !== state.authenticated;
+      });
+      var token = document.cookie.match(/(?:^|; )csrftoken=([^;]*)/);
+      document.querySelectorAll("input[name=csrfmiddlewaretoken]").forEach(function (el) {
+        if (token) { el.value = decodeURIComponent(token[1]); }
+      });
+    });
+})();
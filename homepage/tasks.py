@@ -0,0 +1,60 @@
+# homepage/tasks.py
+"""
+Background tasks run by `manage.py run_workers` (see jobs.py).
+
+checkout.place_order enqueues the receipt, the low-stock check and the
+sales rollup inside its transaction instead of doing the work in the
+request; `restock_products` enqueues a ledger compaction for when its
+movements have settled. Each task takes plain JSON arguments and can
+safely run twice.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+from django.template.loader import render_to_string
+
+from . import ledger, rollups
+from .jobs import task
+from .models import Order, Product
+
+logger = logging.getLogger(__name__)
+
+
+@task('send_order_receipt', max_attempts=8)
+def send_order_receipt(order_id):
+    """Email the customer a receipt for their order."""
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None:
+        return  # deleted since; nothing to send
+    items = list(order.items.only('product_name', 'quantity', 'price'))
+    body = render_to_string('homepage/emails/order_receipt.txt', {'order': order, 'items': items})
+    send_mail(f"Your order #{order.pk}", body, None, [order.user.email])
+
+
+@task('check_low_stock', max_attempts=3)
+def check_low_stock(product_ids):
+    """Warn the admins about products whose stock fell to LOW_STOCK_THRESHOLD or below."""
+    threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+    low = list(
+        Product.objects.filter(pk__in=product_ids, stock__lte=threshold)
+        .order_by('stock', 'pk')
+        .values_list('name', 'stock')
+    )
+    if not low:
+        return
+    lines = '\n'.join(f"{name}: {stock} left" for name, stock in low)
+    logger.warning("Low stock after checkout:\n%s", lines)
+    mail_admins(f"Low stock: {len(low)} product(s)", lines)
+
+
+@task('compact_stock_ledger', max_attempts=3)
+def compact_stock_ledger():
+    """Fold pending restocks into Product.stock (see ledger.py)."""
+    ledger.compact()
+
+
+@task('roll_up_sales', max_attempts=10)
+def roll_up_sales(order_ids):
+    """Count orders into the sales rollups (see rollups.py); each order counts once."""
+    rollups.roll_up(order_ids)
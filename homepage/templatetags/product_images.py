@@ -0,0 +1,33 @@
+# homepage/templatetags/product_images.py
+"""{% product_image product %}: responsive thumbnails for a product card."""
+from django import template
+
+from ..images import FORMATS, THUMBNAIL_WIDTHS, thumbnail_height, thumbnail_url
+
+register = template.Library()
+
+# Cards are full width on phones and about a grid column elsewhere.
+CARD_SIZES = '(max-width: 600px) 100vw, 260px'
+
+
+def _field(product, name):
+    # Views pass model instances or .values() rows.
+    return product.get(name, '') if isinstance(product, dict) else getattr(product, name, '')
+
+
+@register.inclusion_tag('homepage/_product_image.html')
+def product_image(product, sizes=CARD_SIZES, loading='lazy'):
+    image, digest = _field(product, 'image'), _field(product, 'image_hash')
+    context = {'name': _field(product, 'name'), 'image': image, 'sizes': sizes, 'loading': loading}
+    if digest and _field(product, 'image_source') == image:
+        default = THUMBNAIL_WIDTHS[len(THUMBNAIL_WIDTHS) // 2]
+        context.update({
+            'sources': [
+                (mime, ', '.join(f'{thumbnail_url(digest, w, ext)} {w}w' for w in THUMBNAIL_WIDTHS))
+                for ext, (_, mime) in FORMATS.items()
+            ],
+            'src': thumbnail_url(digest, default, 'jpg'),
+            'width': default,
+            'height': thumbnail_height(default),
+        })
+    return context
@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock, skipUnless
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail, signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from . import assets, idempotency, images, jobs, ledger, metrics, replicas, rollups
+from .benchmarking import compare
+from myproject1.dbconfig import database_from_env, replicas_from_env
+from .cart import cart_summary
+from .cart_store import SALT, decode_lines, encode_lines
+from .catalog import CHANGED_AT_KEY, bump_catalog_version
+from .checkout import InsufficientStockError, place_order
+from .models import (
+    Cart, CartItem, Customer, DailyCategorySales, DailySales, IdempotencyKey, Job, Order, OrderItem, Product,
+    ProductSales, StockCompaction, StockMovement, StockReservation,
+)
+from .reservations import release, release_expired, reserve
+from .search import search_products
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = Customer.objects.create_user(email='a@example.com', password='pw', username='a')
+        self.cart = Cart.objects.create(user=self.user)
+        self.apple = Product.objects.create(name='Apple', price=Decimal('2.50'), stock=3, category='Fruit')
+        self.fish = Product.objects.create(name='Fish', price=Decimal('10.00'), stock=1, category='Fish')
+
+    def test_place_order(self):
+        CartItem.objects.create(cart=self.cart, product=self.apple, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.fish, quantity=1)
+
+        order = place_order(self.user)
+
+        self.assertEqual(order.total_price, Decimal('15.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.assertFalse(self.cart.items.exists())
+        self.apple.refresh_from_db()
+        self.fish.refresh_from_db()
+        self.assertEqual((self.apple.stock, self.apple.available), (1, True))
+        self.assertEqual((self.fish.stock, self.fish.available), (0, False))
+
+    def test_insufficient_stock_rolls_back(self):
+        CartItem.objects.create(cart=self.cart, product=self.apple, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.fish, quantity=2)
+
+        with self.assertRaises(InsufficientStockError):
+            place_order(self.user)
+
+        self.assertFalse(Order.objects.exists())
+        self.apple.refresh_from_db()
+        self.assertEqual(self.apple.stock, 3)
+        self.assertEqual(self.cart.items.count(), 2)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.salmon = Product.objects.create(name='Atlantic Salmon', price=Decimal('9.00'), category='Fish')
+        self.salami = Product.objects.create(name='Salami', price=Decimal('4.00'), category='Meat')
+        Product.objects.create(name='Banana', price=Decimal('1.00'), category='Fruit')
+
+    def test_prefix_match_and_category_filter(self):
+        self.assertCountEqual(search_products('sal'), [self.salmon, self.salami])
+        self.assertEqual(search_products('sal', category='Fish'), [self.salmon])
+        self.assertEqual(search_products('sal" OR "*'), [])  # FTS syntax is treated as text
+
+    def test_index_follows_saves_and_deletes(self):
+        self.salami.name = 'Chorizo'
+        self.salami.save()
+        self.assertEqual(search_products('sal'), [self.salmon])
+        self.salmon.delete()
+        self.assertEqual(search_products('sal'), [])
+
+    def test_json_endpoint(self):
+        response = self.client.get(reverse('product_search_api'), {'q': 'salm'})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Atlantic Salmon'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        for i, price in enumerate(['3.00', '1.00', '2.00', '1.00', '5.00']):
+            Product.objects.create(name=f'P{i}', price=Decimal(price), category='Fruit')
+        self.expected = list(Product.objects.order_by('price', 'id').values_list('id', flat=True))
+
+    def walk(self, direction, cursor):
+        response = self.client.get(reverse('product_search_api'), {'sort': 'price', 'per_page': 2, 'cursor': cursor})
+        data = response.json()
+        return [r['id'] for r in data['results']], data[direction]
+
+    def test_forward_and_back(self):
+        seen, cursor = [], ''
+        while cursor is not None:
+            ids, cursor = self.walk('next', cursor)
+            seen += ids
+        self.assertEqual(seen, self.expected)
+
+        _, next_cursor = self.walk('next', '')
+        page2, _ = self.walk('next', next_cursor)
+        self.assertEqual(page2, self.expected[2:4])
+        _, prev_cursor = self.walk('previous', next_cursor)
+        page1, prev_cursor = self.walk('previous', prev_cursor)
+        self.assertEqual(page1, self.expected[:2])
+        self.assertIsNone(prev_cursor)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        ids, _ = self.walk('next', 'garbage')
+        self.assertEqual(ids, self.expected[:2])
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f'Herring {n}', price=Decimal('2.50'), stock=n, available=n > 0, category='Fish')
+            for n in range(20)
+        ]
+
+    def test_etag_revalidation_skips_the_database(self):
+        url = reverse('api_products')
+        response = self.client.get(url, {'category': 'fish', 'per_page': 5})
+        self.assertEqual(len(response.json()['results']), 5)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'category': 'fish', 'per_page': 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = 'Sprat'
+            self.products[0].save()  # post_save bumps the catalog version
+        response = self.client.get(url, {'category': 'fish', 'per_page': 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_categories_and_gzip(self):
+        detail = self.client.get(reverse('api_product_detail', args=[self.products[3].pk])).json()
+        self.assertEqual((detail['name'], detail['price'], detail['stock']), ('Herring 3', '2.50', 3))
+        self.assertEqual(self.client.get(reverse('api_product_detail', args=[999999])).status_code, 404)
+
+        response = self.client.get(reverse('api_categories'))
+        self.assertEqual(response.json()['results'], [{'category': 'Fish', 'count': 20, 'available': 19}])
+
+        response = self.client.get(reverse('api_products'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+
+    def test_holds_change_the_etag(self):
+        url = reverse('api_product_detail', args=[self.products[10].pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_to_cart', args=[self.products[10].pk]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['stock']), (200, 9))
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('remove_from_cart', args=[self.products[10].pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_stock_held_in_carts_is_not_offered(self):
+        held, partly = self.products[2], self.products[5]
+        reserve(held.pk, {'session_key': 'guest-a'}, quantity=2)
+        reserve(partly.pk, {'session_key': 'guest-b'}, quantity=3)
+        detail = self.client.get(reverse('api_product_detail', args=[held.pk])).json()
+        self.assertEqual((detail['stock'], detail['available']), (0, False))
+        detail = self.client.get(reverse('api_product_detail', args=[partly.pk])).json()
+        self.assertEqual((detail['stock'], detail['available']), (2, True))
+
+        rows = {row['id']: row for row in self.client.get(reverse('api_products'), {'per_page': 50}).json()['results']}
+        self.assertEqual((rows[held.pk]['stock'], rows[held.pk]['available']), (0, False))
+        self.assertNotIn('reserved', rows[partly.pk])
+        response = self.client.get(reverse('api_categories'))
+        self.assertEqual(response.json()['results'], [{'category': 'Fish', 'count': 20, 'available': 18}])
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Customer.objects.create_user(email='b@example.com', password='pw', username='b')
+        self.pear = Product.objects.create(name='Pear', price=Decimal('1.25'), stock=10, category='Fruit')
+        self.client.force_login(self.user)
+
+    def test_rendering_does_not_create_a_cart(self):
+        self.client.get(reverse('view_cart'))
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_summary_is_cached_and_invalidated(self):
+        self.client.post(reverse('add_to_cart', args=[self.pear.id]))
+        self.client.post(reverse('add_to_cart', args=[self.pear.id]))
+        self.assertEqual(cart_summary(self.user), {'count': 2, 'total': Decimal('2.50')})
+        with self.assertNumQueries(0):
+            cart_summary(self.user)
+
+        self.client.post(reverse('decrease_quantity', args=[self.pear.id]))
+        self.assertEqual(cart_summary(self.user)['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.user)
+        self.assertEqual(cart_summary(self.user)['count'], 0)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Item {i}', price=Decimal('1.00'), stock=100, category='Grocery')
+            for i in range(50)
+        ]
+        lines = {p.id: 2 for p in self.products}
+        lines[999999] = 1  # deleted product
+        self.client.cookies['cart'] = signing.Signer(salt=SALT).sign(f'guestkey.{encode_lines(lines)}')
+
+    def test_view_cart_query_count_is_constant(self):
+        with self.assertNumQueries(1):  # in_bulk; the cart comes from the cookie
+            response = self.client.get(reverse('view_cart'))
+        self.assertEqual(len(response.context['items']), 50)
+        self.assertEqual(response.context['total'], Decimal('100.00'))
+
+    def test_login_merges_with_one_upsert(self):
+        user = Customer.objects.create_user(email='c@example.com', password='pw', username='c')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('login'), {'email': 'c@example.com', 'password': 'pw'})
+
+        self.assertEqual(cart.items.count(), 50)
+        self.assertEqual(cart.items.get(product=self.products[0]).quantity, 5)
+        self.assertEqual(self.client.cookies['cart'].value, '')  # cleared
+
+    def test_guest_clicks_do_not_write_the_session(self):
+        product = self.products[0]
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('add_to_cart', args=[product.id]))
+            self.client.post(reverse('add_to_cart', args=[product.id]))
+            self.client.post(reverse('decrease_quantity', args=[product.id]))
+            self.client.get(reverse('product_list'))
+        self.assertFalse([q for q in captured if 'django_session' in q['sql']])
+        self.assertNotIn('sessionid', self.client.cookies)
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_count'], 102)  # 101 from setUp
+        self.assertEqual(StockReservation.objects.get(session_key='guestkey').quantity, 1)
+
+    @override_settings(CART_STORE='homepage.cart_store.CacheCartStore')
+    def test_cache_store_round_trip(self):
+        self.client.cookies.clear()
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+        self.client.post(reverse('add_to_cart', args=[self.products[1].id]))
+        key = signing.Signer(salt=SALT).unsign(self.client.cookies['cart'].value)
+        self.assertEqual(decode_lines(cache.get(f'guest-cart:{key}')), {self.products[0].id: 1, self.products[1].id: 1})
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart_count'], 2)
+
+
+
+class CartApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.melon = Product.objects.create(name='Melon', price=Decimal('2.50'), stock=10, category='Fruit')
+
+    def post(self, name, product_id, **kwargs):
+        return self.client.post(reverse(name, args=[product_id]), **kwargs)
+
+    def test_guest_line_changes_return_the_line_and_summary(self):
+        self.post('api_cart_add', self.melon.id)
+        reply = self.post('api_cart_add', self.melon.id).json()
+        self.assertEqual(reply, {
+            'product_id': self.melon.id, 'quantity': 2, 'subtotal': '5.00',
+            'cart': {'count': 2, 'total': '5.00'},
+        })
+        reply = self.post('api_cart_set', self.melon.id, data={'quantity': 5}, content_type='application/json').json()
+        self.assertEqual(reply['cart']['count'], 5)
+        self.assertEqual(self.post('api_cart_decrease', self.melon.id).json()['quantity'], 4)
+        self.melon.refresh_from_db()
+        self.assertEqual(self.melon.reserved, 4)
+
+        self.assertEqual(self.post('api_cart_remove', self.melon.id).json()['cart'], {'count': 0, 'total': '0.00'})
+        self.melon.refresh_from_db()
+        self.assertEqual(self.melon.reserved, 0)
+
+    def test_user_add_is_a_few_queries_and_refuses_missing_stock(self):
+        user = Customer.objects.create_user(email='m@example.com', password='pw', username='m')
+        self.client.force_login(user)
+        self.post('api_cart_add', self.melon.id)
+        with CaptureQueriesContext(connection) as captured:
+            reply = self.post('api_cart_add', self.melon.id)
+        self.assertEqual(reply.json()['cart'], {'count': 2, 'total': '5.00'})
+        # product, session, user, line, hold (4 incl. the expiry sweep), line update, summary
+        self.assertLessEqual(len([q for q in captured if 'SAVEPOINT' not in q['sql']]), 10)
+        self.assertEqual(cart_summary(user)['count'], 2)
+
+        reply = self.post('api_cart_set', self.melon.id, data={'quantity': 11})
+        self.assertEqual((reply.status_code, reply.json()['error']), (409, 'out_of_stock'))
+        self.assertEqual(CartItem.objects.get(cart__user=user).quantity, 2)
+
+    def test_errors_and_csrf(self):
+        self.assertEqual(self.client.get(reverse('api_cart_add', args=[self.melon.id])).status_code, 405)
+        self.assertEqual(self.post('api_cart_add', 999999).status_code, 404)
+        self.assertEqual(self.post('api_cart_set', self.melon.id, data={'quantity': 'x'}).status_code, 400)
+
+        browser = self.client_class(enforce_csrf_checks=True)
+        self.assertEqual(browser.post(reverse('api_cart_add', args=[self.melon.id])).status_code, 403)
+        token = browser.get(reverse('cart_badge')).cookies['csrftoken'].value
+        reply = browser.post(reverse('api_cart_add', args=[self.melon.id]), HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(reply.status_code, 200)
+
+    def test_cached_page_form_posts_without_javascript(self):
+        browser = self.client_class(enforce_csrf_checks=True)
+        page = browser.get(reverse('product_list'))
+        self.assertNotIn('csrftoken', page.cookies)
+        self.assertContains(page, f'action="{reverse("add_to_cart", args=[self.melon.id])}"')
+        reply = browser.post(reverse('add_to_cart', args=[self.melon.id]))
+        self.assertEqual(reply.status_code, 302)
+        self.assertEqual(browser.get(reverse('view_cart')).context['cart_count'], 1)
+
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.kiwi = Product.objects.create(name='Kiwi', price=Decimal('0.75'), stock=10, category='Fruit')
+        self.user = Customer.objects.create_user(email='i@example.com', password='pw', username='i')
+        self.client.force_login(self.user)
+
+    def test_state_changes_refuse_get(self):
+        self.assertEqual(self.client.get(reverse('add_to_cart', args=[self.kiwi.id])).status_code, 405)
+        self.assertEqual(self.client.get(reverse('checkout')).status_code, 405)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_double_submitted_checkout_places_one_order(self):
+        self.client.post(reverse('add_to_cart', args=[self.kiwi.id]))
+        key = self.client.get(reverse('view_cart')).context['checkout_key']
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(reverse('checkout'), {'idempotency_key': key})
+        again = self.client.post(reverse('checkout'), {'idempotency_key': key})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual((again.status_code, again['Location']), (first.status_code, first['Location']))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.kiwi.refresh_from_db()
+        self.assertEqual(self.kiwi.stock, 9)
+
+    def test_retried_cart_call_replays_and_misuse_is_refused(self):
+        url = reverse('api_cart_add', args=[self.kiwi.id])
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-1')
+        again = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-1')
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-2').json()['quantity'], 2)
+
+        other = reverse('api_cart_remove', args=[self.kiwi.id])
+        self.assertEqual(self.client.post(other, HTTP_IDEMPOTENCY_KEY='k-1').status_code, 422)
+        IdempotencyKey.objects.create(key='k-3', path=url, user=self.user, expires_at=timezone.now() + timedelta(minutes=1))
+        busy = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-3')
+        self.assertEqual((busy.status_code, busy['Retry-After']), (409, '1'))
+
+    def test_stale_in_progress_key_is_taken_over(self):
+        url = reverse('api_cart_add', args=[self.kiwi.id])
+        self.client.post(url)
+        claimed = timezone.now() - timedelta(seconds=31)
+        IdempotencyKey.objects.create(key='k-4', path=url, user=self.user, started_at=claimed,
+                                      expires_at=timezone.now() + timedelta(minutes=1))
+        taken = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-4')
+        self.assertEqual(taken.json()['quantity'], 2)
+        # The presumed-dead first request finishing late stores nothing.
+        idempotency._store('k-4', claimed, HttpResponse('late'))
+        again = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-4')
+        self.assertEqual(again.json(), taken.json())
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        url = reverse('api_cart_add', args=[self.kiwi.id])
+        self.client.post(url, HTTP_IDEMPOTENCY_KEY='old')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY='old').json()['quantity'], 2)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_guest_retry_from_a_fresh_client_gets_the_cart_back(self):
+        url = reverse('api_cart_add', args=[self.kiwi.id])
+        guest = self.client_class()
+        guest.post(url, HTTP_IDEMPOTENCY_KEY='g-1')
+        retry = self.client_class()  # the first response, and its cookie, never arrived
+        again = retry.post(url, HTTP_IDEMPOTENCY_KEY='g-1')
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.cookies['cart'].value, guest.cookies['cart'].value)
+        self.assertEqual(retry.get(reverse('view_cart')).context['cart_count'], 1)
+        key = signing.Signer(salt=SALT).unsign(retry.cookies['cart'].value).partition('.')[0]
+        self.assertEqual(StockReservation.objects.get().session_key, key)
+
+    @override_settings(ROOT_URLCONF='myproject1.urls_async')
+    async def test_async_views_are_idempotent_too(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('add_to_cart', args=[self.kiwi.id])
+        await self.async_client.post(url, headers={'Idempotency-Key': 'a-1'})
+        await self.async_client.post(url, headers={'Idempotency-Key': 'a-1'})
+        self.assertEqual((await CartItem.objects.aget()).quantity, 1)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry = metrics.Registry()
+        self.fig = Product.objects.create(name='Fig', price=Decimal('2.00'), stock=6, category='Fruit')
+        self.user = Customer.objects.create_user(email='j@example.com', password='pw', username='j')
+
+    def run_workers(self, **options):
+        out = io.StringIO()
+        call_command('run_workers', once=True, stdout=out, **options)
+        return out.getvalue()
+
+    @override_settings(ADMINS=[('Admin', 'admin@example.com')], METRICS_ENABLED=True, METRICS_DIR=None)
+    def test_checkout_only_enqueues_and_workers_send_the_mail(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.fig.id]))
+        self.client.post(reverse('add_to_cart', args=[self.fig.id]))
+        self.client.post(reverse('checkout'))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(Job.objects.filter(status=Job.QUEUED).values_list('name', flat=True)),
+            ['check_low_stock', 'roll_up_sales', 'send_order_receipt'],
+        )
+
+        with self.assertLogs('homepage.tasks', 'WARNING'):
+            self.assertIn('Ran 3 jobs', self.run_workers(batch=1))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+        mailed = {message.to[0]: message.body for message in mail.outbox}
+        self.assertIn('2 x Fig', mailed['j@example.com'])
+        self.assertIn('Fig: 4 left', mailed['admin@example.com'])
+        text = metrics.render_prometheus([metrics.registry.snapshot()])
+        self.assertIn('django_jobs_total{job="send_order_receipt",outcome="done"} 1', text)
+        self.assertIn('django_job_duration_seconds_count{job="check_low_stock"} 1', text)
+
+    def test_failures_back_off_then_fail(self):
+        calls = []
+
+        @jobs.task('flaky', max_attempts=2)
+        def flaky(n):
+            calls.append(n)
+            raise RuntimeError('boom')
+        self.addCleanup(jobs.TASKS.pop, 'flaky')
+
+        job = jobs.enqueue('flaky', {'n': 1})
+        with self.assertLogs('homepage.jobs', 'WARNING'):
+            self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), (Job.QUEUED, 1, [1]))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))  # not retried yet
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertEqual(jobs.claim('w'), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('homepage.jobs', 'WARNING'):
+            self.run_workers()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, calls), (Job.FAILED, 2, [1, 1]))
+
+    def test_scheduled_and_stale_jobs(self):
+        later = jobs.enqueue('check_low_stock', {'product_ids': []}, delay=timedelta(minutes=5))
+        self.assertEqual(jobs.claim('w'), [])
+
+        Job.objects.filter(pk=later.pk).update(run_at=timezone.now())
+        first, = jobs.claim('w1', batch=5)
+        self.assertEqual((first.status, first.attempts), (Job.RUNNING, 1))
+        self.assertEqual(jobs.claim('w2', batch=5), [])  # already claimed
+
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(jobs.requeue_stale(timezone.now() + jobs.lease_time() * 2), 1)
+        again, = jobs.claim('w2')
+        self.assertEqual(again.attempts, 2)
+        self.assertEqual(jobs.run(again), 'done')
+
+
+class HomepageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.kale = Product.objects.create(name='Kale', price=Decimal('3.00'), stock=5, category='Veggies')
+
+    def test_steady_state_is_query_free_and_invalidated_on_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Leek', price=Decimal('2.00'), stock=5, category='Veggies')
+        self.client.get(reverse('homepage'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('homepage'))
+        self.assertContains(response, 'Leek')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kale.name = 'Curly Kale'
+            self.kale.save()
+        self.assertContains(self.client.get(reverse('homepage')), 'Curly Kale')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fig = Product.objects.create(name='Fig', price=Decimal('2.00'), stock=5, category='Fruit')
+
+    def test_anonymous_pages_are_shared_and_revalidated(self):
+        url = reverse('product_list')
+        first = self.client.get(url)
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('Last-Modified', first)
+        self.assertFalse(first.has_header('Vary') and 'Cookie' in first['Vary'])
+        self.assertFalse(first.cookies)
+
+        with self.assertNumQueries(0):
+            again = self.client.get(url)
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fig.name = 'Black Fig'
+            self.fig.save()
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], first['ETag'])
+        self.assertContains(fresh, 'Black Fig')
+
+    def test_logged_in_visitors_get_the_same_page(self):
+        anonymous = self.client.get(reverse('homepage'))
+        user = Customer.objects.create_user(email='p@example.com', password='pw', username='pat')
+        self.client.force_login(user)
+        response = self.client.get(reverse('homepage'))
+        self.assertEqual(response['ETag'], anonymous['ETag'])
+        self.assertNotContains(response, 'pat')
+
+    def test_badge_carries_the_visitor_state(self):
+        self.client.post(reverse('add_to_cart', args=[self.fig.id]))
+        response = self.client.get(reverse('cart_badge'))
+        self.assertEqual(response.json(), {'authenticated': False, 'username': '', 'cart_count': 1})
+        self.assertIn('csrftoken', response.cookies)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+@override_settings(ROOT_URLCONF='myproject1.urls_async')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plum = Product.objects.create(name='Plum', price=Decimal('0.50'), stock=10, category='Fruit')
+
+    async def test_catalog_pages(self):
+        response = await self.async_client.get(reverse('homepage'))
+        self.assertContains(response, 'Plum')
+        response = await self.async_client.get(reverse('product_list'), {'q': 'plu'})
+        self.assertContains(response, 'Plum')
+
+    async def test_guest_cart(self):
+        await self.async_client.post(reverse('add_to_cart', args=[self.plum.id]))
+        await self.async_client.post(reverse('add_to_cart', args=[self.plum.id]))
+        await self.async_client.post(reverse('decrease_quantity', args=[self.plum.id]))
+        response = await self.async_client.get(reverse('view_cart'))
+        self.assertEqual(response.context['items'][0]['quantity'], 1)
+        self.assertEqual(response.context['cart_count'], 1)
+
+    async def test_user_cart(self):
+        user = await Customer.objects.acreate(email='d@example.com', username='d')
+        await self.async_client.aforce_login(user)
+        await self.async_client.post(reverse('add_to_cart', args=[self.plum.id]))
+        response = await self.async_client.get(reverse('view_cart'))
+        self.assertEqual(response.context['total'], Decimal('0.50'))
+        await self.async_client.post(reverse('remove_from_cart', args=[self.plum.id]))
+        response = await self.async_client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_count'], 0)
+
+    async def test_line_quantity_is_capped_like_the_sync_views(self):
+        rice = await Product.objects.acreate(name='Rice', price=Decimal('1.00'), stock=500, category='Grocery')
+        user = await Customer.objects.acreate(email='q@example.com', username='q')
+        await self.async_client.aforce_login(user)
+        cart = await Cart.objects.acreate(user=user)
+        await CartItem.objects.acreate(cart=cart, product=rice, quantity=98)
+        await sync_to_async(reserve)(rice.id, {'user': user}, quantity=98)
+        response = await self.async_client.get(reverse('view_cart'))  # caches the summary
+        self.assertEqual(response.context['cart_count'], 98)
+        for _ in range(3):
+            await self.async_client.post(reverse('add_to_cart', args=[rice.id]))
+        self.assertEqual((await CartItem.objects.aget(cart=cart)).quantity, 99)
+        await rice.arefresh_from_db()
+        self.assertEqual(rice.reserved, 99)
+        response = await self.async_client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_count'], 99)  # the version bump refreshed the summary
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = Customer.objects.create_user(email='e@example.com', password='pw', username='e')
+        self.product = Product.objects.create(name='Rice', price=Decimal('5.00'), stock=0, category='Grocery')
+        self.orders = []
+        for _ in range(25):
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=self.product, product_name='Rice', quantity=1, price=Decimal('5.00'))
+                for _ in range(3)
+            ])
+            self.orders.append(order)
+        self.client.force_login(self.user)
+
+    def test_pages_in_constant_queries(self):
+        self.client.get(reverse('order_history'))  # warm the cart summary cache
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('order_history'))
+        orders = response.context['orders']
+        self.assertEqual(len(orders), 20)
+        self.assertEqual(orders[0].id, self.orders[-1].id)
+        self.assertEqual(orders[0].item_count, 3)
+
+        response = self.client.get(reverse('order_history'), {'cursor': response.context['page'].next_cursor})
+        self.assertEqual([o.id for o in response.context['orders']], [o.id for o in reversed(self.orders[:5])])
+
+    def test_detail_does_not_query_per_item(self):
+        self.client.get(reverse('order_detail', args=[self.orders[0].id]))
+        with self.assertNumQueries(4):  # session, user, order, items
+            response = self.client.get(reverse('order_detail', args=[self.orders[0].id]))
+        self.assertContains(response, 'Rice', count=3)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Mango', price=Decimal('2.00'), stock=2, category='Fruit')
+        self.alice = {'session_key': 'alice'}
+        self.bob = {'session_key': 'bob'}
+
+    def test_holds_limit_free_stock(self):
+        self.assertTrue(reserve(self.product.id, self.alice))
+        self.assertTrue(reserve(self.product.id, self.bob))
+        self.assertFalse(reserve(self.product.id, self.bob))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reserved, self.product.free_stock), (2, 0))
+
+        self.assertEqual(release(self.product.id, self.alice, quantity=1), 1)
+        self.assertEqual(release(self.product.id, self.alice), 0)
+        self.assertTrue(reserve(self.product.id, self.bob))
+        self.assertEqual(StockReservation.objects.get(session_key='bob').quantity, 2)
+
+    def test_expired_holds_are_swept(self):
+        reserve(self.product.id, self.alice)
+        reserve(self.product.id, self.alice)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(hours=1)), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_turns_own_holds_into_the_sale(self):
+        user = Customer.objects.create_user(email='f@example.com', password='pw', username='f')
+        self.client.force_login(user)
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))
+        reserve(self.product.id, self.bob)
+        self.client.post(reverse('add_to_cart', args=[self.product.id]))  # sold out: bob holds the other unit
+
+        place_order(user)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (1, 1))
+        self.assertEqual(Order.objects.get(user=user).items.get().quantity, 1)
+
+    def test_sold_out_add_shows_the_error_on_the_cart_page(self):
+        product = Product.objects.create(name='Last Melon', price=Decimal('3.00'), stock=1, category='Fruit')
+        reserve(product.pk, {'session_key': 'someone-else'})
+        response = self.client.post(reverse('add_to_cart', args=[product.pk]), follow=True)
+        self.assertEqual(response.redirect_chain, [(reverse('view_cart'), 302)])
+        self.assertContains(response, 'Sorry, Last Melon is out of stock.')
+        self.assertNotContains(self.client.get(reverse('view_cart')), 'out of stock')  # shown once
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plum = Product.objects.create(sku='P-1', name='Plum', price=Decimal('1.00'), stock=2, category='Fruit')
+        self.pear = Product.objects.create(sku='P-2', name='Pear', price=Decimal('1.00'), stock=5, category='Fruit')
+        self.user = Customer.objects.create_user(email='l@example.com', password='pw', username='l')
+
+    def sell_out_plum(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.plum.id]))
+        self.client.post(reverse('add_to_cart', args=[self.plum.id]))
+        return place_order(self.user)
+
+    def test_sales_are_recorded_and_restocks_folded_in_one_pass(self):
+        order = self.sell_out_plum()
+        sale = StockMovement.objects.get(product=self.plum)
+        self.assertEqual((sale.kind, sale.quantity, sale.settled, sale.order), ('sale', -2, True, order))
+        self.plum.refresh_from_db()
+        self.assertFalse(self.plum.available)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write('sku,quantity,note\nP-1,4,PO 17\nP-2,3,\nP-1,1,\nNOPE,5,\nP-2,-1,\n')
+        self.addCleanup(os.remove, fh.name)
+        out, err = io.StringIO(), io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('restock_products', fh.name, note='Weekly delivery', fold_now=True, stdout=out, stderr=err)
+        self.assertIn('Appended 3 restocks', out.getvalue())
+        self.assertIn('folded 4 movements', out.getvalue())  # the sale is past the watermark too
+        self.assertEqual(err.getvalue().count('Skipping'), 2)
+        self.assertLess(len(queries), 15)
+
+        self.plum.refresh_from_db()
+        self.pear.refresh_from_db()
+        self.assertEqual((self.plum.stock, self.plum.available, self.pear.stock), (5, True, 8))
+        self.assertEqual(
+            list(self.plum.movements.order_by('id').values_list('kind', 'quantity', 'note')),
+            [('sale', -2, ''), ('restock', 4, 'PO 17'), ('restock', 1, 'Weekly delivery')],
+        )
+        self.assertEqual(ledger.compact(settle=timedelta()), 0)
+
+    def test_restock_leaves_unsettled_movements_to_a_queued_compaction(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write('sku,quantity\nP-2,3\n')
+        self.addCleanup(os.remove, fh.name)
+        out = io.StringIO()
+        call_command('restock_products', fh.name, stdout=out, stderr=io.StringIO())
+        self.assertIn('folded 0 settled movements, compaction queued', out.getvalue())
+        self.pear.refresh_from_db()
+        self.assertEqual(self.pear.stock, 5)
+        job = Job.objects.get(name='compact_stock_ledger')
+        self.assertGreaterEqual(job.run_at, timezone.now() + ledger.settle_time() - timedelta(seconds=1))
+
+    def test_compaction_waits_for_the_settle_window_and_never_folds_twice(self):
+        ledger.append([StockMovement(product=self.pear, kind=StockMovement.RESTOCK, quantity=10)])
+        self.assertEqual(ledger.compact(), 0)  # too young
+        self.pear.refresh_from_db()
+        self.assertEqual(self.pear.stock, 5)
+        with self.assertRaises(ValueError):
+            ledger.append([StockMovement(product=self.pear, kind=StockMovement.ADJUSTMENT, quantity=-1)])
+
+        # Another compaction already started from this watermark.
+        StockCompaction.objects.create(after_id=ledger.watermark(), last_id=0)
+        self.assertEqual(ledger.compact(settle=timedelta()), 0)
+        StockCompaction.objects.all().delete()
+        self.assertEqual(ledger.compact(settle=timedelta()), 1)
+        self.pear.refresh_from_db()
+        self.assertEqual(self.pear.stock, 15)
+
+    def test_adjustments_apply_now_and_never_take_held_units(self):
+        reserve(self.pear.id, {'session_key': 'guest'}, quantity=3)
+        self.assertFalse(ledger.adjust(self.pear.id, -3, note='Damaged'))
+        self.assertTrue(ledger.adjust(self.pear.id, -2, note='Damaged'))
+        self.pear.refresh_from_db()
+        self.assertEqual((self.pear.stock, self.pear.available), (3, True))
+        adjustment = self.pear.movements.get()
+        self.assertEqual((adjustment.kind, adjustment.quantity, adjustment.settled), ('adjustment', -2, True))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cod = Product.objects.create(name='Cod', price=Decimal('4.00'), stock=50, category='Fish')
+        self.lime = Product.objects.create(name='Lime', price=Decimal('0.50'), stock=50, category='Fruit')
+        self.users = [
+            Customer.objects.create_user(email=f'r{n}@example.com', password='pw', username=f'r{n}') for n in range(3)
+        ]
+
+    def buy(self, user, *products):
+        self.client.force_login(user)
+        for product in products:
+            self.client.post(reverse('add_to_cart', args=[product.id]))
+        return place_order(user)
+
+    def report(self, **params):
+        return self.client.get(reverse('api_sales_report'), params)
+
+    def test_checkout_jobs_roll_up_each_order_once(self):
+        first = self.buy(self.users[0], self.cod, self.cod, self.lime)
+        self.buy(self.users[1], self.lime)
+        self.assertFalse(DailySales.objects.exists())
+        call_command('run_workers', once=True, stdout=io.StringIO())
+
+        day = DailySales.objects.get()
+        self.assertEqual((day.orders, day.units, day.revenue), (2, 4, Decimal('9.00')))
+        fish = DailyCategorySales.objects.get(category='Fish')
+        self.assertEqual((fish.units, fish.revenue), (2, Decimal('8.00')))
+        self.assertEqual(ProductSales.objects.get(product=self.lime).units, 2)
+
+        self.assertEqual(rollups.roll_up([first.pk]), 0)  # a repeated job counts nothing
+        self.assertEqual(DailySales.objects.get().orders, 2)
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        for user in self.users:
+            self.buy(user, self.cod, self.lime)
+        Order.objects.filter(pk=Order.objects.order_by('pk').first().pk).update(
+            created_at=timezone.now() - timedelta(days=1),
+        )
+        call_command('rebuild_sales_rollups', chunk_size=2, stdout=io.StringIO(), stderr=io.StringIO())
+        rebuilt = list(DailyCategorySales.objects.order_by('day', 'category').values_list('day', 'category', 'units'))
+        self.assertEqual(len(rebuilt), 4)
+        self.assertEqual(sum(DailySales.objects.values_list('orders', flat=True)), 3)
+
+        call_command('rebuild_sales_rollups', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(
+            list(DailyCategorySales.objects.order_by('day', 'category').values_list('day', 'category', 'units')),
+            rebuilt,
+        )
+        self.assertEqual(ProductSales.objects.get(product=self.cod).units, 3)
+
+    def test_report_reads_only_the_rollups(self):
+        for user in self.users:
+            self.buy(user, self.cod, self.lime, self.lime)
+        rollups.roll_up_pending()
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.report().status_code, 403)
+
+        admin = Customer.objects.create_user(email='boss@example.com', password='pw', username='boss', is_superuser=True)
+        self.client.force_login(admin)
+        self.assertEqual(self.report(**{'from': '2020-01-01', 'to': '2024-01-01'}).status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            body = self.report(top=1).json()
+        self.assertFalse([q for q in queries if 'homepage_order' in q['sql']])
+        self.assertLessEqual(len(queries), 5)  # session, user, three rollup reads
+        self.assertEqual(body['totals'], {
+            'orders': 3, 'units': 9, 'revenue': '15.00',
+            'average_basket_units': 3.0, 'average_basket_revenue': '5.00',
+        })
+        self.assertEqual(body['days'][0]['categories']['Fruit'], {'units': 6, 'revenue': '3.00'})
+        self.assertEqual(body['top_products'], [
+            {'product_id': self.lime.id, 'name': 'Lime', 'units': 6, 'revenue': '3.00'},
+        ])
+
+
+class BulkImportExportTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        return path
+
+    def test_import_upserts_by_sku_and_round_trips(self):
+        Product.objects.create(sku='F-1', name='Old Salmon', price=Decimal('1.00'), category='Fish', stock=3)
+        path = self.write('in.csv', (
+            'sku,name,price,stock,category\n'
+            'F-1,Atlantic Salmon,9.50,0,fish\n'
+            'M-1,Salami,4.00,7,Meat\n'
+            'X-1,,1.00,1,Meat\n'
+        ))
+        call_command('import_products', path, batch_size=1, stdout=io.StringIO(), stderr=io.StringIO())
+
+        salmon = Product.objects.get(sku='F-1')
+        self.assertEqual((salmon.name, salmon.price, salmon.available), ('Atlantic Salmon', Decimal('9.50'), False))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(search_products('salam'), [Product.objects.get(sku='M-1')])
+
+        out = os.path.join(self.tmp.name, 'out.jsonl')
+        call_command('export_products', out, stderr=io.StringIO())
+        Product.objects.all().delete()
+        call_command('import_products', out, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(
+            list(Product.objects.order_by('sku').values_list('sku', 'stock')), [('F-1', 0), ('M-1', 7)]
+        )
+
+    def test_import_changes_existing_stock_through_the_ledger(self):
+        herring = Product.objects.create(sku='F-2', name='Herring', price=Decimal('1.00'), category='Fish', stock=5)
+        sprat = Product.objects.create(sku='F-3', name='Sprat', price=Decimal('1.00'), category='Fish', stock=5)
+        reserve(sprat.pk, {'session_key': 'guest'}, quantity=4)
+        path = self.write('in.csv', 'sku,name,price,stock,category\nF-2,Herring,1.00,7,Fish\nF-3,Sprat,1.00,1,Fish\n')
+        err = io.StringIO()
+        call_command('import_products', path, stdout=io.StringIO(), stderr=err)
+
+        herring.refresh_from_db()
+        sprat.refresh_from_db()
+        self.assertEqual((herring.stock, sprat.stock), (7, 5))
+        self.assertIn('F-3: kept its stock', err.getvalue())
+        self.assertEqual(
+            list(StockMovement.objects.values_list('product__sku', 'kind', 'quantity', 'settled')),
+            [('F-2', 'adjustment', 2, True)],
+        )
+
+
+
+@skipUnless(images.Image, "Pillow is not installed")
+class ImageIngestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=os.path.join(self.tmp.name, 'media')))
+
+    def picture(self, name, color):
+        path = os.path.join(self.tmp.name, name)
+        images.Image.new('RGB', (800, 500), color).save(path, 'PNG')
+        return path
+
+    def test_ingest_renders_hashed_thumbnails_once(self):
+        red = self.picture('red.png', 'red')
+        a = Product.objects.create(name='Apple', price=Decimal('1.00'), stock=5, image=red)
+        b = Product.objects.create(name='Cherry', price=Decimal('4.00'), stock=5, image=f'file://{red}')
+        bad = Product.objects.create(name='Ghost', price=Decimal('1.00'), stock=5, image='/no/such/file.png')
+
+        err = io.StringIO()
+        call_command('ingest_product_images', workers=2, stdout=io.StringIO(), stderr=err)
+        self.assertIn(f'product {bad.pk}', err.getvalue())
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual(a.image_hash, b.image_hash)  # same bytes, stored once
+        self.assertEqual(list(images.pending_products()), [bad])
+        original = Path(self.tmp.name, 'media', images.original_name(a.image_hash, 'png'))
+        self.assertEqual(original.read_bytes(), Path(red).read_bytes())
+        files = sorted(Path(self.tmp.name, 'media').rglob('*-*.*'))
+        self.assertEqual(len(files), len(images.THUMBNAIL_WIDTHS) * len(images.FORMATS))
+        with images.Image.open(files[0]) as thumb:
+            self.assertEqual(thumb.size[0] * 3, thumb.size[1] * 4)
+
+        page = self.client.get(reverse('product_list')).content.decode()
+        self.assertIn(images.thumbnail_url(a.image_hash, 240, 'webp') + ' 240w', page)
+        self.assertIn('loading="lazy"', page)
+        response = self.client.get(images.thumbnail_url(a.image_hash, 480, 'webp'))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        a.image = self.picture('blue.png', 'blue')
+        a.save()
+        self.assertIn(a, images.pending_products())
+        self.assertFalse(a.has_thumbnails)
+
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.enterContext(override_settings(
+            STATIC_ROOT=self.tmp.name,
+            SERVE_STATIC=True,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'homepage.assets.CompressedManifestStaticFilesStorage'},
+            },
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_pages_link_hashed_minified_precompressed_assets(self):
+        page = self.client.get(reverse('product_list')).content.decode()
+        self.assertNotIn('<style', page)
+        css_url = next(part for part in page.split('"') if part.startswith('/static/') and part.endswith('.css'))
+        self.assertRegex(css_url, r'products\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(css_url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        css = gzip.decompress(b''.join(response.streaming_content)).decode()
+        source = Path(__file__).parent.joinpath('static/homepage/css/products.css').read_text()
+        self.assertEqual(css, assets.minify_css(source))
+        self.assertLess(len(css), len(source))
+
+        plain = self.client.get(css_url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(b''.join(plain.streaming_content).decode(), css)
+        unhashed = self.client.get('/static/homepage/css/products.css')
+        self.assertNotIn('immutable', unhashed['Cache-Control'])
+        self.assertEqual(
+            self.client.get(css_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+        )
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_DIR=None)
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry = metrics.Registry()
+        Product.objects.create(name='Banana', price=Decimal('1.00'), category='Fruit')
+
+    def test_records_per_view_queries_and_templates(self):
+        self.client.get(reverse('product_list'))
+        self.client.get(reverse('product_list'))
+        text = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('django_http_requests_total{view="product_list",method="GET",status="200"} 2', text)
+        self.assertIn('django_http_request_duration_seconds_count{view="product_list"} 2', text)
+        queries = metrics.registry.histograms[('db_queries_per_request', 'product_list')]
+        self.assertEqual(queries[0], 1)  # the repeat came from the page cache
+        templates = metrics.registry.histograms[('template_render_duration_seconds', 'product_list')]
+        self.assertGreater(templates[-1], 0)
+
+    def test_snapshots_from_other_processes_are_summed(self):
+        self.client.get(reverse('product_list'))
+        other = metrics.registry.snapshot()
+        text = metrics.render_prometheus([metrics.registry.snapshot(), other])
+        self.assertIn('django_http_response_size_bytes_count{view="product_list"} 2', text)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_set(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer s3cre'}).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer s3cret'}).status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_endpoint_is_opt_in(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_generate_and_benchmark_against_baseline(self):
+        out = io.StringIO()
+        call_command(
+            'generate_synthetic_data', products=30, customers=5, order_items=40, seed=7, stdout=out,
+        )
+        self.assertEqual(OrderItem.objects.count(), 40)
+        self.assertEqual(Customer.objects.filter(email__endswith='@synthetic.test').count(), 5)
+
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as fh:
+            call_command('run_benchmarks', iterations=2, warmup=1, output=fh.name, stdout=out)
+            results = json.load(fh)
+        self.assertEqual(results['client']['checkout']['requests'], 2)
+        self.assertGreater(results['client']['view_cart']['queries_per_request'], 0)
+
+        slower = json.loads(json.dumps(results))
+        slower['client']['view_cart']['p95_ms'] = results['client']['view_cart']['p95_ms'] * 2 + 1
+        slower['client']['view_cart']['queries_per_request'] += 1
+        regressed = {(row[1], row[2]) for row in compare(results, slower) if row[-1]}
+        self.assertEqual(regressed, {('view_cart', 'p95_ms'), ('view_cart', 'queries_per_request')})
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite's")
+class QueryPlanTests(TestCase):
+    """Every SELECT behind the hot pages must be index-driven: no table scans, no sorts."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Customer.objects.create_user(email='plan@example.com', username='plan', password='pw')
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Item {n}', price=Decimal(n), stock=50, category=['Fish', 'Fruit'][n % 2])
+            for n in range(1, 8)
+        ])
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+        place_order(self.user)
+
+    def assertIndexed(self, urls, posts=()):
+        with CaptureQueriesContext(connection) as captured:
+            for url in posts:
+                self.client.post(url)
+            for url in urls:
+                self.client.get(url)
+        selects = {q['sql'] for q in captured if q['sql'].startswith('SELECT')}
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[3] for row in cursor.fetchall()]
+            for step in plan:
+                full_scan = step.startswith('SCAN') and 'INDEX' not in step and 'VIRTUAL TABLE' not in step
+                self.assertFalse(full_scan or 'TEMP B-TREE' in step, f"{step}\n  in: {sql}")
+
+    def page_urls(self, query):
+        first = self.client.get(f"{reverse('product_list')}?{query}&per_page=2")
+        return [f"{reverse('product_list')}?{query}&per_page=2", f"{reverse('product_list')}?{first.context['next_query']}"]
+
+    def test_catalog_queries(self):
+        urls = [reverse('homepage'), reverse('api_categories'), reverse('api_product_detail', args=[self.products[0].id])]
+        for query in ['', 'sort=price', 'category=fish', 'category=Fish&sort=price']:
+            urls += self.page_urls(query)
+        self.assertIndexed(urls)
+
+    def test_cart_and_order_queries(self):
+        self.assertIndexed(posts=[reverse('add_to_cart', args=[self.products[1].id])], urls=[
+            reverse('view_cart'),
+            reverse('order_history'),
+            reverse('order_detail', args=[Order.objects.get().id]),
+        ])
+
+
+class DatabaseProfileTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', "SQLite profile")
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_postgres_profile_from_environment(self):
+        env = {'DATABASE_ENGINE': 'postgres', 'DATABASE_NAME': 'shop', 'DATABASE_POOL_MAX_SIZE': '20'}
+        with mock.patch.dict(os.environ, env):
+            db = database_from_env(Path('/srv'))
+        self.assertEqual(db['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(db['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual(db['CONN_MAX_AGE'], 0)  # pooling and persistent connections exclude each other
+
+        with mock.patch.dict(os.environ, {**env, 'DATABASE_REPLICAS': 'ro-1,ro-2:5433'}):
+            replicas = replicas_from_env(db)
+        self.assertEqual(list(replicas), ['replica1', 'replica2'])
+        self.assertEqual((replicas['replica2']['HOST'], replicas['replica2']['PORT']), ('ro-2', '5433'))
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.set(CHANGED_AT_KEY, 0, None)
+        self.probes = []
+        self.pool = replicas.ReplicaPool(probe=lambda alias: self.probes.append(alias) or True)
+        patcher = mock.patch.object(replicas, 'pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.enterContext(mock.patch.object(replicas, '_connect'))  # no replica1 database here
+        self.router = replicas.ReplicaRouter()
+
+        @replicas.replica_reads
+        def view(request):
+            self.routed = [self.router.db_for_read(model) for model in (Product, Order, Customer)]
+            return HttpResponse()
+        self.view = view
+
+    def get(self, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        self.view(request)
+        return self.routed
+
+    def test_catalog_and_history_reads_go_to_a_healthy_replica(self):
+        self.assertEqual(self.get(), ['replica1', 'replica1', None])  # sessions and users stay on the primary
+        self.get()
+        self.assertEqual(self.probes, ['replica1'])  # probed once per interval
+        self.assertIsNone(self.router.db_for_read(Product))  # outside @replica_reads
+        self.view(RequestFactory().post('/'))
+        self.assertEqual(self.routed, [None, None, None])
+
+    def test_writes_sticky_cookie_and_fresh_catalog_changes_use_the_primary(self):
+        @replicas.replica_reads
+        def writes_then_reads(request):
+            self.router.db_for_write(Product)
+            return HttpResponse(self.router.db_for_read(Product) or 'default')
+        self.assertEqual(writes_then_reads(RequestFactory().get('/')).content, b'default')
+
+        self.assertEqual(self.get(primary_until=str(time.time() + 5))[0], None)
+        self.assertEqual(self.get(primary_until='garbage')[0], 'replica1')
+        bump_catalog_version()
+        self.assertEqual(self.get()[0], None)  # the replica may not have the change yet
+
+        user = Customer.objects.create_user(email='rr@example.com', password='pw', username='rr')
+        self.client.force_login(user)
+        product = Product.objects.create(name='Yam', price=Decimal('1.00'), stock=3, category='Veggies')
+        response = self.client.post(reverse('add_to_cart', args=[product.id]))
+        self.assertGreater(float(response.cookies[replicas.STICKY_COOKIE].value), time.time())
+
+    def test_unhealthy_replicas_fall_back_and_other_errors_are_raised(self):
+        self.pool.probe = lambda alias: False
+        self.assertEqual(self.get()[0], None)
+
+        self.pool = replicas.ReplicaPool(probe=lambda alias: True)
+        calls = []
+
+        @replicas.replica_reads
+        def failing(request):
+            calls.append(replicas.current_replica())
+            raise OperationalError('the primary is locked')
+        with mock.patch.object(replicas, 'pool', self.pool):
+            with self.assertRaises(OperationalError):
+                failing(RequestFactory().get('/'))
+            self.assertEqual(calls, ['replica1'])  # not run again
+            self.assertTrue(self.pool.healthy('replica1'))
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Routing against a real second SQLite file, filled by sync_replicas."""
+
+    def setUp(self):
+        cache.clear()
+        cache.set(CHANGED_AT_KEY, 0, None)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        # Registered per test, after the runner has set up the test databases.
+        connections.settings['replica1'] = {
+            **connections['default'].settings_dict, 'NAME': os.path.join(tmp.name, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.drop_replica)
+        self.enterContext(mock.patch.object(type(self), 'databases', {'default', 'replica1'}))
+        self.enterContext(override_settings(DATABASE_REPLICAS=['replica1']))
+        self.enterContext(mock.patch.object(replicas, 'pool', replicas.ReplicaPool()))
+
+    def drop_replica(self):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+
+    def test_catalog_and_history_read_the_replica_and_writes_do_not(self):
+        user = Customer.objects.create_user(email='rp@example.com', password='pw', username='rp')
+        yam = Product.objects.create(name='Yam', price=Decimal('1.00'), stock=3, category='Veggies')
+        Order.objects.create(user=user)
+        call_command('sync_replicas', stdout=io.StringIO())
+        # Changes the replica has not seen yet; update() sends no signal, so no version bump.
+        Product.objects.filter(pk=yam.pk).update(name='Purple Yam')
+        Order.objects.create(user=user)
+        cache.set(CHANGED_AT_KEY, 0, None)
+        self.client.force_login(user)
+
+        with CaptureQueriesContext(connections['replica1']) as on_replica:
+            page = self.client.get(reverse('product_list'))
+            history = self.client.get(reverse('order_history'))
+        self.assertContains(page, 'Yam')
+        self.assertNotContains(page, 'Purple Yam')
+        self.assertEqual(len(history.context['orders']), 1)
+        self.assertTrue(on_replica.captured_queries)
+        self.assertFalse([q for q in on_replica if 'django_session' in q['sql']])
+
+        with CaptureQueriesContext(connections['replica1']) as on_replica:
+            self.client.post(reverse('add_to_cart', args=[yam.pk]))
+        self.assertFalse(on_replica.captured_queries)
+        self.assertTrue(CartItem.objects.using('default').exists())
+        self.assertFalse(CartItem.objects.using('replica1').exists())
+
+    def test_a_failing_replica_is_marked_down_and_the_page_read_from_the_primary(self):
+        user = Customer.objects.create_user(email='rf@example.com', password='pw', username='rf')
+        Order.objects.create(user=user)
+        call_command('sync_replicas', stdout=io.StringIO())
+        with connections['replica1'].cursor() as cursor:
+            cursor.execute(f'DROP TABLE {Order._meta.db_table}')  # e.g. a half-restored copy
+        Order.objects.create(user=user)
+        cache.set(CHANGED_AT_KEY, 0, None)
+        self.client.force_login(user)
+
+        history = self.client.get(reverse('order_history'))
+        self.assertEqual(len(history.context['orders']), 2)
+        self.assertFalse(replicas.pool.healthy('replica1'))
+
+    def test_probe_does_not_create_a_missing_sqlite_file(self):
+        replica = connections['replica1']
+        missing = os.path.join(self.tmp, 'missing.sqlite3')
+        replica.close()
+        with mock.patch.dict(replica.settings_dict, NAME=missing):
+            self.assertFalse(replicas.probe('replica1'))
+        self.assertFalse(os.path.exists(missing))
+        call_command('sync_replicas', stdout=io.StringIO())
+        self.assertTrue(replicas.probe('replica1'))
+
+
+class ReservationConcurrencyTests(TransactionTestCase):
+    """Many shoppers race for the last units; nobody may hold more than exists."""
+
+    def test_concurrent_reservations_never_oversell(self):
+        product = Product.objects.create(name='Durian', price=Decimal('9.00'), stock=10, category='Fruit')
+        results = []
+        barrier = threading.Barrier(16)
+
+        def shopper(n):
+            barrier.wait()
+            try:
+                for attempt in range(5):
+                    results.append(reserve(product.id, {'session_key': f'shopper-{n}'}))
+                    if attempt % 2:
+                        release(product.id, {'session_key': f'shopper-{n}'}, quantity=1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shopper, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        held = StockReservation.objects.aggregate(total=Sum('quantity'))['total']
+        self.assertEqual(len(results), 80)
+        self.assertEqual(product.reserved, held)
+        self.assertLessEqual(product.reserved, product.stock)
+        self.assertEqual(product.reserved, 10)
@@ -1,21 +1,33 @@
 from django.urls import path
-from . import views
+from . import api, cart_api, reports, views
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
     path('products/', views.product_list, name='product_list'),
+    path('api/search/', api.products, name='product_search_api'),
+    path('api/v1/products/', api.products, name='api_products'),
+    path('api/v1/products/<int:product_id>/', api.product_detail, name='api_product_detail'),
+    path('api/v1/categories/', api.categories, name='api_categories'),
+    path('api/v1/reports/sales/', reports.sales, name='api_sales_report'),
     path('login/', views.login_view, name='login'),
     path('register/', views.register_view, name='register'),
     path('site-logout/', views.site_logout, name='site_logout'),
 
     path('add-to-cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/', views.view_cart, name='view_cart'),
+    path('cart/badge/', views.cart_badge, name='cart_badge'),
+    path('api/cart/add/<int:product_id>/', cart_api.add, name='api_cart_add'),
+    path('api/cart/decrease/<int:product_id>/', cart_api.decrease, name='api_cart_decrease'),
+    path('api/cart/remove/<int:product_id>/', cart_api.remove, name='api_cart_remove'),
+    path('api/cart/set/<int:product_id>/', cart_api.set_quantity, name='api_cart_set'),
     path('profile/', views.profile, name='profile'),
     path('remove-from-cart/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('decrease-quantity/<int:product_id>/', views.decrease_quantity, name='decrease_quantity'),
     path('checkout/', views.checkout, name='checkout'),
     path('orders/', views.order_history, name='order_history'),
     path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('metrics', views.metrics, name='metrics'),
+    path('media/<path:path>', views.media_file, name='media'),
 
 
 ]
@@ -1,5 +1,11 @@
 # homepage/views.py
+import hmac
+import uuid
 
+from django.conf import settings
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Lower
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
@@ -7,9 +13,24 @@ from django.contrib.auth.decorators import login_required
 
 from .models import Customer, Product
 from .forms import CustomerRegisterForm, CustomerLoginForm
-from .models import Cart, CartItem
 from .models import Order, OrderItem
+from .cart import cart_lines, cart_summary, change_line, merge_guest_cart
+from .catalog import catalog_cache_timeout, catalog_version, featured_products
+from .checkout import CheckoutError, place_order
+from .idempotency import idempotent
+from .page_cache import cacheable_page
+from .replicas import replica_reads
+from . import metrics as request_metrics
+from .reservations import transfer_guest_holds
+from .pagination import InvalidCursor, KeysetPaginator, RankedPaginator, page_size_from
+from .search import get_search_backend
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_POST, require_safe
+from django.views.static import serve
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.shortcuts import get_object_or_404
 
 
@@ -17,27 +38,28 @@ from django.shortcuts import get_object_or_404
 # -----------------------
 # Homepage view 
 # -----------------------
+@cacheable_page
+@replica_reads
 def homepage(request):
     """
     Displays the homepage with:
     - Categories
     - Featured products (in stock, available, limit 8)
-    - Cart count from session
+
+    The category grid and featured cards are a cached fragment keyed by the
+    catalog version; `featured_products` is only evaluated on a cache miss.
+    The page itself is shared by all visitors (see page_cache.py).
     """
     categories = ['All', 'Meat', 'Fish', 'Veggies', 'Grocery', 'Fruit']
 
-    featured_products = Product.objects.filter(available=True, stock__gt=0)[:8]
-
-    cart = request.session.get('cart', {})
-    cart_count = sum(cart.values())
-
     return render(
         request,
         'homepage/home.html',
         {
             'categories': categories,
             'featured_products': featured_products,
-           # 'cart_count': cart_count,
+            'catalog_version': catalog_version(),
+            'catalog_cache_timeout': catalog_cache_timeout(),
         }
     )
 
@@ -45,133 +67,163 @@ def homepage(request):
 # -----------------------
 # Product list / search
 # -----------------------
-def product_list(request):
-    query = request.GET.get('q', '')
+PRODUCT_SORTS = {
+    'category': ('category', 'id'),
+    'price': ('price', 'id'),
+}
+
+def _browse(products, category, sort):
+    """
+    Filter `products` to a category (case-insensitively, through the
+    Lower('category') indexes) and return it with its keyset ordering.
+    Within one category, the category sort is simply id order.
+    """
+    if not category:
+        return products, PRODUCT_SORTS[sort]
+    products = products.alias(category_lower=Lower('category')).filter(category_lower=category.lower())
+    return products, PRODUCT_SORTS[sort] if sort != 'category' else ('id',)
+
+
+def _catalog_params(request):
+    query = request.GET.get('q', '').strip()
     category = request.GET.get('category', '')
+    if category.lower() == 'all':
+        category = ''
+    sort = request.GET.get('sort', 'category')
+    if sort not in PRODUCT_SORTS:
+        sort = 'category'
+    return query, category, sort
+
+
+def _product_page(request, query, category, sort, fields=None, expressions=None):
+    """
+    One page of the catalog. Searches page through the capped, ranked
+    search window; browsing uses keyset pagination on PRODUCT_SORTS.
+    Rows are model instances, or dicts of `fields` (plus the named
+    `expressions`) when given. An unknown cursor falls back to the first page.
+    """
+    page_size = page_size_from(request)
+    cursor = request.GET.get('cursor')
 
     products = Product.objects.all()
+    if fields:
+        products = products.values(*fields, **(expressions or {}))
+    if not query:
+        products, ordering = _browse(products, category, sort)
+
+    for attempt in (cursor, None):
+        try:
+            if query:
+                page = RankedPaginator(
+                    get_search_backend().search(query, category=category), page_size
+                ).get_page(attempt)
+                found = {
+                    (row['id'] if fields else row.pk): row
+                    for row in products.filter(pk__in=page.items)
+                }
+                page.items = [found[pk] for pk in page.items if pk in found]
+            else:
+                page = KeysetPaginator(products, ordering, page_size).get_page(attempt)
+            return page
+        except InvalidCursor:
+            continue
+
 
-    if category and category.lower() != 'all':
-        products = products.filter(category__iexact=category)
+def _page_query(request, cursor):
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return params.urlencode()
 
-    if query:
-        products = products.filter(name__icontains=query)
+
+@cacheable_page
+@replica_reads
+def product_list(request):
+    query, category, sort = _catalog_params(request)
+    page = _product_page(request, query, category, sort)
 
     return render(request, 'homepage/products.html', {
-        'products': products,
+        'products': page.items,
+        'page': page,
+        'next_query': _page_query(request, page.next_cursor) if page.has_next else '',
+        'prev_query': _page_query(request, page.prev_cursor) if page.has_previous else '',
         'query': query,
         'selected_category': category,
+        'sort': sort,
         'categories': ['All', 'Meat', 'Fish', 'Veggies', 'Grocery', 'Fruit'],
     })
 
 
 # -----------------------
-# Cart functions (DB for logged-in, session for guests)
+# Cart functions (DB for logged-in, request.guest_cart for guests)
 # -----------------------
 
+# The cached catalog pages carry no CSRF token, so their no-JS add-to-cart
+# form posts without one. Adding a line is the only such action, and the
+# session and cart cookies are SameSite=Lax: a cross-site post reaches an
+# empty cart, never the visitor's own.
+@csrf_exempt
+@require_POST
+@idempotent
 def add_to_cart(request, product_id):
-    try:
-        product = Product.objects.get(id=product_id)
-        if not product.available:
-            return redirect('product_list')
-
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-            item.quantity += 1
-            item.save()
-        else:
-            cart = request.session.get('cart', {})
-            cart[str(product_id)] = cart.get(str(product_id), 0) + 1
-            request.session['cart'] = cart
-
-    except Product.DoesNotExist:
-        pass
+    product = Product.objects.filter(pk=product_id).first()
+    if product and product.available and change_line(request, product.id, lambda current: current + 1) is None:
+        messages.error(request, f"Sorry, {product.name} is out of stock.")
+        return redirect('view_cart')  # the cached catalog pages show no messages
     return redirect('product_list')
 
 
+@require_POST
+@idempotent
 def remove_from_cart(request, product_id):
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            CartItem.objects.get(cart=cart, product_id=product_id).delete()
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
-            pass
-    else:
-        cart = request.session.get('cart', {})
-        if str(product_id) in cart:
-            del cart[str(product_id)]
-            request.session['cart'] = cart
+    change_line(request, product_id, lambda current: 0)
     return redirect('view_cart')
 
 
+@require_POST
+@idempotent
 def decrease_quantity(request, product_id):
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            item = CartItem.objects.get(cart=cart, product_id=product_id)
-            if item.quantity > 1:
-                item.quantity -= 1
-                item.save()
-            else:
-                item.delete()
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
-            pass
-    else:
-        cart = request.session.get('cart', {})
-        if str(product_id) in cart:
-            if cart[str(product_id)] > 1:
-                cart[str(product_id)] -= 1
-            else:
-                del cart[str(product_id)]
-            request.session['cart'] = cart
+    change_line(request, product_id, lambda current: current - 1)
     return redirect('view_cart')
 
 
+@ensure_csrf_cookie  # for the JSON cart endpoints, see cart_api.py
 def view_cart(request):
-    items = []
-    total = 0
-
-    if request.user.is_authenticated:
-        # Logged-in users → get items from DB cart
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        for item in cart.items.select_related('product'):
-            subtotal = item.product.price * item.quantity
-            items.append({
-                'product': item.product,
-                'quantity': item.quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
-    else:
-        # Guests → get items from session
-        cart = request.session.get('cart', {})
-        for product_id, quantity in cart.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                subtotal = product.price * quantity
-                items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'subtotal': subtotal
-                })
-                total += subtotal
-            except Product.DoesNotExist:
-                continue
-
-    return render(request, 'homepage/cart.html', {'items': items, 'total': total})
+    items, total = cart_lines(request)
+    return render(request, 'homepage/cart.html', {
+        'items': items, 'total': total, 'checkout_key': uuid.uuid4().hex,
+    })
 
 
 # -----------------------
 # Context processor for cart count
 # -----------------------
-def cart_count(request):
+def _cart_count(request):
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        return {'cart_count': sum(item.quantity for item in cart.items.all())}
-    else:
-        cart = request.session.get('cart', {})
-        return {'cart_count': sum(cart.values())}
+        return cart_summary(request.user)['count']
+    return request.guest_cart.count()
+
+
+def cart_count(request):
+    """Lazy, so pages without a badge never touch the session."""
+    if hasattr(request, 'cart_count'):  # resolved up front by the async views
+        return {'cart_count': request.cart_count}
+    return {'cart_count': SimpleLazyObject(lambda: _cart_count(request))}
+
+
+@never_cache
+@ensure_csrf_cookie
+def cart_badge(request):
+    """
+    The per-visitor header state (user links, cart count) for the shared
+    catalog pages, which fetch it after loading. Also hands out the CSRF
+    cookie that those pages' forms read their token from.
+    """
+    user = request.user
+    return JsonResponse({
+        'authenticated': user.is_authenticated,
+        'username': user.username if user.is_authenticated else '',
+        'cart_count': _cart_count(request),
+    })
 
 
 # -----------------------
@@ -203,15 +255,11 @@ def login_view(request):
             if customer is not None:
                 login(request, customer)
 
-                # Sync session cart with DB cart
-                session_cart = request.session.get('cart', {})
-                cart, created = Cart.objects.get_or_create(user=customer)
-                for product_id, qty in session_cart.items():
-                    product = Product.objects.get(id=product_id)
-                    item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-                    item.quantity += qty
-                    item.save()
-                request.session['cart'] = {}  # clear session cart
+                # Move the guest cart (and its stock holds) into the DB cart
+                guest_cart = request.guest_cart
+                merge_guest_cart(customer, guest_cart.items())
+                transfer_guest_holds(guest_cart.key, customer)
+                guest_cart.clear()
 
                 return redirect('homepage')
             else:
@@ -237,48 +285,16 @@ def site_logout(request):
 def profile(request):
     return render(request, 'homepage/profile.html')
 
+@require_POST
 @login_required
+@idempotent
 def checkout(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    if not cart.items.exists():
-        messages.error(request, "Your cart is empty.")
+    try:
+        order = place_order(request.user)
+    except CheckoutError as e:
+        messages.error(request, str(e))
         return redirect('view_cart')
 
-    # ✅ Create the order first
-    order = Order.objects.create(
-        user=request.user,
-        total_price=0
-    )
-
-    total = 0
-    for item in cart.items.select_related('product'):
-        product = item.product
-        if product.stock >= item.quantity:
-            product.stock -= item.quantity
-            if product.stock == 0:
-                product.available = False
-            product.save()
-
-            # ✅ Add each product as OrderItem
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                price=product.price,
-                quantity=item.quantity
-            )
-
-            total += product.price * item.quantity
-        else:
-            messages.error(request, f"Not enough stock for {product.name}")
-            return redirect('view_cart')
-
-    # ✅ Update total after loop
-    order.total_price = total
-    order.save()
-
-    # ✅ Empty the cart
-    cart.items.all().delete()
-
     messages.success(request, f"Order #{order.id} placed successfully!")
     return redirect('homepage')
 
@@ -286,14 +302,67 @@ def checkout(request):
 # Purchase history 
 # -----------------------
 @login_required
+@replica_reads
 def order_history(request):
-    """Show all past orders for the logged-in user"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'homepage/order_history.html', {'orders': orders})
+    """Show the logged-in user's past orders, newest first, one page at a time"""
+    # A correlated count instead of JOIN + GROUP BY, so the page is read
+    # straight off order_user_created_idx without sorting.
+    item_counts = (
+        OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(n=Count('pk')).values('n')
+    )
+    orders = Order.objects.filter(user=request.user).annotate(item_count=Coalesce(Subquery(item_counts), 0))
+    try:
+        page = KeysetPaginator(
+            orders, ('-created_at', '-id'), page_size_from(request, 'ORDERS_PAGE_SIZE')
+        ).get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return redirect('order_history')
+    return render(request, 'homepage/order_history.html', {
+        'orders': page.items,
+        'page': page,
+        'next_query': _page_query(request, page.next_cursor) if page.has_next else '',
+        'prev_query': _page_query(request, page.prev_cursor) if page.has_previous else '',
+    })
 
 
 @login_required
+@replica_reads
 def order_detail(request, order_id):
     """Show details of one specific order"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    return render(request, 'homepage/order_detail.html', {'order': order})
\ No newline at end of file
+    items = order.items.all()  # product names come from the snapshot, no join
+    return render(request, 'homepage/order_detail.html', {'order': order, 'items': items})
+
+
+# -----------------------
+# Metrics (opt-in, see homepage/metrics.py)
+# -----------------------
+def metrics(request):
+    if not request_metrics.metrics_enabled():
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    # Constant time, so response timing leaks nothing about the token. Bytes,
+    # because compare_digest rejects non-ASCII str.
+    given = request.headers.get('Authorization', '').encode()
+    if token and not hmac.compare_digest(given, f'Bearer {token}'.encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        request_metrics.render_prometheus(request_metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+# -----------------------
+# Product thumbnails (see homepage/images.py)
+# -----------------------
+@require_safe
+def media_file(request, path):
+    """
+    Serve the media store. Thumbnail names are content hashes, so they can
+    be cached forever. A front-end server should take this over in
+    production; the headers are the same.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code == 200:
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    return response
@@ -2,6 +2,8 @@
 ASGI config for myproject1 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+It defaults to the async profile (myproject1.settings_asgi), which serves
+the catalog and cart pages from async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +13,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject1.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject1.settings_asgi')
 
 application = get_asgi_application()
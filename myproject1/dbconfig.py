@@ -0,0 +1,111 @@
+"""
+Database profile read from the environment.
+
+    DATABASE_ENGINE        'sqlite' (default) or 'postgres'
+    DATABASE_NAME          SQLite file path, or the Postgres database name
+    DATABASE_HOST/PORT/USER/PASSWORD   Postgres connection details
+    DATABASE_CONN_MAX_AGE  seconds to keep a connection open (default 60; 0 closes after each request)
+    DATABASE_HEALTH_CHECKS '0' to skip the liveness check on reused connections
+
+SQLite is tuned for a multi-process web server unless SQLITE_TUNING=0:
+WAL journal (readers never block the writer), synchronous=NORMAL (safe
+under WAL, no fsync per commit), a memory map and a busy timeout. Write
+transactions start with BEGIN IMMEDIATE. Under the default BEGIN DEFERRED,
+two transactions that read and then both try to write fail straight away
+with "database is locked", because the busy timeout cannot help there.
+SQLITE_MMAP_SIZE (bytes) and SQLITE_BUSY_TIMEOUT (seconds) override the
+defaults.
+
+Postgres uses psycopg's connection pool, sized by DATABASE_POOL_MIN_SIZE and
+DATABASE_POOL_MAX_SIZE. Set DATABASE_POOL=0 to fall back to persistent
+connections instead.
+
+DATABASE_REPLICAS adds read replicas (aliases replica1, replica2, ...), as
+a comma-separated list of SQLite file paths or of Postgres host[:port]s.
+Replicas otherwise share the primary's settings. The catalog and history
+pages read from them (see homepage/replicas.py).
+"""
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_flag(name, default=True):
+    return os.environ.get(name, '1' if default else '0') not in ('0', 'false', 'False', '')
+
+
+def sqlite_options():
+    if not _env_flag('SQLITE_TUNING'):
+        return {}
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+    ]
+    return {
+        'init_command': '; '.join(pragmas),
+        'timeout': _env_int('SQLITE_BUSY_TIMEOUT', 20),
+        'transaction_mode': 'IMMEDIATE',
+    }
+
+
+def database_from_env(base_dir):
+    engine = os.environ.get('DATABASE_ENGINE', 'sqlite')
+    conn_max_age = _env_int('DATABASE_CONN_MAX_AGE', 60)
+
+    if engine == 'sqlite':
+        tuned = _env_flag('SQLITE_TUNING')
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', base_dir / 'db.sqlite3'),
+            'OPTIONS': sqlite_options(),
+            'CONN_MAX_AGE': conn_max_age if tuned else 0,
+            'CONN_HEALTH_CHECKS': tuned and _env_flag('DATABASE_HEALTH_CHECKS'),
+            # A file rather than shared-cache memory, so threaded tests get real
+            # SQLite locking (busy waits) instead of "table is locked" errors.
+            'TEST': {'NAME': base_dir / 'test_db.sqlite3'},
+        }
+
+    if engine == 'postgres':
+        options = {}
+        if _env_flag('DATABASE_POOL'):
+            # Pooled connections are returned to the pool after each request,
+            # which rules out CONN_MAX_AGE.
+            options['pool'] = {
+                'min_size': _env_int('DATABASE_POOL_MIN_SIZE', 2),
+                'max_size': _env_int('DATABASE_POOL_MAX_SIZE', 10),
+                'timeout': _env_int('DATABASE_POOL_TIMEOUT', 10),
+            }
+            conn_max_age = 0
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'ecommerce'),
+            'USER': os.environ.get('DATABASE_USER', ''),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', ''),
+            'PORT': os.environ.get('DATABASE_PORT', ''),
+            'OPTIONS': options,
+            'CONN_MAX_AGE': conn_max_age,
+            'CONN_HEALTH_CHECKS': _env_flag('DATABASE_HEALTH_CHECKS'),
+        }
+
+    raise ValueError(f"Unknown DATABASE_ENGINE {engine!r}; use 'sqlite' or 'postgres'.")
+
+
+def replicas_from_env(primary):
+    """Database settings for each DATABASE_REPLICAS entry, keyed replica1, replica2, ..."""
+    entries = [entry.strip() for entry in os.environ.get('DATABASE_REPLICAS', '').split(',') if entry.strip()]
+    replicas = {}
+    for number, entry in enumerate(entries, start=1):
+        replica = {**primary, 'OPTIONS': dict(primary['OPTIONS']), 'TEST': {'MIRROR': 'default'}}
+        if primary['ENGINE'] == 'django.db.backends.sqlite3':
+            replica['NAME'] = entry
+        else:
+            host, _, port = entry.partition(':')
+            replica.update(HOST=host, PORT=port or primary['PORT'])
+            if 'pool' in replica['OPTIONS']:
+                replica['OPTIONS']['pool'] = dict(replica['OPTIONS']['pool'])
+        replicas[f'replica{number}'] = replica
+    return replicas
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .dbconfig import database_from_env, replicas_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -23,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-&pgf4!!(z8*pa%$)c)o*uu6xkz!(f0c4^=9dh)s3f@q8$-545o'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') != '0'
 
 ALLOWED_HOSTS = ['*', '.ngrok-free.app']
 
@@ -44,12 +47,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'homepage.metrics.MetricsMiddleware',  # no-op unless METRICS_ENABLED
+    'homepage.assets.StaticFilesMiddleware',  # no-op unless SERVE_STATIC
+    'homepage.page_cache.PageCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'homepage.cart_store.GuestCartMiddleware',
+    'homepage.replicas.ReplicaStickyMiddleware',  # no-op unless DATABASE_REPLICAS
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -57,7 +65,8 @@ ROOT_URLCONF = 'myproject1.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, plus render timing for homepage.metrics
+        'BACKEND': 'homepage.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,13 +87,111 @@ WSGI_APPLICATION = 'myproject1.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# The profile (SQLite tuning, Postgres pooling, persistent connections)
+# comes from the environment; see myproject1/dbconfig.py.
 DATABASES = {
+    'default': database_from_env(BASE_DIR),
+}
+DATABASES.update(replicas_from_env(DATABASES['default']))
+
+# Read replicas (homepage/replicas.py): catalog and order-history pages read
+# from a healthy replica; writes, checkout and anything after a write use
+# the primary.
+DATABASE_ROUTERS = ['homepage.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = 10  # a client reads from the primary this long after a write
+REPLICA_MAX_LAG = 5  # seconds; replicas further behind are skipped
+REPLICA_CHECK_INTERVAL = 10  # seconds between health probes per replica and process
+
+# Product search
+# SQLiteFTSBackend needs the FTS5 table created by migration 0008 (SQLite only);
+# use 'homepage.search.DatabaseSearchBackend' on other databases.
+
+PRODUCT_SEARCH_BACKEND = 'homepage.search.SQLiteFTSBackend'
+if DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+    PRODUCT_SEARCH_BACKEND = 'homepage.search.DatabaseSearchBackend'
+PRODUCT_SEARCH_LIMIT = 100  # size of the ranked result window paged through by product_list
+
+# Stock holds placed by add_to_cart (see homepage/reservations.py)
+RESERVATION_TTL = 15 * 60  # seconds
+
+# Stock ledger (homepage/ledger.py): restocks are folded into Product.stock by
+# compaction, which leaves movements younger than this for the next run.
+STOCK_COMPACTION_SETTLE = 5  # seconds
+
+# Guest carts (homepage/cart_store.py): kept out of the session.
+# 'homepage.cart_store.CacheCartStore' keeps only the key in the cookie.
+CART_STORE = 'homepage.cart_store.SignedCookieCartStore'
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_AGE = 14 * 24 * 3600  # seconds
+
+# Checkout and cart changes are POST only; a repeated Idempotency-Key replays
+# the stored response for this long (homepage/idempotency.py).
+IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds
+# A key whose first request has run this long without finishing is taken
+# over by the next retry (the worker is presumed dead).
+IDEMPOTENCY_LEASE = 30  # seconds
+
+# Background jobs (homepage/jobs.py), run by `manage.py run_workers`.
+JOB_LEASE = 300  # seconds a worker may hold a job before it is requeued
+JOB_RETRY_BASE = 10  # seconds before the first retry; doubles per attempt
+JOB_RETRY_MAX = 3600  # seconds; cap on the retry delay
+JOB_KEEP_FINISHED = 7 * 24 * 3600  # seconds done/failed jobs are kept
+LOW_STOCK_THRESHOLD = 5  # check_low_stock alerts at or below this
+
+# Outgoing mail (order receipts, low-stock alerts). Printed to the console
+# unless EMAIL_BACKEND is set, e.g. to django.core.mail.backends.smtp.EmailBackend.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'shop@localhost')
+ADMINS = [('Admin', email) for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email]
+
+# Catalog pagination (keyset based; ?per_page= is capped at PAGE_SIZE_MAX)
+PRODUCTS_PAGE_SIZE = 24
+ORDERS_PAGE_SIZE = 20
+PAGE_SIZE_MAX = 96
+
+
+# Request metrics (homepage/metrics.py), served in Prometheus format at /metrics.
+# With several worker processes, point METRICS_DIR at a directory they share
+# so the endpoint reports totals across all of them.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5  # seconds between snapshot writes per process
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # if set, required as a Bearer token
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# DJANGO_CACHE picks the backend: 'locmem' (default), 'file' or 'redis'.
+# CACHE_LOCATION is the directory for 'file' and the server URL for 'redis'.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+_cache = os.environ.get('DJANGO_CACHE', 'locmem')
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[_cache],
+        'LOCATION': os.environ.get('CACHE_LOCATION', {
+            'locmem': '',
+            'file': str(BASE_DIR / 'cache'),
+            'redis': 'redis://127.0.0.1:6379',
+        }[_cache]),
     }
 }
 
+CATALOG_CACHE_TIMEOUT = 900  # seconds; entries are also invalidated by catalog version bumps
+
+CART_SUMMARY_TIMEOUT = 300
+
+# Shared catalog pages (homepage/page_cache.py): server-side copy lifetime,
+# and how long browsers and proxies may reuse one without revalidating.
+PAGE_CACHE_TIMEOUT = 600
+PAGE_CACHE_MAX_AGE = 60  # seconds; entries are also invalidated by catalog version bumps
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,6 +228,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Production (DJANGO_DEBUG=0): collectstatic minifies, hashes and precompresses
+# the assets, and the app serves them itself (homepage/assets.py).
+if not DEBUG:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'homepage.assets.CompressedManifestStaticFilesStorage'},
+    }
+SERVE_STATIC = os.environ.get('SERVE_STATIC', '0' if DEBUG else '1') != '0'
+
+# Product images and their thumbnails (homepage/images.py)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -0,0 +1,12 @@
+"""
+ASGI deployment profile.
+
+Same as settings.py, but routes the catalog and cart pages to the async
+views in homepage.async_views. Serve with e.g.
+
+    uvicorn myproject1.asgi:application --workers 4
+"""
+
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'myproject1.urls_async'
@@ -0,0 +1,6 @@
+from django.urls import path, include
+
+urlpatterns = [
+    # Homepage app URLs, catalog and cart served by async views
+    path('', include('homepage.async_urls')),
+]